@@ -0,0 +1,201 @@
+# Crisis Survival - Admin Diagnostics
+# 仅管理员可用的运行时诊断接口：采样 CPU profile、tracemalloc 快照 / 对比、asyncio 任务列表
+#
+# 设置 ADMIN_TOKEN 后启用，请求头带 Authorization: Bearer <ADMIN_TOKEN>。
+# 空闲时没有任何开销：profiler 只在请求期间采样，tracemalloc 需要显式 start。
+#
+#   curl -H "Authorization: Bearer $ADMIN_TOKEN" "localhost:8000/admin/profile?seconds=10" > cpu.folded
+#   flamegraph.pl cpu.folded > cpu.svg      # 或拖进 https://www.speedscope.app
+
+import asyncio
+import hmac
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from config import ADMIN_TOKEN, PROFILE_MAX_SECONDS
+from loop_watchdog import watchdog
+from task_supervisor import all_supervisors
+
+
+def require_admin(authorization: Optional[str] = Header(default=None)):
+    """未配置 ADMIN_TOKEN 时接口整体不存在（404），token 不对时 403"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+# ============================================================
+# 采样 CPU profiler
+# ============================================================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds: float, hz: int, thread_ids: Optional[set[int]] = None) -> Counter:
+    """
+    每秒 hz 次读取 sys._current_frames()，按 collapsed-stack 格式计数（根在左，分号分隔）。
+    thread_ids 为 None 时采样除自身外的所有线程。
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    period = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for tid, frame in sys._current_frames().items():
+            if tid == me or (thread_ids is not None and tid not in thread_ids):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(tid, f"thread-{tid}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(period)
+    return stacks
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 5.0, hz: int = 100, all_threads: bool = False):
+    """采样 seconds 秒，返回 collapsed stacks（flamegraph.pl / speedscope 可直接读取）"""
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    hz = max(1, min(hz, 1000))
+    # 在线程里采样，事件循环照常运行（也就是被采样的对象）
+    threads = None if all_threads else {threading.get_ident()}
+    stacks = await asyncio.to_thread(sample_stacks, seconds, hz, threads)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+# ============================================================
+# tracemalloc 快照
+# ============================================================
+
+# 快照 id -> (拍摄时间, 快照)，只保留最近几个
+snapshots: "OrderedDict[int, tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+MAX_SNAPSHOTS = 5
+_next_snapshot_id = 1
+
+
+def _format_stats(stats, limit: int) -> list[dict]:
+    out = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        entry = {"where": f"{frame.filename}:{frame.lineno}", "size_kib": round(stat.size / 1024, 1),
+                 "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            entry["size_diff_kib"] = round(stat.size_diff / 1024, 1)
+            entry["count_diff"] = stat.count_diff
+        out.append(entry)
+    return out
+
+
+@router.post("/tracemalloc/start")
+async def tracemalloc_start(frames: int = 1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 50)))
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+@router.post("/tracemalloc/stop")
+async def tracemalloc_stop():
+    tracemalloc.stop()
+    snapshots.clear()
+    return {"tracing": False}
+
+
+@router.post("/tracemalloc/snapshot")
+async def tracemalloc_snapshot(limit: int = 20, group_by: str = "lineno"):
+    """拍一个快照，返回按 group_by（lineno / filename / traceback）分组的 top N"""
+    global _next_snapshot_id
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running; POST /admin/tracemalloc/start first")
+    snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+    snapshot_id = _next_snapshot_id
+    _next_snapshot_id += 1
+    snapshots[snapshot_id] = (time.time(), snapshot)
+    while len(snapshots) > MAX_SNAPSHOTS:
+        snapshots.popitem(last=False)
+    current, peak = tracemalloc.get_traced_memory()
+    stats = await asyncio.to_thread(snapshot.statistics, group_by)
+    return {
+        "id": snapshot_id,
+        "traced_kib": round(current / 1024, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "top": _format_stats(stats, limit),
+    }
+
+
+@router.get("/tracemalloc/diff")
+async def tracemalloc_diff(base: Optional[int] = None, target: Optional[int] = None,
+                           limit: int = 20, group_by: str = "lineno"):
+    """对比两个快照（默认最近两个），按增长量排序"""
+    ids = list(snapshots)
+    if len(ids) < 2 and (base is None or target is None):
+        raise HTTPException(status_code=409, detail="Need at least two snapshots")
+    base = base if base is not None else ids[-2]
+    target = target if target is not None else ids[-1]
+    if base not in snapshots or target not in snapshots:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot; available: {ids}")
+    stats = await asyncio.to_thread(snapshots[target][1].compare_to, snapshots[base][1], group_by)
+    return {
+        "base": base,
+        "target": target,
+        "seconds_between": round(snapshots[target][0] - snapshots[base][0], 1),
+        "top": _format_stats(stats, limit),
+    }
+
+
+# ============================================================
+# asyncio 任务 / 事件循环
+# ============================================================
+
+def task_owners() -> dict[asyncio.Task, str]:
+    """受管任务 -> 所属任务组（room:XXXX / server）"""
+    return {task: sup.owner for sup in list(all_supervisors) for task in sup.tasks()}
+
+
+@router.get("/tasks")
+async def dump_tasks(stack: bool = False):
+    """所有未完成的 asyncio 任务，按所属房间分组"""
+    owners = task_owners()
+    current = asyncio.current_task()
+    groups: dict[str, list[dict]] = {}
+    for task in asyncio.all_tasks():
+        if task is current:
+            continue
+        coro = task.get_coro()
+        frames = task.get_stack()
+        entry = {
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "at": f"{frames[-1].f_code.co_filename.rsplit('/', 1)[-1]}:{frames[-1].f_lineno}" if frames else None,
+        }
+        if stack:
+            entry["stack"] = [_frame_label(f) for f in frames]
+        groups.setdefault(owners.get(task, "unsupervised"), []).append(entry)
+    return {
+        "total": sum(len(v) for v in groups.values()),
+        "owners": {owner: len(tasks) for owner, tasks in sorted(groups.items())},
+        "tasks": groups,
+    }
+
+
+@router.get("/stalls")
+async def loop_stalls():
+    """最近几次事件循环卡顿及其调用栈（见 loop_watchdog.py）"""
+    return {**watchdog.get_stats(), "recent": list(watchdog.stalls)}
@@ -1,22 +1,130 @@
 # Story Relay Simulation - AI Module (DeepSeek)
 
 from openai import AsyncOpenAI
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, LLM_MODEL, STORY_SEGMENT_WORD_LIMIT
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, LLM_MODEL, LLM_TIMEOUT, STORY_SEGMENT_WORD_LIMIT,
+    STORY_CONTEXT_TOKENS, STORY_KEEP_RECENT, STORY_SUMMARY_TOKENS,
+    LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_REPLAY_LATENCY, LLM_REPLAY_STRICT, LLM_MAX_CONCURRENCY
+)
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+import asyncio
+import functools
 import json
 import re
+import time
+
+import metrics
+import tracing
 
 # Configure DeepSeek client (OpenAI-compatible API) - ASYNC version
 client = AsyncOpenAI(
     api_key=DEEPSEEK_API_KEY,
-    base_url=DEEPSEEK_BASE_URL
+    base_url=DEEPSEEK_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    max_retries=0  # SDK 默认会重试超时 2 次，一次卡住的调用要等 3 倍 LLM_TIMEOUT；失败直接走 fallback
 )
 
 
 _warned_missing_key = False
 _warned_llm_failure = False
 
+# 每次调用的 max_tokens，也是还没有真实用量时的 token 估算值
+LLM_MAX_TOKENS = 500
+
+# 真实 LLM 调用的累计用量（只统计成功返回的调用）
+llm_usage = {"calls": 0, "tokens": 0}
+
+
+LLM_LATENCY = metrics.histogram(
+    "crisis_llm_request_duration_seconds", "call_llm latency by AI function", ["function"])
+LLM_TOKENS = metrics.counter(
+    "crisis_llm_tokens_total", "Tokens reported by the LLM API by AI function", ["function"])
+LLM_RESULTS = metrics.counter(
+    "crisis_llm_results_total", "AI function results by outcome (ok / fallback)", ["function", "outcome"])
+
+# 同时进行的 LLM 请求上限，None 表示不限制
+_llm_slots: Optional[asyncio.Semaphore] = asyncio.Semaphore(LLM_MAX_CONCURRENCY) if LLM_MAX_CONCURRENCY > 0 else None
+
+# 当前正在执行的 AI 函数：{"function": 名字, "fallback": 本次是否用了兜底内容}
+_current_call: ContextVar[Optional[dict]] = ContextVar("llm_current_call", default=None)
+
+
+def llm_function(fn):
+    """标记一个调用 LLM 的 AI 函数：按函数名统计耗时、token 和 fallback 率"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        state = {"function": fn.__name__, "fallback": False}
+        token = _current_call.set(state)
+        try:
+            result = await fn(*args, **kwargs)
+        finally:
+            _current_call.reset(token)
+        LLM_RESULTS.inc(function=fn.__name__, outcome="fallback" if state["fallback"] else "ok")
+        return result
+    return wrapper
+
+
+def _current_function() -> str:
+    state = _current_call.get()
+    return state["function"] if state else "unknown"
+
+
+def _mark_fallback():
+    state = _current_call.get()
+    if state is not None:
+        state["fallback"] = True
+
+
+# 替换真实 LLM 调用（headless 模拟、离线测试用），None 表示调用 DeepSeek
+_llm_override: Optional[Callable[[str], Awaitable[str]]] = None
+
+
+def set_llm_override(fn: Optional[Callable[[str], Awaitable[str]]]):
+    """让 call_llm 改为调用 fn(prompt)；传 None 恢复真实调用"""
+    global _llm_override
+    _llm_override = fn
+
+
+def install_cassette(path: str, mode: str, latency: str = "zero", strict: bool = False):
+    """录制（record）或回放（replay）call_llm，返回 cassette 对象"""
+    from llm_cassette import open_cassette
+    cassette = open_cassette(path, mode, call_deepseek, latency=latency, strict=strict)
+    set_llm_override(cassette)
+    return cassette
+
+
+def average_tokens_per_call() -> float:
+    """已观测到的平均每次调用 token 数，没有数据时按 max_tokens 估算"""
+    if llm_usage["calls"] == 0:
+        return float(LLM_MAX_TOKENS)
+    return llm_usage["tokens"] / llm_usage["calls"]
+
 
 async def call_llm(prompt: str) -> str:
+    """Return the LLM response text for prompt (override / cassette first, then DeepSeek)."""
+    function = _current_function()
+    start = time.perf_counter()
+    with tracing.span(f"llm:{function}", "llm") as span:
+        with tracing.span("llm.queue", "llm"):
+            if _llm_slots is not None:
+                await _llm_slots.acquire()
+        try:
+            span["queue_wait_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            with tracing.span("llm.request", "llm"):
+                if _llm_override is not None:
+                    text = await _llm_override(prompt)
+                else:
+                    text = await call_deepseek(prompt)
+            span["response_chars"] = len(text)
+            return text
+        finally:
+            if _llm_slots is not None:
+                _llm_slots.release()
+            LLM_LATENCY.observe(time.perf_counter() - start, function=function)
+
+
+async def call_deepseek(prompt: str) -> str:
     """Call DeepSeek API asynchronously and return the response text."""
     global _warned_missing_key, _warned_llm_failure
 
@@ -27,15 +135,20 @@ async def call_llm(prompt: str) -> str:
         return ""
 
     try:
-        response = await client.chat.completions.create(
+        # httpx 的 timeout 是按连接 / 每次读分别计时的，慢慢吐字节的响应仍可能超时很久：整体再限一次
+        response = await asyncio.wait_for(client.chat.completions.create(
             model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "你是一个嘴巴很毒、喜欢嘲讽人类、脑洞大开的故事讲述者。即使是好消息，你也能说得阴阳怪气。"},
                 {"role": "user", "content": prompt}
             ],
             temperature=1.3,
-            max_tokens=500
-        )
+            max_tokens=LLM_MAX_TOKENS
+        ), timeout=LLM_TIMEOUT)
+        llm_usage["calls"] += 1
+        if response.usage is not None:
+            llm_usage["tokens"] += response.usage.total_tokens
+            LLM_TOKENS.inc(response.usage.total_tokens, function=_current_function())
         return response.choices[0].message.content or ""
     except Exception as e:
         if not _warned_llm_failure:
@@ -50,12 +163,15 @@ def parse_json_response(text: str, fallback: dict) -> dict:
         json_match = re.search(r'\{[\s\S]*\}', text)
         if json_match:
             return json.loads(json_match.group())
+        _mark_fallback()
         return fallback
     except Exception as e:
         print(f"[Warning] Failed to parse JSON: {e}")
+        _mark_fallback()
         return fallback
 
 
+@llm_function
 async def generate_opening(player_keywords: list[str]) -> dict:
     """
     Generate an opening story segment based on keywords contributed by all players.
@@ -79,6 +195,7 @@ async def generate_opening(player_keywords: list[str]) -> dict:
     return parse_json_response(text, {"story": text, "image_prompt": "abstract surreal scene, digital art"})
 
 
+@llm_function
 async def generate_keywords_for_player(story_so_far: str, num_keywords: int = 5) -> list[str]:
     """
     Generate a set of random, disparate keywords for a player to choose from.
@@ -103,6 +220,7 @@ async def generate_keywords_for_player(story_so_far: str, num_keywords: int = 5)
     return result.get("keywords", [])[:num_keywords]
 
 
+@llm_function
 async def generate_story_continuation(story_so_far: str, selected_keywords: list[str]) -> dict:
     """
     Generate the next story segment based on selected keywords.
@@ -135,6 +253,7 @@ async def generate_story_continuation(story_so_far: str, selected_keywords: list
     return parse_json_response(text, {"story": text, "image_prompt": "surreal scene, digital art"})
 
 
+@llm_function
 async def generate_ending(story_so_far: str) -> dict:
     """
     Generate a satisfying (or hilariously unsatisfying) ending for the story.
@@ -161,10 +280,161 @@ async def generate_ending(story_so_far: str) -> dict:
     return parse_json_response(text, {"story": text, "image_prompt": "epic finale, digital art"})
 
 
+# ============================================================
+# Story Relay - 有界上下文（滚动摘要）
+# ============================================================
+
+# 中日韩文字与全角标点
+_CJK = re.compile(r"[\u2e80-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文（含全角标点）每字算 1 个，其余每 4 个字符算 1 个（宁多勿少）"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def clip_to_tokens(text: str, budget: int) -> str:
+    """超出预算时丢掉开头、保留结尾（离续写最近的内容最重要）"""
+    if estimate_tokens(text) <= budget:
+        return text
+    # 二分找最长的、估算不超过 budget - 1 的后缀（留 1 个给省略号）
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if estimate_tokens(text[mid:]) <= budget - 1:
+            hi = mid
+        else:
+            lo = mid + 1
+    return "…" + text[lo:]
+
+
+@llm_function
+async def summarize_story(summary: str, segments: list[str], max_tokens: int = STORY_SUMMARY_TOKENS) -> str:
+    """
+    增量刷新前情提要：旧摘要 + 新折叠进来的段落 -> 新摘要（输入大小与故事总长度无关）。
+    """
+    new_text = "\n\n".join(segments)
+    # 摘要是中文：estimate_tokens 里每个汉字算 1 个 token，字数上限就等于 token 预算
+    max_chars = max_tokens
+    prompt = f"""已有的前情提要：
+---
+{summary or "（无）"}
+---
+
+接下来发生的故事：
+---
+{new_text}
+---
+
+请把以上内容合并成一份新的前情提要（不超过{max_chars}字），保留关键角色、物品、伏笔和笑点，供后续续写参考。
+
+请严格按照以下JSON格式返回：
+{{
+  "summary": "新的前情提要"
+}}"""
+    text = await call_llm(prompt)
+    # 兜底：旧摘要后面接上每段的第一句
+    first_sentences = "".join(re.split(r"(?<=[。！？!?])", seg, maxsplit=1)[0] for seg in segments)
+    fallback = {"summary": summary + first_sentences}
+    result = parse_json_response(text, fallback)
+    new_summary = result.get("summary")
+    if not isinstance(new_summary, str) or not new_summary.strip():
+        _mark_fallback()
+        new_summary = fallback["summary"]
+    return new_summary.strip()
+
+
+class StorySession:
+    """
+    一局故事接龙的上下文。完整故事保留在 segments 里（用于展示），拼进 prompt 的只有
+    滚动摘要（更早的段落）+ 最近 keep_recent 段原文，总量不超过 budget 个（估算）token，
+    所以每一轮的 prompt 大小、延迟和花费都不随故事变长而增长。
+
+    加入新段落后，超出 keep_recent 的旧段落在后台折叠进摘要（一次 LLM 调用，输入有界），
+    通常在玩家挑关键词的时候就已完成。
+
+        session = StorySession()
+        opening = await session.opening(["香蕉", "外星人"])
+        options = await session.keywords_for_player()
+        segment = await session.continue_story(["马桶"])
+        ending = await session.ending()        # 结局一次性看完整故事，不走滚动上下文
+    """
+
+    def __init__(self, budget: int = STORY_CONTEXT_TOKENS, keep_recent: int = STORY_KEEP_RECENT,
+                 summary_tokens: int = STORY_SUMMARY_TOKENS):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.segments: list[str] = []
+        self.summary = ""
+        self.summarized = 0  # segments[:summarized] 已经折叠进摘要
+        self._refresh: Optional[asyncio.Task] = None
+
+    @property
+    def full_story(self) -> str:
+        return "\n\n".join(self.segments)
+
+    def add(self, segment: str):
+        """记录一段新内容，必要时在后台刷新摘要"""
+        self.segments.append(segment)
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._refresh is not None:
+            return  # 正在刷新：完成后会再检查一次
+        if len(self.segments) - self.summarized > self.keep_recent:
+            self._refresh = asyncio.ensure_future(self._fold())
+
+    async def _fold(self):
+        end = len(self.segments) - self.keep_recent
+        try:
+            summary = await summarize_story(self.summary, self.segments[self.summarized:end], self.summary_tokens)
+        except Exception as e:
+            # 摘要没刷新成：这次先用原文（context 仍会按预算截断），下次加入段落时再试
+            print(f"[Warning] Failed to summarize story ({type(e).__name__}): {e}")
+            self._refresh = None
+            return
+        self.summary = clip_to_tokens(summary, self.summary_tokens)
+        self.summarized = end
+        self._refresh = None
+        self._schedule_refresh()  # 刷新期间又加入了新段落
+
+    async def context(self) -> str:
+        """拼进 prompt 的前文：前情提要 + 最近的原文，保证不超过预算"""
+        while self._refresh is not None:
+            # shield：调用方被取消时摘要照样刷完
+            await asyncio.shield(self._refresh)
+        recent = "\n\n".join(self.segments[self.summarized:])
+        if not self.summary:
+            return clip_to_tokens(recent, self.budget)
+        header = f"【前情提要】{self.summary}\n\n【最近的故事】\n"
+        return header + clip_to_tokens(recent, self.budget - estimate_tokens(header))
+
+    async def opening(self, player_keywords: list[str]) -> dict:
+        result = await generate_opening(player_keywords)
+        self.add(result.get("story", ""))
+        return result
+
+    async def keywords_for_player(self, num_keywords: int = 5) -> list[str]:
+        return await generate_keywords_for_player(await self.context(), num_keywords)
+
+    async def continue_story(self, selected_keywords: list[str]) -> dict:
+        result = await generate_story_continuation(await self.context(), selected_keywords)
+        self.add(result.get("story", ""))
+        return result
+
+    async def ending(self) -> dict:
+        result = await generate_ending(self.full_story)
+        self.add(result.get("story", ""))
+        return result
+
+
 # ============================================================
 # Crisis Mode - 危机求生模式 AI 函数
 # ============================================================
 
+@llm_function
 async def generate_crisis_options(num_options: int = 3) -> list[str]:
     """生成随机危机词供玩家选择。"""
     prompt = f"""请生成 {num_options} 个**荒诞离奇、紧急危险**的危机场景关键词。
@@ -180,6 +450,7 @@ async def generate_crisis_options(num_options: int = 3) -> list[str]:
     return result.get("crises", [])[:num_options]
 
 
+@llm_function
 async def generate_keyword_options(num_options: int = 3) -> list[str]:
     """生成一组供单人选择的随机关键词。"""
     prompt = f"""请生成 {num_options} 个**绝对离谱、完全不相关、让人一脸问号**的名词或短语。
@@ -206,6 +477,7 @@ async def generate_keyword_options(num_options: int = 3) -> list[str]:
     return result.get("keywords", [])[:num_options]
 
 
+@llm_function
 async def generate_collaborative_crisis(keywords: list[str]) -> dict:
     """根据所有玩家提供的关键词生成融合危机。"""
     keywords_str = ", ".join(keywords)
@@ -231,6 +503,7 @@ async def generate_collaborative_crisis(keywords: list[str]) -> dict:
     })
 
 
+@llm_function
 async def generate_scavenge_items(crisis: str, num_items: int = 5) -> list[dict]:
     """生成抢夺阶段的物品列表：1神器 + 2普通 + 2垃圾。"""
     prompt = f"""当前危机：{crisis}
@@ -267,9 +540,13 @@ async def generate_scavenge_items(crisis: str, num_items: int = 5) -> list[dict]
     result = parse_json_response(text, fallback)
     items = result.get("items", [])
     # 确保返回正确数量
-    return items[:num_items] if len(items) >= num_items else fallback["items"][:num_items]
+    if len(items) < num_items:
+        _mark_fallback()
+        return fallback["items"][:num_items]
+    return items[:num_items]
 
 
+@llm_function
 async def judge_batch_survival(crisis: str, players_data: list[dict], force_death: bool = False) -> list[dict]:
     """
     批量判定所有玩家的命运。
@@ -337,7 +614,11 @@ async def judge_batch_survival(crisis: str, players_data: list[dict], force_deat
     
     # Consistency check: Ensure list length matches
     if len(results) != len(players_data):
+        _mark_fallback()
         return fallback_results
         
     return results
 
+
+if LLM_CASSETTE:
+    install_cassette(LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_REPLAY_LATENCY, LLM_REPLAY_STRICT)
@@ -0,0 +1,86 @@
+# Crisis Survival - Judgment Analytics Benchmark
+# 几百万条判定结果时，列式统计（分组生还率 + 置信区间 + 检验 + 漂移对比）和 npz 读写的耗时
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_analytics
+#   python -m benchmarks.bench_analytics --rows 1000000 10000000
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from judgment_analytics import Outcomes, analyze
+
+
+def synthetic(rows: int, seed: int = 0, last_position_penalty: float = 0.0) -> Outcomes:
+    """模拟 3 人一轮的判定：约 15% 的轮强制死亡，其余按 70% 生还（可给最后一个位置加偏向）"""
+    rng = np.random.default_rng(seed)
+    rounds = rows // 3
+    forced = np.repeat(rng.random(rounds) < 0.15, 3)
+    position = np.tile(np.arange(3, dtype=np.int8), rounds)
+    p = np.where(forced, 0.55, 0.7) - np.where(position == 2, last_position_penalty, 0.0)
+    survived = rng.random(rounds * 3) < p
+    # 强制死亡轮至少死一个：全员生还时让第一个人死
+    all_alive = survived.reshape(-1, 3).all(axis=1) & forced[::3]
+    survived.reshape(-1, 3)[all_alive, 0] = False
+    return Outcomes(
+        tier=rng.integers(0, 3, rounds * 3, dtype=np.int8),
+        position=position,
+        n_players=np.full(rounds * 3, 3, dtype=np.int8),
+        round=np.tile(np.repeat(np.arange(1, 4, dtype=np.int8), 3), rounds // 3 + 1)[:rounds * 3],
+        force_death=forced,
+        survived=survived,
+        round_id=np.repeat(np.arange(rounds, dtype=np.int64), 3),
+        t=np.zeros(rounds * 3),
+    )
+
+
+def run(rows: int) -> dict:
+    baseline_data = synthetic(rows, seed=1)
+    biased = synthetic(rows, seed=2, last_position_penalty=0.1)
+    baseline = analyze(baseline_data)
+
+    t0 = time.perf_counter()
+    clean = analyze(synthetic(rows, seed=3), baseline)
+    t1 = time.perf_counter()
+    report = analyze(biased, baseline)
+    t2 = time.perf_counter()
+    assert not clean["flags"], clean["flags"]
+    assert any(f.startswith("by_position") for f in report["flags"]), report["flags"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "outcomes.npz"
+        t3 = time.perf_counter()
+        biased.save(path)
+        t4 = time.perf_counter()
+        loaded = Outcomes.load(path)
+        t5 = time.perf_counter()
+        size = path.stat().st_size
+    assert len(loaded) == len(biased)
+
+    return {
+        "rows": len(biased),
+        "analyze_s": (t1 - t0 + t2 - t1) / 2,
+        "save_s": t4 - t3,
+        "load_s": t5 - t4,
+        "npz_mib": size / 2 ** 20,
+        "flags": len(report["flags"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Judgment analytics throughput benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    args = parser.parse_args()
+    print(f"{'rows':>10} {'analyze s':>10} {'rows/s':>12} {'save s':>8} {'load s':>8} {'npz MiB':>8} {'flags':>6}")
+    for n in args.rows:
+        r = run(n)
+        print(f"{r['rows']:>10} {r['analyze_s']:>10.3f} {r['rows'] / r['analyze_s']:>12.0f} "
+              f"{r['save_s']:>8.2f} {r['load_s']:>8.2f} {r['npz_mib']:>8.1f} {r['flags']:>6}")
+
+
+if __name__ == "__main__":
+    main()
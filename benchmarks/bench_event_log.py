@@ -0,0 +1,107 @@
+# Crisis Survival - Event Log Throughput Benchmark
+# 成千上万个房间同时产生事件时，事件日志的写入吞吐、游戏循环侧的 append 开销、压缩率和读取速度
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_event_log
+#   python -m benchmarks.bench_event_log --rooms 1000 5000 --events 60 --segment-mib 8
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+from event_log import EventLog, list_segments, read_events
+from spectators import encode_frame
+
+SAMPLE_MESSAGES = [
+    {"type": "round_start", "round": 2, "max_rounds": 3},
+    {"type": "phase_change", "phase": "crisis_setup", "message": "选择一个关键词，共同编织危机！"},
+    {"type": "keyword_submitted", "player": "玩家1"},
+    {"type": "crisis_revealed", "name": "混沌风暴", "scenario": "时空错乱风暴正在摧毁一切！" * 4,
+     "items": [{"name": "神秘的万能按钮", "tier": "legendary", "pickup_comment": "千万别乱按！"}] * 5},
+    {"type": "item_grabbed", "player": "玩家1", "index": 2, "item": "生锈的消防斧", "tier": "normal"},
+    {"type": "judgment_result", "player": "玩家1", "survived": True, "story": "你挥舞着消防斧劈开了一条生路。" * 6,
+     "item": "生锈的消防斧", "tier": "normal"},
+    {"type": "round_end", "round": 2, "scores": [{"name": f"玩家{i}", "score": i} for i in range(3)]},
+]
+
+
+def room_code(i: int) -> str:
+    letters = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+    return "".join(letters[i // 24 ** k % 24] for k in range(4))
+
+
+async def room_task(log: EventLog, room_id: str, events: int):
+    """一个房间：每条广播编码一次并 append，然后让出事件循环"""
+    for seq in range(1, events + 1):
+        message = {**SAMPLE_MESSAGES[seq % len(SAMPLE_MESSAGES)], "seq": seq}
+        log.append(room_id, encode_frame(message))
+        await asyncio.sleep(0)
+
+
+async def run(rooms: int, events: int, segment_bytes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(tmp, segment_bytes=segment_bytes, flush_interval=0.05, batch_size=2000,
+                       max_pending=rooms * events + 10_000)
+        writer = asyncio.create_task(log.run())
+        await asyncio.sleep(0)
+
+        # 游戏循环侧：单独量 append 本身的开销
+        t0 = time.perf_counter()
+        for i in range(10_000):
+            log.append("ZZZZ", '{"type":"probe"}')
+        append_ns = (time.perf_counter() - t0) / 10_000 * 1e9
+
+        start = time.perf_counter()
+        await asyncio.gather(*(room_task(log, room_code(i), events) for i in range(rooms)))
+        produced = time.perf_counter() - start
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+        total = rooms * events + 10_000
+        assert log.written == total and log.dropped == 0, (log.written, log.dropped)
+        compressed = sum(p.stat().st_size for p in list_segments(tmp))
+
+        t1 = time.perf_counter()
+        read_all = sum(1 for _ in read_events(tmp))
+        read_all_s = time.perf_counter() - t1
+        t2 = time.perf_counter()
+        one_room = sum(1 for _ in read_events(tmp, room_code(rooms // 2)))
+        read_one_s = time.perf_counter() - t2
+        assert read_all == total and one_room == events
+
+        return {
+            "rooms": rooms,
+            "events": total,
+            "append_ns": append_ns,
+            "produce_s": produced,
+            "events_per_s": total / elapsed,
+            "segments": len(list_segments(tmp)),
+            "raw_mib": log.bytes_written / 2 ** 20,
+            "compressed_mib": compressed / 2 ** 20,
+            "read_all_per_s": read_all / read_all_s,
+            "read_one_ms": read_one_s * 1000,
+        }
+
+
+async def main_async(args):
+    print(f"{'rooms':>7} {'events':>9} {'append ns':>10} {'events/s':>10} {'segments':>9} "
+          f"{'raw MiB':>8} {'gz MiB':>8} {'read/s':>10} {'1 room ms':>10}")
+    for n in args.rooms:
+        r = await run(n, args.events, args.segment_mib * 2 ** 20)
+        print(f"{r['rooms']:>7} {r['events']:>9} {r['append_ns']:>10.0f} {r['events_per_s']:>10.0f} "
+              f"{r['segments']:>9} {r['raw_mib']:>8.1f} {r['compressed_mib']:>8.2f} {r['read_all_per_s']:>10.0f} {r['read_one_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log write/read throughput benchmark")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--events", type=int, default=60, help="events per room (about one full game)")
+    parser.add_argument("--segment-mib", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# Crisis Survival - Hot Path Microbenchmarks
+# game_manager / server / ai_module 热点路径的微基准，可保存基线并与之比较
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_hotpaths                          # 只跑，打印 ns/op
+#   python -m benchmarks.bench_hotpaths --save                   # 保存为基线
+#   python -m benchmarks.bench_hotpaths --compare --threshold 0.2  # 比基线慢 20% 以上时退出码为 1
+#   python -m benchmarks.bench_hotpaths --filter matchmaking
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from ai_module import parse_json_response
+from game_manager import GameManager, GameRoom, MatchmakingQueue, Player
+from game_runtime import Transport
+from mock_llm import MockLLM
+import server
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "hotpaths.json"
+ROOM_SPACE = 24 ** 4  # _generate_room_id 的码空间
+
+SAMPLE_ITEMS = [
+    {"name": "神秘的万能按钮", "tier": "legendary", "pickup_comment": "千万别乱按！"},
+    {"name": "生锈的消防斧", "tier": "normal", "pickup_comment": "希望能砍断点什么。"},
+    {"name": "过期的能量饮料", "tier": "normal", "pickup_comment": "喝了可能会拉肚子。"},
+    {"name": "半根香蕉", "tier": "trash", "pickup_comment": "谁吃剩下的？"},
+    {"name": "破洞的袜子", "tier": "trash", "pickup_comment": "味道有点冲..."},
+]
+
+# 每个 case：() -> (操作次数, 耗时秒)
+CASES: dict[str, Callable[[], tuple[int, float]]] = {}
+
+
+def case(name: str):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def make_players(n: int, prefix: str = "p") -> list[Player]:
+    return [Player(id=f"{prefix}-{i:06d}", name=f"{prefix}{i}") for i in range(n)]
+
+
+def scavenge_room(players: list[Player]) -> GameRoom:
+    room = GameRoom(room_id="BNCH")
+    room.players = players
+    room.set_items([dict(item) for item in SAMPLE_ITEMS])
+    return room
+
+
+# ---------- 物品抢夺 ----------
+
+def grab_contention(contenders: int) -> tuple[int, float]:
+    """contenders 个玩家同时抢 5 个物品，每个玩家抢到或物品抢光为止"""
+    rounds = 200
+
+    async def run() -> float:
+        elapsed = 0.0
+        for _ in range(rounds):
+            players = make_players(contenders)
+            room = scavenge_room(players)
+            start = time.perf_counter()
+            await asyncio.gather(*(room.try_grab_item(p, random.randrange(5)) for p in players))
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    return rounds * contenders, asyncio.run(run())
+
+
+@case("grab.contention_3")
+def grab_contention_3():
+    return grab_contention(3)
+
+
+@case("grab.contention_64")
+def grab_contention_64():
+    return grab_contention(64)
+
+
+@case("items.get_available")
+def get_available_items():
+    players = make_players(3)
+    room = scavenge_room(players)
+    room.claim_item(players[0], 1)
+    room.claim_item(players[1], 3)
+    n = 200_000
+    start = time.perf_counter()
+    for _ in range(n):
+        room.get_available_items()
+    return n, time.perf_counter() - start
+
+
+# ---------- 匹配队列 ----------
+
+def filled_queue(size: int) -> MatchmakingQueue:
+    queue = MatchmakingQueue()
+    queue.queue = make_players(size, prefix="q")
+    return queue
+
+
+def matchmaking_join_leave(size: int) -> tuple[int, float]:
+    """队列里已有 size 人时，一个玩家加入再离开"""
+    queue = filled_queue(size)
+    newcomers = make_players(200, prefix="n")
+    start = time.perf_counter()
+    for p in newcomers:
+        queue.join(p)
+        queue.leave(p.id)
+    return len(newcomers) * 2, time.perf_counter() - start
+
+
+def matchmaking_match(size: int) -> tuple[int, float]:
+    """队列里已有 size 人时，连续凑 200 桌"""
+    queue = filled_queue(size + 600)
+    start = time.perf_counter()
+    for _ in range(200):
+        queue.try_match()
+    return 200, time.perf_counter() - start
+
+
+for _size in (100, 1_000, 10_000):
+    case(f"matchmaking.join_leave_{_size}")(lambda s=_size: matchmaking_join_leave(s))
+    case(f"matchmaking.match_{_size}")(lambda s=_size: matchmaking_match(s))
+
+
+# ---------- 房间码 ----------
+
+def room_id_generation(fill: float) -> tuple[int, float]:
+    """房间码空间已占用 fill 比例时生成新码"""
+    manager = GameManager()
+    rng = random.Random("room-fill")  # 与全局 random 的种子不同，否则生成序列和填充序列重合
+    letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+    target = int(ROOM_SPACE * fill)
+    while len(manager.rooms) < target:
+        manager.rooms[''.join(rng.choices(letters, k=4))] = None
+    n = 2_000
+    start = time.perf_counter()
+    for _ in range(n):
+        manager._generate_room_id()
+    return n, time.perf_counter() - start
+
+
+for _fill in (0.0, 0.5, 0.9, 0.99):
+    case(f"room_id.fill_{int(_fill * 100)}")(lambda f=_fill: room_id_generation(f))
+
+
+# ---------- 广播 ----------
+
+class NullTransport(Transport):
+    """只计数，不做任何 I/O，测的是 broadcast_to_room 本身的分发开销"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, player, message: dict):
+        self.sent += 1
+
+    def has_audience(self, room) -> bool:
+        return True
+
+
+def broadcast_fanout(humans: int) -> tuple[int, float]:
+    transport = NullTransport()
+    room = GameRoom(room_id="BCST", transport=transport)
+    room.players = make_players(humans)
+    message = {"type": "item_grabbed", "player": "p0", "item_name": "生锈的消防斧",
+               "tier": "normal", "comment": "希望能砍断点什么。", "item_index": 1}
+    n = max(1, 20_000 // humans)
+
+    async def run() -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            await server.broadcast_to_room(room, message)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    return transport.sent, elapsed
+
+
+for _humans in (3, 50, 500):
+    case(f"broadcast.fanout_{_humans}")(lambda h=_humans: broadcast_fanout(h))
+
+
+# ---------- LLM 输出解析 ----------
+
+def llm_outputs() -> dict[str, str]:
+    """按真实模型输出的几种常见形态构造样本"""
+    llm = MockLLM(seed=1)
+    players = "\n".join(f"Player {i} (玩家{i}): 物品='会飞的假牙' (品质: normal)" for i in range(1, 4))
+    judgment = llm.respond(f'"results" {players}')
+    items = llm.respond('"items" 生成 5 个')
+    return {
+        "clean": judgment,
+        "fenced": f"```json\n{items}\n```",
+        "prose": f"好的，这是本轮的判定结果：\n{judgment}\n希望你喜欢！",
+        "pretty": json.dumps(json.loads(judgment), ensure_ascii=False, indent=2),
+        "malformed": judgment[: len(judgment) // 2],
+    }
+
+
+def parse_case(kind: str) -> tuple[int, float]:
+    text = llm_outputs()[kind]
+    n = 20_000
+    # 坏 JSON 每次都会打印 warning，计时时屏蔽掉
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(n):
+            parse_json_response(text, {})
+        elapsed = time.perf_counter() - start
+    return n, elapsed
+
+
+for _kind in ("clean", "fenced", "prose", "pretty", "malformed"):
+    case(f"parse_json.{_kind}")(lambda k=_kind: parse_case(k))
+
+
+# ---------- 运行 / 基线 ----------
+
+def run_case(fn: Callable[[], tuple[int, float]], repeat: int) -> float:
+    """重复 repeat 次取中位数，返回 ns/op"""
+    samples = []
+    for _ in range(repeat):
+        random.seed(0)
+        ops, elapsed = fn()
+        samples.append(elapsed / ops * 1e9)
+    return statistics.median(samples)
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path microbenchmarks with saved baselines")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="只跑名字包含该子串的 case")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--compare", action="store_true", help="和基线文件比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="慢于基线多少比例算回归")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline).get("results", {}) if args.compare else {}
+    results: dict[str, float] = {}
+    regressions = []
+
+    print(f"{'case':<32}{'ns/op':>14}{'baseline':>14}{'change':>10}")
+    for name, fn in CASES.items():
+        if args.filter not in name:
+            continue
+        ns = results[name] = run_case(fn, args.repeat)
+        line = f"{name:<32}{ns:>14.1f}"
+        if name in baseline:
+            change = ns / baseline[name] - 1
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions.append(name)
+            line += f"{baseline[name]:>14.1f}{change:>+10.1%}{flag}"
+        print(line, flush=True)
+
+    if args.save:
+        saved = load_baseline(args.baseline)
+        saved.setdefault("results", {}).update(results)
+        saved["python"] = platform.python_version()
+        saved["machine"] = f"{platform.system()} {platform.machine()}"
+        saved["saved_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(saved, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\n基线已保存: {args.baseline}")
+
+    if args.compare and not baseline:
+        print(f"\n[Warning] No baseline at {args.baseline}; run with --save first.")
+    if regressions:
+        print(f"\n{len(regressions)} 个 case 比基线慢 {args.threshold:.0%} 以上: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Crisis Survival - Memory Benchmark
+# 统计每个房间的常驻内存（字节/房间），决定单机能装多少房间
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_memory
+#   python -m benchmarks.bench_memory --rooms 10000 100000
+
+import argparse
+import gc
+import random
+import tracemalloc
+
+from game_manager import GameRoom, Player, BotPlayer, estimate_size
+
+SAMPLE_ITEMS = [
+    {"name": "神秘的万能按钮", "tier": "legendary", "pickup_comment": "千万别乱按！"},
+    {"name": "生锈的消防斧", "tier": "normal", "pickup_comment": "希望能砍断点什么。"},
+    {"name": "过期的能量饮料", "tier": "normal", "pickup_comment": "喝了可能会拉肚子。"},
+    {"name": "半根香蕉", "tier": "trash", "pickup_comment": "谁吃剩下的？"},
+    {"name": "破洞的袜子", "tier": "trash", "pickup_comment": "味道有点冲..."},
+]
+
+
+def build_room(i: int) -> GameRoom:
+    """构造一个处于抢夺阶段中途的典型房间：1 真人 + 2 Bot，5 个物品，已抢 2 个"""
+    room = GameRoom(room_id=f"R{i:06d}")
+    room.add_player(Player(id=f"player-{i:06d}", name=f"玩家{i}"))
+    room.add_player(BotPlayer())
+    room.add_player(BotPlayer())
+    
+    room.current_round = 2
+    room.collected_keywords = ["会飞的假牙", "量子力学的脚气", "通货膨胀的眉毛"]
+    room.keyword_options = {p.id: list(room.collected_keywords) for p in room.players}
+    room.crisis_data = {"name": "混沌风暴", "scenario": "时空错乱风暴正在摧毁一切！"}
+    room.set_items([dict(item) for item in SAMPLE_ITEMS])
+    for p, idx in zip(room.players[:2], random.sample(range(len(room.items)), 2)):
+        room.claim_item(p, idx)
+    return room
+
+
+def measure(n: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    rooms = [build_room(i) for i in range(n)]
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    per_room = (after - before) / n
+    return {
+        "rooms": n,
+        "traced_bytes_per_room": per_room,
+        "estimated_bytes_per_room": estimate_size(rooms[0]),
+        "total_mib": (after - before) / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes-per-room memory benchmark")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+    
+    print(f"{'rooms':>10} {'bytes/room':>12} {'estimate':>10} {'total MiB':>10}")
+    for n in args.rooms:
+        r = measure(n)
+        print(f"{r['rooms']:>10} {r['traced_bytes_per_room']:>12.0f} "
+              f"{r['estimated_bytes_per_room']:>10} {r['total_mib']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
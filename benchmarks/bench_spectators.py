@@ -0,0 +1,121 @@
+# Crisis Survival - Spectator Fan-out Benchmark
+# 每增加一个观众，服务器每条广播多花多少时间 / 每个观众常驻多少内存
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_spectators
+#   python -m benchmarks.bench_spectators --spectators 0 100 1000 --messages 500
+#
+# publish 列是玩家投递路径上的额外开销（编码一次 + 每个观众一次 put_nowait），
+# total 列再加上各观众发送协程把帧写出去的开销（这里的 socket 是空实现，只算服务器侧 CPU）。
+
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from spectators import SpectatorHub, encode_frame
+
+ROOM_ID = "BNCH"
+
+SAMPLE_MESSAGES = [
+    {"type": "round_start", "round": 2, "max_rounds": 3},
+    {"type": "phase_change", "phase": "crisis_setup", "message": "选择一个关键词，共同编织危机！"},
+    {"type": "keyword_submitted", "player": "玩家1"},
+    {"type": "crisis_revealed", "name": "混沌风暴", "scenario": "时空错乱风暴正在摧毁一切！" * 4,
+     "items": [{"name": "神秘的万能按钮", "tier": "legendary", "pickup_comment": "千万别乱按！"}] * 5},
+    {"type": "item_grabbed", "player": "玩家1", "index": 2, "item": "生锈的消防斧", "tier": "normal"},
+    {"type": "judgment_result", "player": "玩家1", "survived": True, "story": "你挥舞着消防斧劈开了一条生路。" * 6,
+     "item": "生锈的消防斧", "tier": "normal"},
+    {"type": "round_end", "round": 2, "scores": [{"name": f"玩家{i}", "score": i} for i in range(3)]},
+]
+
+
+class NullSocket:
+    """只记录字节数的假 WebSocket"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    async def send_text(self, text: str):
+        self.bytes += len(text)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run(spectators: int, messages: int) -> dict:
+    hub = SpectatorHub(max_per_room=max(spectators, 1), queue_size=64)
+    sockets = [NullSocket() for _ in range(spectators)]
+    pumps = [asyncio.create_task(hub.join(ROOM_ID, s, []).pump()) for s in sockets]
+    await asyncio.sleep(0)
+
+    publish = 0.0
+    start = time.perf_counter()
+    for i in range(messages):
+        message = {**SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], "seq": i + 1}
+        t0 = time.perf_counter()
+        hub.publish(ROOM_ID, encode_frame(message))
+        publish += time.perf_counter() - t0
+        await asyncio.sleep(0)  # 让发送协程把帧写出去（广播之间本来就有间隔）
+    total = time.perf_counter() - start
+
+    hub.close_room(ROOM_ID)
+    await asyncio.gather(*pumps)
+    assert hub.dropped == 0, "spectators fell behind in benchmark"
+    expected = sum(len(encode_frame({**SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], "seq": i + 1}))
+                   for i in range(messages))
+    assert all(s.bytes == expected for s in sockets)
+    return {"spectators": spectators, "publish_us": publish / messages * 1e6, "total_us": total / messages * 1e6}
+
+
+async def memory_per_spectator(n: int) -> float:
+    """空闲观众（已入队快照、发送协程在等待）的常驻字节数"""
+    hub = SpectatorHub(max_per_room=n, queue_size=64)
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    pumps = [asyncio.create_task(hub.join(ROOM_ID, NullSocket(), []).pump()) for _ in range(n)]
+    await asyncio.sleep(0)
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    hub.close_room(ROOM_ID)
+    await asyncio.gather(*pumps)
+    return (after - before) / n
+
+
+def naive_encode_us(spectators: int, messages: int) -> float:
+    """对照：每个观众各自 json 编码一次时，仅编码部分的开销"""
+    start = time.perf_counter()
+    for i in range(messages):
+        message = {**SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], "seq": i + 1}
+        for _ in range(spectators):
+            encode_frame(message)
+    return (time.perf_counter() - start) / messages * 1e6
+
+
+async def main_async(args):
+    results = [await run(n, args.messages) for n in args.spectators]
+    base = next((r for r in results if r["spectators"] == 0), None)
+
+    print(f"{'spectators':>10} {'publish us/msg':>15} {'total us/msg':>13} {'us/msg/spec':>12} {'naive encode':>13}")
+    for r in results:
+        n = r["spectators"]
+        marginal = f"{(r['total_us'] - base['total_us']) / n:.2f}" if base and n else "-"
+        print(f"{n:>10} {r['publish_us']:>15.1f} {r['total_us']:>13.1f} {marginal:>12} "
+              f"{naive_encode_us(n, min(args.messages, 100)):>13.1f}")
+    print(f"\nmemory: {await memory_per_spectator(args.memory_sample):.0f} bytes per idle spectator")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-spectator fan-out cost benchmark")
+    parser.add_argument("--spectators", type=int, nargs="+", default=[0, 1, 10, 100, 500])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--memory-sample", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
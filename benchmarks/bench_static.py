@@ -0,0 +1,78 @@
+# Crisis Survival - Static Asset Serving Benchmark
+# 一次页面加载（index.html + app.js + style.css）的服务器 CPU 开销和传输字节：首次访问、再次访问（304）、旧方式（每次读盘、不压缩）
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_static
+#   python -m benchmarks.bench_static --loads 50000
+
+import argparse
+import time
+from pathlib import Path
+
+from starlette.requests import Request
+
+from static_assets import StaticAssets
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+
+
+def make_request(headers: dict) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def page_load(assets: StaticAssets, accept: str, etags: dict) -> tuple[int, dict]:
+    """模拟浏览器：首页 + 两个静态文件，带上次拿到的 ETag"""
+    sent = 0
+    new_etags = {}
+    targets = [("index.html", assets.index, False)] + [
+        (name, *assets.lookup(assets.url_for(name)[len("/static/"):])) for name in ("app.js", "style.css")]
+    for name, asset, immutable in targets:
+        headers = {"accept-encoding": accept}
+        if name in etags:
+            headers["if-none-match"] = etags[name]
+        response = assets.respond(make_request(headers), asset, immutable)
+        sent += len(response.body)
+        new_etags[name] = response.headers["etag"]
+    return sent, new_etags
+
+
+def legacy_load() -> int:
+    """改动前：每次读盘、不压缩、没有缓存验证"""
+    sent = len((STATIC_DIR / "index.html").read_text(encoding="utf-8").encode("utf-8"))
+    for name in ("app.js", "style.css"):
+        sent += len((STATIC_DIR / name).read_bytes())
+    return sent
+
+
+def timed(fn, loads: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    sent = 0
+    for _ in range(loads):
+        sent = fn()
+    return (time.perf_counter() - start) / loads * 1e6, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static asset serving cost per page load")
+    parser.add_argument("--loads", type=int, default=20_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    assets = StaticAssets(STATIC_DIR)
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    _, etags = page_load(assets, "gzip, deflate, br", {})
+    rows = [
+        ("legacy (disk, identity)", *timed(legacy_load, args.loads)),
+        ("first visit (gzip/br)", *timed(lambda: page_load(assets, "gzip, deflate, br", {})[0], args.loads)),
+        ("revisit (304)", *timed(lambda: page_load(assets, "gzip, deflate, br", etags)[0], args.loads)),
+    ]
+    print(f"startup (read + hash + compress): {startup_ms:.1f}ms  brotli: {assets.get_stats()['brotli']}")
+    print(f"{'case':<26} {'us/page load':>13} {'bytes sent':>11}")
+    for name, us, sent in rows:
+        print(f"{name:<26} {us:>13.1f} {sent:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Crisis Survival - Stats Store Benchmark
+# 每分钟上千局时，战绩记录在游戏循环上的开销、批量写库的耗时和排行榜读取延迟
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_stats_store
+#   python -m benchmarks.bench_stats_store --games 20000 --players 5000
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from stats_store import STATS_FLUSH, StatsStore
+
+TIERS = ("legendary", "normal", "trash")
+
+
+async def run(games: int, players: int, games_per_minute: int, flush_interval: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = StatsStore(Path(tmp) / "stats.db", flush_interval=flush_interval, refresh_interval=1.0,
+                           top_n=100, min_rounds=3)
+        writer = asyncio.create_task(store.run())
+        while not store.running:
+            await asyncio.sleep(0.01)
+
+        rng = random.Random(0)
+        names = [f"玩家{i}" for i in range(players)]
+        record_costs = []
+        read_costs = []
+        gap = 60 / games_per_minute
+        start = time.perf_counter()
+        for i in range(games):
+            humans = rng.sample(names, 3)
+            t0 = time.perf_counter()
+            # 一局：3 轮 x 3 名真人的判定 + 结算
+            for _ in range(3):
+                for name in humans:
+                    store.record_round(name, rng.choice(TIERS), rng.random() < 0.7)
+            store.record_game([(name, rng.randint(0, 3)) for name in humans], winner=humans[0])
+            record_costs.append(time.perf_counter() - t0)
+
+            t1 = time.perf_counter()
+            _ = store.leaderboard["wins"][:20]
+            read_costs.append(time.perf_counter() - t1)
+
+            # 按目标速率推进（批量 sleep，避免每局一次 sleep 的调度开销）
+            if i % 100 == 99:
+                await asyncio.sleep(max(0.0, start + (i + 1) * gap - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+        # 重新打开验证数据都写进去了
+        check = StatsStore(Path(tmp) / "stats.db", top_n=1)
+        check._open()
+        total_games = check._conn.execute("SELECT SUM(games) FROM players").fetchone()[0]
+        check._close()
+        assert total_games == games * 3, (total_games, games * 3)
+
+        flush_count = STATS_FLUSH.count()
+        flush_sum = STATS_FLUSH._sums.get((), 0.0)
+        return {
+            "games": games,
+            "elapsed_s": elapsed,
+            "games_per_min": games / elapsed * 60,
+            "record_us_p50": statistics.median(record_costs) * 1e6,
+            "record_us_p99": sorted(record_costs)[int(len(record_costs) * 0.99)] * 1e6,
+            "read_us_p99": sorted(read_costs)[int(len(read_costs) * 0.99)] * 1e6,
+            "flushes": store.flushes,
+            "flush_ms_avg": flush_sum / flush_count * 1000 if flush_count else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Player stats write-behind benchmark")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--players", type=int, default=2_000, help="distinct player names")
+    parser.add_argument("--rate", type=int, default=60_000, help="target games per minute")
+    parser.add_argument("--flush-interval", type=float, default=0.5)
+    args = parser.parse_args()
+    r = asyncio.run(run(args.games, args.players, args.rate, args.flush_interval))
+    print(f"games: {r['games']}  ({r['games_per_min']:.0f}/min over {r['elapsed_s']:.1f}s)")
+    print(f"record per game on the loop: p50 {r['record_us_p50']:.1f}us  p99 {r['record_us_p99']:.1f}us")
+    print(f"leaderboard read p99: {r['read_us_p99']:.2f}us (cached)")
+    print(f"flushes: {r['flushes']}  avg {r['flush_ms_avg']:.1f}ms per batch (writer thread)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Crisis Survival - Story Relay Context Benchmark
+# 故事接龙越来越长时，每轮 prompt 的大小和延迟：旧方式（整篇 story_so_far）对比 StorySession（滚动摘要 + 预算）
+#
+# 模拟的 LLM 延迟 = 固定开销 + 按 prompt token 数线性增长（近似真实 API 的 prefill 开销）。
+#
+# 用法（在项目根目录）：
+#   python -m benchmarks.bench_story_context
+#   python -m benchmarks.bench_story_context --turns 300 --ms-per-1k-tokens 200
+
+import argparse
+import asyncio
+import json
+import time
+
+import ai_module
+from ai_module import (
+    StorySession, estimate_tokens, generate_keywords_for_player, generate_opening, generate_story_continuation
+)
+from config import STORY_CONTEXT_TOKENS
+from mock_llm import MockLLM, prompt_family
+
+CHECKPOINTS = (10, 50, 100, 200, 500)
+
+
+class SlowMockLLM:
+    """MockLLM + 与 prompt 长度成正比的延迟；记录每次调用的 prompt 大小"""
+
+    def __init__(self, base_ms: float, ms_per_1k: float):
+        self.mock = MockLLM(seed=0)
+        self.base_ms = base_ms
+        self.ms_per_1k = ms_per_1k
+        self.calls: list[tuple[str, int]] = []
+
+    async def __call__(self, prompt: str) -> str:
+        tokens = estimate_tokens(prompt)
+        family = prompt_family(prompt)
+        self.calls.append((family, tokens))
+        await asyncio.sleep((self.base_ms + self.ms_per_1k * tokens / 1000) / 1000)
+        text = self.mock.respond(prompt)
+        if family == "story":
+            # 真实续写约 80 字，mock 的太短：重复几次凑到相近长度
+            data = json.loads(text)
+            data["story"] = data["story"] * 3
+            text = json.dumps(data, ensure_ascii=False)
+        return text
+
+
+async def play(turns: int, use_session: bool, llm: SlowMockLLM) -> list[tuple[int, float, int]]:
+    """返回每轮的 (轮次, 玩家等待的秒数, 本轮 prompt token 数)"""
+    ai_module.set_llm_override(llm)
+    rows = []
+    if use_session:
+        session = StorySession(budget=STORY_CONTEXT_TOKENS)
+        await session.opening(["香蕉", "外星人"])
+    else:
+        story = (await generate_opening(["香蕉", "外星人"]))["story"]
+    for turn in range(1, turns + 1):
+        before = len(llm.calls)
+        start = time.perf_counter()
+        if use_session:
+            await session.keywords_for_player()
+            await session.continue_story(["马桶"])
+        else:
+            # 改动前的用法：每轮把整篇故事塞进 prompt
+            await generate_keywords_for_player(story)
+            story += "\n\n" + (await generate_story_continuation(story, ["马桶"]))["story"]
+        waited = time.perf_counter() - start
+        rows.append((turn, waited, sum(tokens for _, tokens in llm.calls[before:])))
+        await asyncio.sleep(0.05)  # 玩家挑关键词的时间（后台摘要在这期间完成）
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Story relay prompt size / latency vs story length")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--base-ms", type=float, default=5)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=50)
+    args = parser.parse_args()
+
+    legacy_llm = SlowMockLLM(args.base_ms, args.ms_per_1k_tokens)
+    session_llm = SlowMockLLM(args.base_ms, args.ms_per_1k_tokens)
+    legacy = asyncio.run(play(args.turns, False, legacy_llm))
+    session = asyncio.run(play(args.turns, True, session_llm))
+
+    print(f"{'turn':>6} {'legacy tokens':>14} {'legacy ms':>10} {'session tokens':>15} {'session ms':>11}")
+    for turn in [c for c in CHECKPOINTS if c <= args.turns]:
+        _, l_wait, l_tokens = legacy[turn - 1]
+        _, s_wait, s_tokens = session[turn - 1]
+        print(f"{turn:>6} {l_tokens:>14} {l_wait * 1000:>10.1f} {s_tokens:>15} {s_wait * 1000:>11.1f}")
+    summaries = [tokens for family, tokens in session_llm.calls if family == "summary"]
+    print(f"total prompt tokens: legacy {sum(t for _, t in legacy_llm.calls)}  "
+          f"session {sum(t for _, t in session_llm.calls)} "
+          f"(incl. {len(summaries)} background summary calls, max {max(summaries, default=0)} tokens each)")
+
+
+if __name__ == "__main__":
+    main()
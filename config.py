@@ -6,8 +6,11 @@ import os
 # Get your API key from: https://platform.deepseek.com/api_keys
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "").strip()
 
-# DeepSeek API Base URL
-DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+# DeepSeek API Base URL（压测时可指向本地 mock_llm_server.py）
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# 单次 LLM 请求的总超时（秒，不重试），超时后走 fallback 内容
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
 
 # Model to use for text generation
 LLM_MODEL = "deepseek-chat"
@@ -22,6 +25,12 @@ NUM_ROUNDS = 3
 # Word limit for AI-generated story segments
 STORY_SEGMENT_WORD_LIMIT = 80
 
+# 故事接龙拼进 prompt 的前文上限（估算 token，见 ai_module.StorySession）：
+# 最近 STORY_KEEP_RECENT 段保留原文，更早的段落折叠成不超过 STORY_SUMMARY_TOKENS 的滚动摘要
+STORY_CONTEXT_TOKENS = 1200
+STORY_KEEP_RECENT = 3
+STORY_SUMMARY_TOKENS = 300
+
 # --- Crisis Mode Configuration ---
 # 每轮生成的危机选项数量
 NUM_CRISIS_OPTIONS = 3
@@ -36,7 +45,144 @@ SCAVENGE_DELAY = 0.3
 POINTS_SURVIVE = 1
 POINTS_DEATH = 0
 
-# --- Image Generation (Mock for now) ---
-# Set to True to enable actual image generation (requires Replicate API key)
-ENABLE_IMAGE_GENERATION = False
+# --- Image Generation（见 image_pipeline.py） ---
+# 危机 / 判定配图：文字先发，图片生成好后再通过 WebSocket 推送 image_ready
+ENABLE_IMAGE_GENERATION = os.environ.get("ENABLE_IMAGE_GENERATION", "0") == "1"
 REPLICATE_API_KEY = os.environ.get("REPLICATE_API_KEY", "YOUR_REPLICATE_KEY_HERE")
+REPLICATE_MODEL = os.environ.get("REPLICATE_MODEL", "black-forest-labs/flux-schnell")
+
+# 图片后端：replicate / mock（本地生成 SVG，离线可测）；默认有 Replicate key 时用 replicate
+IMAGE_BACKEND = os.environ.get(
+    "IMAGE_BACKEND", "replicate" if REPLICATE_API_KEY != "YOUR_REPLICATE_KEY_HERE" else "mock").strip().lower()
+
+# 按 prompt 哈希寻址的图片缓存目录与大小上限（字节），超过后删除最旧的文件
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "image_cache").strip()
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# 同时进行的生成数、排队上限（超出直接丢弃，只是少一张图）与单张超时（秒）
+IMAGE_CONCURRENCY = int(os.environ.get("IMAGE_CONCURRENCY", "4"))
+IMAGE_MAX_PENDING = 200
+IMAGE_TIMEOUT = float(os.environ.get("IMAGE_TIMEOUT", "60"))
+
+# --- Room Lifecycle ---
+# 同时存活的房间上限，达到上限后先尝试回收，仍然满则拒绝开新局
+MAX_LIVE_ROOMS = 1000
+
+# 游戏结束后房间保留的秒数（让客户端看完结算）
+ROOM_GAME_OVER_TTL = 60
+
+# 房间无任何活动超过该秒数视为闲置，直接回收
+ROOM_IDLE_TIMEOUT = 600
+
+# 回收器扫描间隔（秒）
+ROOM_REAP_INTERVAL = 10
+
+# --- Shared State Backend ---
+# memory: 单进程（默认）；redis: 多 worker 共享匹配队列和房间消息（uvicorn --workers N）
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+
+# Redis 协议服务地址（真实 Redis 或本地 mini_redis.py）
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+# --- LLM Cassette（录制 / 回放 call_llm，见 llm_cassette.py） ---
+# cassette 文件路径，.gz 结尾则压缩；为空表示不启用
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", "").strip()
+
+# record: 调用真实 LLM 并录制；replay: 只从 cassette 回放，不访问网络
+LLM_CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "replay").strip()
+
+# 回放延迟：zero 立即返回；real 按录制时的耗时等待
+LLM_REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "zero").strip()
+
+# 回放时只接受 prompt 完全一致的记录（否则按 prompt 类型取同类响应）
+LLM_REPLAY_STRICT = os.environ.get("LLM_REPLAY_STRICT", "0") == "1"
+
+# --- Tracing（每局时间线，见 tracing.py） ---
+# 记录完整时间线的房间比例（0 关闭，1 全部记录）
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+
+# 结束的 trace 写成 Chrome trace JSON 的目录；为空则只保留在内存里，通过 /api/traces 查看
+TRACE_DIR = os.environ.get("TRACE_DIR", "").strip()
+
+# 内存里保留最近多少局的 trace
+TRACE_KEEP = 50
+
+# 单局最多记录的事件数，超出的丢弃并计数
+TRACE_MAX_EVENTS = 20000
+
+# 同时进行的 LLM 请求上限（0 不限制）；超出的请求排队，排队时间记入 trace
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "0"))
+
+# --- Event Loop Watchdog（见 loop_watchdog.py） ---
+# 测量事件循环调度延迟的间隔（秒）
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.1"))
+
+# 事件循环被阻塞超过该秒数时记录一次卡顿并抓取调用栈
+SLOW_CALLBACK_THRESHOLD = float(os.environ.get("SLOW_CALLBACK_THRESHOLD", "0.1"))
+
+# --- Admin 诊断接口（见 admin.py） ---
+# 为空时 /admin/* 全部返回 404
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "").strip()
+
+# 单次 CPU 采样的最长秒数
+PROFILE_MAX_SECONDS = 60
+
+# --- WebSocket 心跳 ---
+# 服务器发 ping 的间隔（秒）
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "15"))
+
+# 超过该秒数没有收到客户端任何消息（含 pong）即判定连接已死，交给 AI 接管
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", "45"))
+
+# --- WebSocket 入站限流（见 inbound_guard.py） ---
+# 单个客户端消息帧的最大字节数（按 UTF-8 编码计，正常消息都在 100 字节以内），超过直接断开
+WS_MAX_FRAME_BYTES = int(os.environ.get("WS_MAX_FRAME_BYTES", "2048"))
+
+# 每个连接的令牌桶：每秒补充的令牌数与桶容量（start_matching / start_solo 每次消耗更多令牌）
+WS_RATE_LIMIT = float(os.environ.get("WS_RATE_LIMIT", "5"))
+WS_RATE_BURST = float(os.environ.get("WS_RATE_BURST", "20"))
+
+# 被拒绝的消息（超速、格式不对）累计到该数量即断开连接；每秒恢复 1 次额度
+WS_MAX_VIOLATIONS = int(os.environ.get("WS_MAX_VIOLATIONS", "30"))
+
+# --- 断线重连 ---
+# 对局中断线后保留座位的秒数，期间客户端可带 session_token 重连并补收错过的消息
+RESUME_GRACE_PERIOD = float(os.environ.get("RESUME_GRACE_PERIOD", "20"))
+
+# 每个房间保留的最近下行消息条数（重连时按序号补发）
+ROOM_REPLAY_BUFFER = 64
+
+# --- 观战（见 spectators.py） ---
+# 每个房间最多的观众数
+MAX_SPECTATORS_PER_ROOM = int(os.environ.get("MAX_SPECTATORS_PER_ROOM", "500"))
+
+# 每个观众最多排队的帧数，超出即视为跟不上并断开（不会拖慢玩家）
+SPECTATOR_QUEUE_SIZE = int(os.environ.get("SPECTATOR_QUEUE_SIZE", "64"))
+
+# --- 事件日志（见 event_log.py） ---
+# 每局游戏事件的追加写日志目录；为空表示不记录
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", "event_logs").strip()
+
+# 单个日志分段的未压缩大小上限（字节），超过后轮转并 gzip 压缩
+EVENT_LOG_SEGMENT_BYTES = int(os.environ.get("EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+
+# 后台写盘的间隔（秒）与批大小：满足其一即写一次
+EVENT_LOG_FLUSH_INTERVAL = float(os.environ.get("EVENT_LOG_FLUSH_INTERVAL", "1.0"))
+EVENT_LOG_BATCH = 2000
+
+# 内存里最多积压的事件数，磁盘跟不上时丢弃新事件而不是阻塞游戏
+EVENT_LOG_MAX_PENDING = 200_000
+
+# --- 玩家战绩 / 排行榜（见 stats_store.py） ---
+# SQLite 文件路径；为空表示不记录战绩
+STATS_DB = os.environ.get("STATS_DB", "stats.db").strip()
+
+# 战绩增量批量写库的间隔（秒）
+STATS_FLUSH_INTERVAL = float(os.environ.get("STATS_FLUSH_INTERVAL", "2"))
+
+# 排行榜缓存的刷新间隔（秒）与条数
+LEADERBOARD_REFRESH_INTERVAL = float(os.environ.get("LEADERBOARD_REFRESH_INTERVAL", "10"))
+LEADERBOARD_SIZE = 100
+
+# 进入生还率排行榜至少需要的判定轮数
+LEADERBOARD_MIN_ROUNDS = 10
@@ -0,0 +1,282 @@
+# Crisis Survival - Event Log
+# 每局游戏发出的事件（关键词、危机、物品、抢夺、判定、得分）追加写入事件日志，供回放 / 审计 / 离线分析
+#
+# 所有房间共用一个追加写的 JSONL 分段文件，每行一条事件（e 是发给客户端的原始消息，含 seq）：
+#   {"r":"ABCD","t":1700000000.123,"e":{...}}                    # 房间广播
+#   {"r":"ABCD","t":1700000000.123,"to":"<player_id>","e":{...}} # 只发给某个玩家的消息
+#
+# 游戏循环只把已经编码好的消息放进内存缓冲，从不等待磁盘；后台任务按批在线程里写盘。
+# 分段超过 EVENT_LOG_SEGMENT_BYTES 时轮转：gzip 压缩，并写一个 room_id -> 行数 的索引，按房间读取时跳过无关分段。
+# 房间码会被复用，同一房间码下 seq 重新从 1 开始即为新的一局（见 split_games）。
+#
+#   python event_log.py --room ABCD          # 以 NDJSON 输出某个房间的全部事件
+#   python event_log.py --since 1700000000   # 某时间之后的所有事件
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional
+
+import metrics
+from config import (
+    EVENT_LOG_DIR, EVENT_LOG_SEGMENT_BYTES, EVENT_LOG_FLUSH_INTERVAL, EVENT_LOG_BATCH, EVENT_LOG_MAX_PENDING
+)
+
+EVENTS_LOGGED = metrics.counter("crisis_event_log_events_total", "Events written to the event log")
+EVENT_LOG_BYTES = metrics.counter("crisis_event_log_bytes_total", "Uncompressed bytes written to the event log")
+EVENTS_DROPPED = metrics.counter(
+    "crisis_event_log_dropped_total", "Events dropped because the writer fell behind or failed")
+EVENT_LOG_FLUSH = metrics.histogram(
+    "crisis_event_log_flush_seconds", "Time to write one batch to disk (in the writer thread)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+class EventLog:
+    """
+    directory: 日志目录；为空时 append 什么也不做
+    segment_bytes: 单个分段的未压缩大小上限，超过即轮转压缩
+    flush_interval / batch_size: 每隔 flush_interval 秒或攒够 batch_size 条写一次
+    max_pending: 内存里最多积压的条数，磁盘跟不上时丢弃新事件而不是拖住游戏循环
+    """
+
+    def __init__(self, directory=EVENT_LOG_DIR, segment_bytes: int = EVENT_LOG_SEGMENT_BYTES,
+                 flush_interval: float = EVENT_LOG_FLUSH_INTERVAL, batch_size: int = EVENT_LOG_BATCH,
+                 max_pending: int = EVENT_LOG_MAX_PENDING):
+        self.directory = Path(directory) if directory else None
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.running = False
+        self.pending: list[tuple[str, str]] = []  # (room_id, 一行 JSON)
+        self.written = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.segments_rotated = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # 以下只在写盘线程里访问
+        self._file = None
+        self._path: Optional[Path] = None
+        self._size = 0
+        self._index: Counter = Counter()
+        self._segment_no = 0
+
+    # ---------- 事件循环侧 ----------
+
+    def append(self, room_id: str, frame: str, target: Optional[str] = None):
+        """记录一条已编码的消息（同步、不做 I/O）；后台写盘任务没在运行时忽略"""
+        if not self.running:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            EVENTS_DROPPED.inc()
+            return
+        to = f',"to":{json.dumps(target)}' if target else ""
+        self.pending.append((room_id, f'{{"r":"{room_id}","t":{time.time():.3f}{to},"e":{frame}}}\n'))
+        if len(self.pending) >= self.batch_size:
+            self._wake.set()
+
+    async def run(self):
+        """后台写盘循环；取消时写完剩余事件并压缩当前分段"""
+        if self.directory is None:
+            return
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.running = True
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # 定时器和 append 攒够一批都只是 set 同一个 Event（不用 wait_for：取消与超时同时发生时它会卡住）
+                timer = loop.call_later(self.flush_interval, self._wake.set)
+                try:
+                    await self._wake.wait()
+                finally:
+                    timer.cancel()
+                self._wake.clear()
+                await self.flush()
+        finally:
+            self.running = False
+            await self.flush()
+            await asyncio.to_thread(self._close_segment)
+
+    async def flush(self):
+        """把当前缓冲交给写盘线程"""
+        if not self.pending:
+            return
+        async with self._lock:
+            batch, self.pending = self.pending, []
+            start = time.perf_counter()
+            write = asyncio.ensure_future(asyncio.to_thread(self._write_batch, batch))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # 线程里已经开始写了：等它写完再把取消传出去，避免和收尾的 flush 同时写文件
+                await asyncio.wait([write])
+                self._account(write, len(batch), start)
+                raise
+            except OSError:
+                pass
+            self._account(write, len(batch), start)
+
+    def _account(self, write: asyncio.Future, count: int, start: float):
+        if write.exception() is not None:
+            print(f"[Warning] Failed to write event log: {write.exception()}")
+            self.dropped += count
+            EVENTS_DROPPED.inc(count)
+            return
+        written_bytes = write.result()
+        EVENT_LOG_FLUSH.observe(time.perf_counter() - start)
+        self.written += count
+        self.bytes_written += written_bytes
+        EVENTS_LOGGED.inc(count)
+        EVENT_LOG_BYTES.inc(written_bytes)
+
+    # ---------- 写盘线程 ----------
+
+    def _open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment_no += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        # 文件名带 pid：多 worker 共用一个目录时各写各的分段
+        self._path = self.directory / f"events-{stamp}-{os.getpid()}-{self._segment_no:04d}.jsonl"
+        self._file = open(self._path, "ab")
+        self._size = 0
+        self._index = Counter()
+
+    def _write_batch(self, batch: list[tuple[str, str]]) -> int:
+        if self._file is None:
+            self._open_segment()
+        data = "".join(line for _, line in batch).encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        for room_id, _ in batch:
+            self._index[room_id] += 1
+        if self._size >= self.segment_bytes:
+            self._close_segment()
+        return len(data)
+
+    def _close_segment(self):
+        """轮转：关闭当前分段，写索引并 gzip 压缩"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        path = self._path
+        index_path = path.with_name(path.name[:-len(".jsonl")] + ".idx.json")
+        index_path.write_text(json.dumps(self._index, separators=(",", ":")), encoding="utf-8")
+        target = path.with_name(path.name + ".gz")
+        tmp = target.with_name(target.name + ".tmp")
+        with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, target)
+        path.unlink()
+        self.segments_rotated += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.directory is not None,
+            "running": self.running,
+            "pending": len(self.pending),
+            "written": self.written,
+            "bytes_written": self.bytes_written,
+            "dropped": self.dropped,
+            "segments_rotated": self.segments_rotated,
+        }
+
+
+# 全局单例（由 server 的 lifespan 启动写盘任务）
+event_log = EventLog()
+
+EVENT_LOG_PENDING = metrics.gauge(
+    "crisis_event_log_pending", "Events buffered in memory waiting to be written",
+    collect=lambda: len(event_log.pending))
+
+
+# ============================================================
+# 读取
+# ============================================================
+
+def list_segments(directory=EVENT_LOG_DIR) -> list[Path]:
+    """按时间顺序列出分段（已压缩的和正在写的）"""
+    path = Path(directory)
+    if not path.is_dir():
+        return []
+    segments = [p for p in path.iterdir() if p.name.startswith("events-")
+                and (p.name.endswith(".jsonl") or p.name.endswith(".jsonl.gz"))]
+    return sorted(segments, key=lambda p: p.name)
+
+
+def _segment_has_room(segment: Path, room_id: str) -> bool:
+    base = segment.name[:-len(".jsonl.gz")] if segment.name.endswith(".gz") else segment.name[:-len(".jsonl")]
+    index_path = segment.with_name(base + ".idx.json")
+    try:
+        return room_id in json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return True  # 没有索引（正在写的分段）：只能逐行看
+
+
+def read_events(directory=EVENT_LOG_DIR, room_id: Optional[str] = None,
+                since: Optional[float] = None) -> Iterator[dict]:
+    """按写入顺序逐条读出事件记录，可按房间码和时间过滤"""
+    prefix = f'{{"r":"{room_id}",' if room_id else None
+    for segment in list_segments(directory):
+        if room_id and not _segment_has_room(segment, room_id):
+            continue
+        for line in read_segment_lines(segment):
+            if prefix and not line.startswith(prefix):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 进程崩溃时最后一行可能不完整
+            if since is not None and record["t"] < since:
+                continue
+            yield record
+
+
+def read_segment_lines(segment: Path) -> Iterator[str]:
+    """逐行读一个分段（原始 JSON 文本，供需要自己快速过滤的离线分析使用）"""
+    if not segment.name.endswith(".gz"):
+        try:
+            f = open(segment, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            segment = segment.with_name(segment.name + ".gz")  # 列目录之后被轮转压缩了
+        else:
+            with f:
+                yield from f
+            return
+    with gzip.open(segment, "rt", encoding="utf-8") as f:
+        yield from f
+
+
+def split_games(records) -> list[list[dict]]:
+    """把同一房间码下的记录按局切开（每局的 seq 从 1 开始）"""
+    games: list[list[dict]] = []
+    for record in records:
+        if record["e"].get("seq") == 1 or not games:
+            games.append([])
+        games[-1].append(record)
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump the game event log as NDJSON")
+    parser.add_argument("--dir", default=EVENT_LOG_DIR or "event_logs")
+    parser.add_argument("--room", help="only this room code")
+    parser.add_argument("--since", type=float, help="only events after this unix timestamp")
+    args = parser.parse_args()
+    for record in read_events(args.dir, args.room.upper() if args.room else None, args.since):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,19 @@
 
 import asyncio
 import random
+import sys
 import time
 from asyncio import Lock
-from dataclasses import dataclass, field
+from collections import deque
+from dataclasses import dataclass, field, fields
 from typing import Optional, Callable
 from enum import Enum
 
+from config import MAX_LIVE_ROOMS, ROOM_GAME_OVER_TTL, ROOM_IDLE_TIMEOUT, ROOM_REPLAY_BUFFER
+from task_supervisor import TaskSupervisor
+from game_runtime import REAL_CLOCK, Transport
+from tracing import Trace
+
 # 搞笑 Bot 名字池
 BOT_NAMES = [
     "躺平大师", "摸鱼冠军", "佛系青年", "咸鱼本鱼",
@@ -28,7 +35,26 @@ class GamePhase(Enum):
     GAME_OVER = "game_over"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
+class Item:
+    """抢夺阶段的物品（不可变，房间、玩家、广播共用同一个实例）"""
+    name: str
+    tier: str
+    pickup_comment: str = "..."
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "Item":
+        return cls(
+            name=str(data.get("name", "???")),
+            tier=sys.intern(str(data.get("tier", "normal"))),
+            pickup_comment=str(data.get("pickup_comment", "...")),
+        )
+    
+    def to_dict(self) -> dict:
+        return {"name": self.name, "tier": self.tier, "pickup_comment": self.pickup_comment}
+
+
+@dataclass(slots=True)
 class Player:
     id: str
     name: str
@@ -36,8 +62,10 @@ class Player:
     is_bot: bool = False
     score: int = 0
     alive: bool = True
-    item: Optional[dict] = None
+    item: Optional[Item] = None
     keyword_choice: Optional[str] = None
+    # 连接在其他 worker 上的玩家记录该 worker 的 id，本地玩家为 None
+    worker_id: Optional[str] = None
     
     def reset_round(self):
         self.alive = True
@@ -47,6 +75,7 @@ class Player:
 
 class BotPlayer(Player):
     """AI 机器人玩家"""
+    __slots__ = ()
     
     def __init__(self):
         name = f"[AI] {random.choice(BOT_NAMES)}"
@@ -56,20 +85,20 @@ class BotPlayer(Player):
             is_bot=True
         )
     
-    async def choose_keyword(self, options: list[str]) -> str:
+    async def choose_keyword(self, options: list[str], clock=REAL_CLOCK) -> str:
         """模拟选择关键词"""
-        await asyncio.sleep(random.uniform(0.5, 1.5))
+        await clock.sleep(random.uniform(0.5, 1.5))
         return random.choice(options)
     
-    async def grab_item(self, available_indices: list[int]) -> int:
+    async def grab_item(self, available_indices: list[int], clock=REAL_CLOCK) -> int:
         """模拟抢夺物品"""
-        await asyncio.sleep(random.uniform(0.5, 2.5))
+        await clock.sleep(random.uniform(0.5, 2.5))
         if available_indices:
             return random.choice(available_indices)
         return -1
 
 
-@dataclass
+@dataclass(slots=True)
 class GameRoom:
     """游戏房间状态"""
     room_id: str
@@ -82,15 +111,57 @@ class GameRoom:
     keyword_options: dict = field(default_factory=dict)  # player_id -> [options]
     collected_keywords: list[str] = field(default_factory=list)
     crisis_data: Optional[dict] = None
-    items: list[dict] = field(default_factory=list)
+    items: list[Item] = field(default_factory=list)
     judgment_results: list[dict] = field(default_factory=list)
+    # 物品可用位图：第 i 位为 1 表示 items[i] 还没被抢
+    available_mask: int = 0
     
     # 规则状态
     consecutive_safe_rounds: int = 0
     
+    # 生命周期（monotonic 时间戳）
+    created_at: float = field(default_factory=time.monotonic)
+    last_activity: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    
+    # 已发出的 LLM 调用数（用于估算提前终止省下的调用）
+    llm_calls_issued: int = 0
+    
+    # 下行消息序号和最近消息的重放缓冲：(seq, 目标 player_id 或 None 表示广播, 消息)
+    next_seq: int = 0
+    outbox: deque = field(default_factory=lambda: deque(maxlen=ROOM_REPLAY_BUFFER), repr=False)
+    
+    # 房间名下的所有任务：游戏循环、Bot 动作、预取
+    tasks: TaskSupervisor = field(init=False, repr=False)
+    
+    # 游戏循环用的时钟和消息传输（headless 模拟时注入虚拟时钟，transport 为 None 时走 WebSocket）
+    clock: object = field(default=REAL_CLOCK, repr=False)
+    transport: Optional[Transport] = field(default=None, repr=False)
+    # 抽中记录时间线时的 trace（见 tracing.py）
+    trace: Optional[Trace] = field(default=None, repr=False)
+    
     # 并发锁
     _grab_lock: Lock = field(default_factory=Lock)
     
+    def __post_init__(self):
+        self.tasks = TaskSupervisor(owner=f"room:{self.room_id}")
+    
+    def touch(self):
+        """记录一次房间活动（阶段切换、玩家操作）"""
+        self.last_activity = time.monotonic()
+    
+    def mark_finished(self):
+        self.phase = GamePhase.GAME_OVER
+        self.finished_at = time.monotonic()
+        self.touch()
+    
+    def is_bot_only(self) -> bool:
+        return all(p.is_bot for p in self.players)
+    
+    def expected_llm_calls(self) -> int:
+        """整局预计的 LLM 调用数：每轮每人一次关键词 + 危机 + 物品 + 判定"""
+        return self.max_rounds * (len(self.players) + 3)
+    
     def add_player(self, player: Player) -> bool:
         if len(self.players) >= 3:
             return False
@@ -112,25 +183,45 @@ class GameRoom:
     def all_items_grabbed(self) -> bool:
         return all(p.item is not None for p in self.players)
     
-    def get_available_items(self) -> list[tuple[int, dict]]:
+    def set_items(self, items: list[dict]):
+        """设置本轮物品，全部标记为可用"""
+        self.items = [Item.from_dict(item) for item in items]
+        self.available_mask = (1 << len(self.items)) - 1
+    
+    def is_item_available(self, item_index: int) -> bool:
+        return isinstance(item_index, int) and item_index >= 0 and bool(self.available_mask >> item_index & 1)
+    
+    def get_available_items(self) -> list[tuple[int, Item]]:
         """返回尚未被抢的物品列表 (index, item)"""
-        grabbed_items = {id(p.item) for p in self.players if p.item is not None}
-        return [(i, item) for i, item in enumerate(self.items) if id(item) not in grabbed_items]
+        mask = self.available_mask
+        return [(i, item) for i, item in enumerate(self.items) if mask >> i & 1]
     
-    async def try_grab_item(self, player: Player, item_index: int) -> Optional[dict]:
+    def claim_item(self, player: Player, item_index: int) -> Optional[Item]:
+        """O(1) 占用物品：玩家已有物品或物品已被抢时返回 None"""
+        if player.item is not None or not self.is_item_available(item_index):
+            return None
+        self.available_mask &= ~(1 << item_index)
+        item = self.items[item_index]
+        player.item = item
+        return item
+    
+    async def try_grab_item(self, player: Player, item_index: int) -> Optional[Item]:
         """线程安全的物品抢夺，返回抢到的物品或None"""
         async with self._grab_lock:
-            if player.item is not None:
-                return None  # 已经有物品了
-            
-            available = self.get_available_items()
-            available_indices = [idx for idx, _ in available]
-            
-            if item_index in available_indices:
-                item = self.items[item_index]
-                player.item = item
-                return item
-            return None
+            return self.claim_item(player, item_index)
+    
+    def record_outbound(self, message: dict, target: Optional[str] = None) -> dict:
+        """给下行消息编号并放入重放缓冲，返回带 seq 的消息"""
+        self.next_seq += 1
+        message = {**message, "seq": self.next_seq}
+        self.outbox.append((self.next_seq, target, message))
+        return message
+    
+    def replay_since(self, last_seq: int, player_id: str) -> tuple[list[dict], bool]:
+        """玩家错过的消息（seq > last_seq）；缓冲里最早的消息已晚于 last_seq + 1 时 complete 为 False"""
+        missed = [m for seq, target, m in self.outbox if seq > last_seq and target in (None, player_id)]
+        complete = not self.outbox or self.outbox[0][0] <= last_seq + 1
+        return missed, complete
     
     def reset_round(self):
         for p in self.players:
@@ -139,6 +230,7 @@ class GameRoom:
         self.collected_keywords = []
         self.crisis_data = None
         self.items = []
+        self.available_mask = 0
         self.judgment_results = []
     
     def to_dict(self) -> dict:
@@ -224,21 +316,148 @@ class MatchmakingQueue:
         return real_players + bots
 
 
+def estimate_size(obj, _seen: Optional[set] = None) -> int:
+    """粗略估算对象及其引用的容器/数据类占用的字节数"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, _seen) for v in obj)
+    elif isinstance(obj, (Player, GameRoom, Item)):
+        # websocket / 锁 / 任务组不归房间数据所有，不计入
+        size += sum(
+            estimate_size(getattr(obj, f.name), _seen) for f in fields(obj)
+            if f.name not in ("websocket", "_grab_lock", "tasks", "clock", "transport", "trace")
+        )
+    return size
+
+
+class RoomReaper:
+    """
+    房间生命周期管理器：回收已结束、闲置或只剩 Bot 的房间。
+    
+    - GAME_OVER 的房间保留 game_over_ttl 秒后回收
+    - 只剩 Bot 的房间立即回收（没人看了）
+    - 超过 idle_timeout 秒没有任何活动的房间回收
+    """
+    
+    def __init__(self, manager: "GameManager",
+                 game_over_ttl: float = ROOM_GAME_OVER_TTL,
+                 idle_timeout: float = ROOM_IDLE_TIMEOUT):
+        self.manager = manager
+        self.game_over_ttl = game_over_ttl
+        self.idle_timeout = idle_timeout
+        self.on_evict_callback: Optional[Callable[[GameRoom, str], None]] = None
+        
+        # 统计
+        self.rooms_reaped = 0
+        self.bytes_reclaimed = 0
+        self.reaped_by_reason: dict[str, int] = {"game_over": 0, "bot_only": 0, "idle": 0}
+    
+    def eviction_reason(self, room: GameRoom, now: Optional[float] = None) -> Optional[str]:
+        """返回房间应被回收的原因，不该回收则返回 None"""
+        now = time.monotonic() if now is None else now
+        if room.phase == GamePhase.GAME_OVER:
+            finished_at = room.finished_at if room.finished_at is not None else room.last_activity
+            if now - finished_at >= self.game_over_ttl:
+                return "game_over"
+            return None
+        if room.is_bot_only():
+            return "bot_only"
+        if now - room.last_activity >= self.idle_timeout:
+            return "idle"
+        return None
+    
+    def evict(self, room: GameRoom, reason: str):
+        size = estimate_size(room)
+        if self.manager.remove_room(room.room_id) is None:
+            return
+        self.rooms_reaped += 1
+        self.bytes_reclaimed += size
+        self.reaped_by_reason[reason] = self.reaped_by_reason.get(reason, 0) + 1
+        if self.on_evict_callback:
+            self.on_evict_callback(room, reason)
+    
+    def reap(self, now: Optional[float] = None) -> int:
+        """扫描一遍所有房间，返回本次回收的数量"""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        for room in list(self.manager.rooms.values()):
+            reason = self.eviction_reason(room, now)
+            if reason:
+                self.evict(room, reason)
+                evicted += 1
+        return evicted
+    
+    async def run(self, interval: float):
+        """后台定期回收"""
+        while True:
+            await asyncio.sleep(interval)
+            self.reap()
+    
+    def get_stats(self) -> dict:
+        return {
+            "live_rooms": len(self.manager.rooms),
+            "room_tasks": sum(len(r.tasks) for r in self.manager.rooms.values()),
+            "max_rooms": self.manager.max_rooms,
+            "rooms_reaped": self.rooms_reaped,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "reaped_by_reason": dict(self.reaped_by_reason),
+        }
+
+
 class GameManager:
     """全局游戏管理器"""
     
-    def __init__(self):
+    def __init__(self, max_rooms: int = MAX_LIVE_ROOMS):
         self.rooms: dict[str, GameRoom] = {}
         self.matchmaking = MatchmakingQueue()
         self.player_room_map: dict[str, str] = {}  # player_id -> room_id
+        self.max_rooms = max_rooms
+        self.reaper = RoomReaper(self)
+        # 共享状态后端（state_backend.StateBackend），负责跨 worker 的房间码占用
+        self.backend = None
     
-    def create_room(self) -> GameRoom:
-        """创建新房间"""
+    def create_room(self) -> Optional[GameRoom]:
+        """创建新房间，房间数达到上限且回收不出空位时返回 None"""
+        if len(self.rooms) >= self.max_rooms:
+            self.reaper.reap()
+            if len(self.rooms) >= self.max_rooms:
+                return None
         room_id = self._generate_room_id()
         room = GameRoom(room_id=room_id)
         self.rooms[room_id] = room
         return room
     
+    async def open_room(self) -> Optional[GameRoom]:
+        """创建房间，并在共享后端上占用房间码（与其他 worker 冲突时重新生成）"""
+        while True:
+            room = self.create_room()
+            if room is None or self.backend is None:
+                return room
+            if await self.backend.claim_room_id(room.room_id):
+                return room
+            del self.rooms[room.room_id]
+    
+    def remove_room(self, room_id: str) -> Optional[GameRoom]:
+        """删除房间：取消房间名下的任务，并清理仍指向该房间的玩家映射"""
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return None
+        room.tasks.shutdown()
+        if self.backend is not None:
+            self.backend.release_room_id(room_id)
+        for p in room.players:
+            if self.player_room_map.get(p.id) == room_id:
+                del self.player_room_map[p.id]
+        return room
+    
     def get_room(self, room_id: str) -> Optional[GameRoom]:
         return self.rooms.get(room_id)
     
@@ -262,7 +481,7 @@ class GameManager:
             
             # 如果房间空了，删除房间
             if not room.players:
-                del self.rooms[room.room_id]
+                self.remove_room(room.room_id)
     
     def _generate_room_id(self) -> str:
         """生成 4 位大写字母房间码"""
@@ -0,0 +1,77 @@
+# Crisis Survival Web - Game Runtime
+# 游戏循环的可注入依赖：时钟（sleep / now）+ 传输（消息发给谁、房间是否还有人）
+
+import asyncio
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class RealClock:
+    """真实时间"""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, delay: float):
+        await asyncio.sleep(delay)
+
+
+class VirtualClock:
+    """
+    虚拟时间：sleep 不占用真实时间。
+
+    所有 sleep 按到期时间排队，驱动任务每次先让出几轮事件循环，
+    让其他就绪的协程跑到下一个等待点，再把时间直接推进到最早的到期点。
+    一局游戏用一个独立的 VirtualClock，now() 即这局游戏经过的虚拟秒数。
+    """
+
+    def __init__(self, start: float = 0.0, settle_rounds: int = 2):
+        self._now = start
+        self.settle_rounds = settle_rounds
+        self._timers: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._driver: Optional[asyncio.Task] = None
+
+    def now(self) -> float:
+        return self._now
+
+    async def sleep(self, delay: float):
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self._now + delay, next(self._seq), fut))
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._drive())
+        await fut
+
+    async def _drive(self):
+        while self._timers:
+            for _ in range(self.settle_rounds):
+                await asyncio.sleep(0)
+            deadline, _, fut = heapq.heappop(self._timers)
+            if fut.done():
+                continue  # 等待方已被取消
+            self._now = max(self._now, deadline)
+            fut.set_result(None)
+
+
+REAL_CLOCK = RealClock()
+
+
+class Transport(ABC):
+    """房间消息的投递方式"""
+
+    @abstractmethod
+    async def send(self, player, message: dict):
+        """发消息给房间里的一个真人玩家"""
+
+    @abstractmethod
+    def has_audience(self, room) -> bool:
+        """房间里是否还有人在收消息；没有时游戏循环会提前终止"""
+
+    def on_broadcast(self, room, message: dict):
+        """每条房间广播调用一次（不论有几个接收者），用于观察 / 统计"""
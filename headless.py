@@ -0,0 +1,180 @@
+# Crisis Survival - Headless Simulation Runner
+# 无界面、虚拟时钟下批量跑纯 Bot 对局，用于平衡性调整和回归检查
+#
+# 用法：
+#   python headless.py --games 2000 --concurrency 500          # 离线 fallback 内容
+#   python headless.py --games 2000 --llm mock --seed 42       # 随机生死的 Mock LLM
+#   python headless.py --games 50 --llm real                   # 真实 DeepSeek（很慢，花钱）
+#   python headless.py --games 500 --llm cassette --cassette cassettes/run1.jsonl.gz  # 回放录制的真实输出
+#   python headless.py --games 20000 --llm mock --outcomes run.npz  # 判定结果存成 npz，见 judgment_analytics.py
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+
+from ai_module import install_cassette, set_llm_override
+from game_manager import GameRoom, BotPlayer
+from game_runtime import Transport, VirtualClock
+from mock_llm import MockLLM
+import server
+
+
+class HeadlessTransport(Transport):
+    """不发任何消息，只记录房间广播里和平衡性相关的事件"""
+
+    def __init__(self):
+        self.messages = 0
+        self.tiers: dict[str, str] = {}  # 本轮 player name -> 物品品质
+        self.force_death = False
+        # (round, tier, survived, force_death, position, n_players)；position 是玩家在判定 prompt 里的顺序
+        self.outcomes: list[tuple[int, str, bool, bool, int, int]] = []
+        self.round = 0
+        self.rankings: list[dict] = []
+        self.tiebreak = False
+
+    async def send(self, player, message: dict):
+        self.messages += 1
+
+    def has_audience(self, room) -> bool:
+        return True  # 没有真人也要跑完
+
+    def on_broadcast(self, room, message: dict):
+        kind = message.get("type")
+        if kind == "round_start":
+            self.round = message["round"]
+            self.tiers = {}
+        elif kind == "item_grabbed":
+            self.tiers[message["player"]] = message["tier"]
+        elif kind == "judging":
+            self.force_death = message.get("force_death", False)
+        elif kind == "judgment_result":
+            tier = message.get("tier") or self.tiers.get(message["player"], "trash")
+            names = [p.name for p in room.players]
+            position = names.index(message["player"]) if message["player"] in names else 0
+            self.outcomes.append((self.round, tier, message["survived"], self.force_death, position, len(names)))
+        elif kind == "game_over":
+            self.rankings = message["rankings"]
+            self.tiebreak = message.get("tiebreaker_reason") is not None
+
+
+def make_bots(n: int) -> list[BotPlayer]:
+    """生成名字互不相同的 Bot（判定结果按名字对应玩家）"""
+    bots: list[BotPlayer] = []
+    names: set[str] = set()
+    while len(bots) < n:
+        bot = BotPlayer()
+        if bot.name not in names:
+            names.add(bot.name)
+            bots.append(bot)
+    return bots
+
+
+async def play_one(game_no: int, rounds: int) -> tuple[HeadlessTransport, float]:
+    clock = VirtualClock()
+    transport = HeadlessTransport()
+    room = GameRoom(room_id=f"H{game_no:06d}", max_rounds=rounds, clock=clock, transport=transport)
+    for bot in make_bots(3):
+        room.add_player(bot)
+    try:
+        await server.run_game_loop(room)
+    finally:
+        await room.tasks.close()
+    return transport, clock.now()
+
+
+def summarize(results: list[tuple[HeadlessTransport, float]], wall: float):
+    games = len(results)
+    outcomes = [o for t, _ in results for o in t.outcomes]
+    by_tier: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    by_forced: dict[bool, list[int]] = defaultdict(lambda: [0, 0])
+    deaths_per_round: Counter = Counter()
+    round_deaths: dict[tuple[int, int], int] = defaultdict(int)
+    for i, (t, _) in enumerate(results):
+        for rnd, tier, survived, forced, *_ in t.outcomes:
+            by_tier[tier][0] += survived
+            by_tier[tier][1] += 1
+            by_forced[forced][0] += survived
+            by_forced[forced][1] += 1
+            round_deaths[(i, rnd)] += not survived
+    deaths_per_round.update(round_deaths.values())
+    winner_scores = Counter(t.rankings[0]["score"] for t, _ in results if t.rankings)
+    virtual = sum(v for _, v in results)
+
+    print(f"\n=== Headless 模拟结果 ===")
+    print(f"对局数: {games}    判定数: {len(outcomes)}")
+    print(f"真实耗时: {wall:.2f}s    吞吐: {games / wall * 60:.0f} 局/分钟")
+    print(f"平均虚拟时长: {virtual / max(games, 1):.1f}s/局    加速比: {virtual / max(wall, 1e-9):.0f}x")
+    print(f"平均每局发送消息: {sum(t.messages for t, _ in results) / max(games, 1):.1f}")
+
+    print("\n生还率（按物品品质）:")
+    for tier in ("legendary", "normal", "trash"):
+        survived, total = by_tier.get(tier, [0, 0])
+        if total:
+            print(f"  {tier:<10} {survived / total:6.1%}  (n={total})")
+    print("生还率（按是否强制死亡轮）:")
+    for forced in (False, True):
+        survived, total = by_forced.get(forced, [0, 0])
+        if total:
+            print(f"  force_death={forced!s:<5} {survived / total:6.1%}  (n={total})")
+    print("每轮死亡人数分布:")
+    for deaths in sorted(deaths_per_round):
+        print(f"  {deaths} 人: {deaths_per_round[deaths] / max(sum(deaths_per_round.values()), 1):6.1%}")
+    print("冠军得分分布:")
+    for score in sorted(winner_scores):
+        print(f"  {score} 分: {winner_scores[score] / games:6.1%}")
+    print(f"平分决胜比例: {sum(t.tiebreak for t, _ in results) / max(games, 1):.1%}")
+
+
+def save_outcomes(results: list[tuple[HeadlessTransport, float]], path: str):
+    """把全部判定结果存成列式 npz，交给 judgment_analytics.py 分析"""
+    from judgment_analytics import Outcomes  # numpy 只有离线分析需要
+
+    rows = []
+    for game_no, (t, _) in enumerate(results):
+        for rnd, tier, survived, forced, position, n_players in t.outcomes:
+            rows.append((tier, position, n_players, rnd, forced, survived, game_no * 256 + rnd, 0.0))
+    Outcomes.from_rows(rows).save(path)
+    print(f"判定结果已保存: {path} ({len(rows)} 行)")
+
+
+async def main(args):
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.llm == "offline":
+        async def offline(prompt: str) -> str:
+            return ""  # 走 ai_module 内置 fallback
+        set_llm_override(offline)
+    elif args.llm == "mock":
+        set_llm_override(MockLLM(seed=args.seed, death_rate=args.death_rate))
+    elif args.llm == "cassette":
+        install_cassette(args.cassette, "replay", latency="zero")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(game_no: int):
+        async with semaphore:
+            return await play_one(game_no, args.rounds)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(i) for i in range(args.games)))
+    summarize(results, time.perf_counter() - start)
+    if args.outcomes:
+        save_outcomes(results, args.outcomes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run bot-only games headless on a virtual clock")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--llm", choices=["offline", "mock", "real", "cassette"], default="offline")
+    parser.add_argument("--death-rate", type=float, default=0.35, help="mock LLM 非强制轮的死亡概率")
+    parser.add_argument("--cassette", default=None, help="--llm cassette 时回放的文件（见 llm_cassette.py）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--outcomes", default=None, help="判定结果存成 npz（见 judgment_analytics.py）")
+    args = parser.parse_args()
+    if args.llm == "cassette" and not args.cassette:
+        parser.error("--llm cassette requires --cassette")
+    asyncio.run(main(args))
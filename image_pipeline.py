@@ -0,0 +1,301 @@
+# Crisis Survival - Image Pipeline
+# 危机 / 判定配图的后台生成：文字照常立即公布，图片生成好后再推给客户端（image_ready），从不阻塞游戏循环
+#
+# - 按 prompt 哈希寻址的磁盘缓存：同一个 prompt（例如 fallback 的 "survivor scene"）只生成一次
+# - 同一 prompt 正在生成时，新的请求只挂一个回调，不重复生成
+# - 固定数量的 worker 控制并发；排队超过上限时直接丢弃（只是少一张图）
+# - 后端：replicate（真实生成）或 mock（本地按 prompt 画一张 SVG，离线可测）
+#
+# 图片由 server 的 /images/{name} 提供，文件名即内容哈希，可以永久缓存。
+
+import asyncio
+import hashlib
+import html
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import metrics
+from config import (
+    ENABLE_IMAGE_GENERATION, IMAGE_BACKEND, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CONCURRENCY,
+    IMAGE_MAX_PENDING, IMAGE_TIMEOUT, REPLICATE_API_KEY, REPLICATE_MODEL
+)
+
+IMAGE_REQUESTS = metrics.counter(
+    "crisis_image_requests_total", "Image requests by outcome (cache_hit / joined / queued / dropped)", ["outcome"])
+IMAGE_FAILURES = metrics.counter("crisis_image_failures_total", "Image generations that failed or timed out")
+IMAGE_GENERATION = metrics.histogram(
+    "crisis_image_generation_seconds", "Time to generate and store one image",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+EXTENSIONS = {"image/svg+xml": "svg", "image/png": "png", "image/webp": "webp", "image/jpeg": "jpg"}
+MEDIA_TYPES = {ext: media for media, ext in EXTENSIONS.items()}
+
+
+class ImageGenerationError(Exception):
+    """后端没能生成图片"""
+
+
+# ============================================================
+# 后端
+# ============================================================
+
+class MockImageBackend:
+    """按 prompt 确定性地画一张 SVG（颜色取自哈希），可加延迟模拟真实生成"""
+
+    name = "mock"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    async def generate(self, prompt: str) -> tuple[bytes, str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        hue = int(digest[:4], 16) % 360
+        svg = (
+            '<svg xmlns="http://www.w3.org/2000/svg" width="512" height="288" viewBox="0 0 512 288">'
+            '<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+            f'<stop offset="0" stop-color="hsl({hue},70%,35%)"/>'
+            f'<stop offset="1" stop-color="hsl({(hue + 120) % 360},70%,20%)"/>'
+            '</linearGradient></defs><rect width="512" height="288" fill="url(#g)"/>'
+            f'<circle cx="{int(digest[4:6], 16) * 2}" cy="{int(digest[6:8], 16)}" r="60" '
+            f'fill="hsl({(hue + 240) % 360},80%,60%)" opacity="0.5"/>'
+            '<text x="256" y="270" font-family="sans-serif" font-size="14" fill="#fff" text-anchor="middle">'
+            f'{html.escape(prompt[:80])}</text></svg>'
+        )
+        return svg.encode("utf-8"), "svg"
+
+    async def close(self):
+        pass
+
+
+class ReplicateImageBackend:
+    """Replicate 的 predictions 接口：同步等待（Prefer: wait），没等到就轮询，最后把图片下载到本地缓存"""
+
+    name = "replicate"
+    API = "https://api.replicate.com/v1"
+
+    def __init__(self, api_key: str = REPLICATE_API_KEY, model: str = REPLICATE_MODEL, timeout: float = IMAGE_TIMEOUT):
+        import httpx  # openai SDK 的依赖，只有真正用 Replicate 时才需要
+
+        self.model = model
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}"}, timeout=httpx.Timeout(timeout, connect=10))
+
+    async def generate(self, prompt: str) -> tuple[bytes, str]:
+        deadline = time.monotonic() + self.timeout
+        response = await self.client.post(
+            f"{self.API}/models/{self.model}/predictions",
+            json={"input": {"prompt": prompt}}, headers={"Prefer": "wait=55"})
+        response.raise_for_status()
+        prediction = response.json()
+        while prediction.get("status") not in ("succeeded", "failed", "canceled"):
+            if time.monotonic() > deadline:
+                raise ImageGenerationError("prediction timed out")
+            await asyncio.sleep(1)
+            response = await self.client.get(prediction["urls"]["get"])
+            response.raise_for_status()
+            prediction = response.json()
+        if prediction["status"] != "succeeded" or not prediction.get("output"):
+            raise ImageGenerationError(f"prediction {prediction.get('status')}: {prediction.get('error')}")
+        output = prediction["output"]
+        url = output[0] if isinstance(output, list) else output
+        image = await self.client.get(url)
+        image.raise_for_status()
+        media_type = image.headers.get("content-type", "").split(";")[0].strip()
+        extension = EXTENSIONS.get(media_type) or url.rsplit(".", 1)[-1].lower()
+        if extension not in MEDIA_TYPES:
+            raise ImageGenerationError(f"unexpected image type {media_type!r}")
+        return image.content, extension
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_image_backend(kind: str = IMAGE_BACKEND):
+    if kind == "replicate":
+        return ReplicateImageBackend()
+    if kind != "mock":
+        print(f"[Warning] Unknown IMAGE_BACKEND {kind!r}, using mock")
+    return MockImageBackend()
+
+
+# ============================================================
+# 管线
+# ============================================================
+
+class ImagePipeline:
+    """
+    enabled: 为 False 时 request 什么也不做
+    backend: 为空时 run() 启动时按 IMAGE_BACKEND 创建
+    cache_dir: 内容寻址的图片缓存目录；max_bytes 超出时删除最旧的文件
+    concurrency / max_pending: 同时生成数与排队上限
+    """
+
+    def __init__(self, enabled: bool = ENABLE_IMAGE_GENERATION, backend=None, cache_dir=IMAGE_CACHE_DIR,
+                 max_bytes: int = IMAGE_CACHE_MAX_BYTES, concurrency: int = IMAGE_CONCURRENCY,
+                 max_pending: int = IMAGE_MAX_PENDING, timeout: float = IMAGE_TIMEOUT, url_prefix: str = "/images/"):
+        self.enabled = enabled and bool(cache_dir)
+        self.backend = backend
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.url_prefix = url_prefix
+        self.running = False
+        self.cached: dict[str, str] = {}  # key -> 文件名
+        self.cache_bytes = 0
+        self.inflight: dict[str, list[Callable[[str], None]]] = {}  # key -> 等这张图的回调
+        self.generated = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._evicting = False
+
+    def key(self, prompt: str) -> str:
+        """缓存键：后端 + prompt 的哈希（换后端不会拿到另一个后端的图）"""
+        backend = self.backend.name if self.backend is not None else IMAGE_BACKEND
+        return hashlib.sha256(f"{backend}\n{prompt}".encode("utf-8")).hexdigest()[:32]
+
+    # ---------- 事件循环侧 ----------
+
+    def request(self, prompt: Optional[str], on_ready: Callable[[str], None]) -> bool:
+        """
+        请求一张图（同步、不等待）。图片就绪时以其 URL 调用 on_ready；缓存命中时在下一轮事件循环回调。
+        返回 False 表示不会有图（未启用、prompt 为空、队列已满）。
+        """
+        if not self.running or not isinstance(prompt, str) or not prompt.strip():
+            return False
+        prompt = prompt.strip()
+        key = self.key(prompt)
+        filename = self.cached.get(key)
+        if filename is not None:
+            IMAGE_REQUESTS.inc(outcome="cache_hit")
+            asyncio.get_running_loop().call_soon(on_ready, self.url_prefix + filename)
+            return True
+        waiters = self.inflight.get(key)
+        if waiters is not None:
+            IMAGE_REQUESTS.inc(outcome="joined")
+            waiters.append(on_ready)
+            return True
+        if self._queue.qsize() >= self.max_pending:
+            IMAGE_REQUESTS.inc(outcome="dropped")
+            return False
+        IMAGE_REQUESTS.inc(outcome="queued")
+        self.inflight[key] = [on_ready]
+        self._queue.put_nowait((key, prompt))
+        return True
+
+    async def run(self):
+        """加载缓存索引并启动 worker；取消时丢弃还没生成的请求"""
+        if not self.enabled:
+            return
+        if self.backend is None:
+            self.backend = create_image_backend()
+        await asyncio.to_thread(self._scan_cache)
+        self._queue = asyncio.Queue()
+        self.running = True
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        finally:
+            self.running = False
+            self.inflight.clear()
+            await self.backend.close()
+
+    async def _worker(self):
+        while True:
+            key, prompt = await self._queue.get()
+            start = time.perf_counter()
+            try:
+                data, extension = await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+                filename = f"{key}.{extension}"
+                await asyncio.to_thread(self._write, filename, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                IMAGE_FAILURES.inc()
+                print(f"[Warning] Image generation failed ({type(e).__name__}: {e})")
+                self.inflight.pop(key, None)
+                continue
+            IMAGE_GENERATION.observe(time.perf_counter() - start)
+            self.generated += 1
+            self.cached[key] = filename
+            self.cache_bytes += len(data)
+            for on_ready in self.inflight.pop(key, ()):
+                try:
+                    on_ready(self.url_prefix + filename)
+                except Exception as e:
+                    print(f"[Warning] Image ready callback failed: {e}")
+            if self.cache_bytes > self.max_bytes and not self._evicting:
+                await self._evict()
+
+    async def _evict(self):
+        """删除最旧的文件，直到缓存回到上限的 90%（同一时间只有一个 worker 在清理）"""
+        self._evicting = True
+        try:
+            removed = await asyncio.to_thread(self._remove_oldest, self.cache_bytes - int(self.max_bytes * 0.9))
+        except OSError as e:
+            print(f"[Warning] Failed to evict image cache: {e}")
+            return
+        finally:
+            self._evicting = False
+        for filename, size in removed:
+            self.cached.pop(filename.partition(".")[0], None)
+            self.cache_bytes -= size
+
+    # ---------- 磁盘（线程里执行，缓存索引只在事件循环里改） ----------
+
+    def _scan_cache(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.cache_dir.iterdir():
+            key, _, extension = path.name.partition(".")
+            if extension in MEDIA_TYPES and len(key) == 32:
+                self.cached[key] = path.name
+                self.cache_bytes += path.stat().st_size
+
+    def _write(self, filename: str, data: bytes):
+        path = self.cache_dir / filename
+        tmp = path.with_name(filename + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _remove_oldest(self, to_free: int) -> list[tuple[str, int]]:
+        files = sorted((p for p in self.cache_dir.iterdir() if p.suffix.lstrip(".") in MEDIA_TYPES),
+                       key=lambda p: p.stat().st_mtime)
+        removed = []
+        for path in files:
+            if to_free <= 0:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            removed.append((path.name, size))
+            to_free -= size
+        return removed
+
+    def path_of(self, filename: str) -> Optional[Path]:
+        """/images/{filename} 对应的缓存文件；文件名不合法或不存在时返回 None"""
+        key, _, extension = filename.partition(".")
+        if self.cache_dir is None or extension not in MEDIA_TYPES or self.cached.get(key) != filename:
+            return None
+        return self.cache_dir / filename
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "backend": self.backend.name if self.backend is not None else IMAGE_BACKEND,
+            "cached": len(self.cached),
+            "cache_bytes": self.cache_bytes,
+            "inflight": len(self.inflight),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "generated": self.generated,
+            "failed": self.failed,
+        }
+
+
+# 全局单例（由 server 的 lifespan 启动 worker）
+image_pipeline = ImagePipeline()
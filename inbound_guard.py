@@ -0,0 +1,138 @@
+# Crisis Survival - Inbound Guard
+# WebSocket 入站消息在分发之前的检查：帧大小、JSON 格式、消息结构、每连接令牌桶限流
+#
+# 被拒绝的消息直接丢弃（不回复，免得给刷消息的客户端放大流量），只计数；
+# 同一连接短时间内被拒绝太多次（或发来超大帧）就断开，它占用的队列 / 房间交给正常的断线流程处理。
+
+import json
+import time
+from typing import Optional
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import metrics
+from config import WS_MAX_FRAME_BYTES, WS_RATE_LIMIT, WS_RATE_BURST, WS_MAX_VIOLATIONS
+
+INBOUND_REJECTED = metrics.counter(
+    "crisis_ws_inbound_rejected_total", "Inbound WebSocket messages dropped before dispatch by reason", ["reason"])
+OFFENDERS_DROPPED = metrics.counter(
+    "crisis_ws_offenders_dropped_total", "Connections closed for abusive inbound traffic by reason", ["reason"])
+
+# WebSocket 关闭码
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TOO_BIG = 1009
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# 消息类型 -> (令牌消耗, {字段: 校验函数})；不在表里的类型一律拒绝，多余字段忽略
+# start_matching / start_solo 会创建匹配任务或房间，消耗更多令牌
+MESSAGE_SCHEMAS = {
+    "pong": (1, {}),
+    "start_matching": (5, {}),
+    "cancel_matching": (1, {}),
+    "start_solo": (5, {}),
+    "exit_game": (1, {}),
+    "keyword_choice": (1, {"choice": lambda v: isinstance(v, str) and 0 < len(v) <= 64}),
+    "grab_item": (1, {"index": lambda v: _is_int(v) and 0 <= v < 100}),
+}
+
+
+def validate(data) -> tuple[Optional[str], int]:
+    """返回 (拒绝原因, 令牌消耗)；原因为 None 表示通过"""
+    if not isinstance(data, dict):
+        return "invalid", 1
+    schema = MESSAGE_SCHEMAS.get(data.get("type"))
+    if schema is None:
+        return "unknown_type", 1
+    cost, fields = schema
+    for name, check in fields.items():
+        if not check(data.get(name)):
+            return "invalid", cost
+    return None, cost
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个，最多 burst 个"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class InboundGuard:
+    """
+    每个连接一个。receive() 只返回通过检查的消息；需要断开时抛出 WebSocketDisconnect，
+    调用方按普通断线处理即可。
+    """
+
+    def __init__(self, websocket: WebSocket, max_frame_bytes: int = WS_MAX_FRAME_BYTES,
+                 rate: float = WS_RATE_LIMIT, burst: float = WS_RATE_BURST,
+                 max_violations: int = WS_MAX_VIOLATIONS):
+        self.websocket = websocket
+        self.max_frame_bytes = max_frame_bytes
+        self.bucket = TokenBucket(rate, burst)
+        # 违规额度也是一个令牌桶：偶尔的误操作会慢慢恢复，持续刷消息很快耗尽
+        self.strikes = TokenBucket(1.0, max_violations)
+        self.rejected = 0
+
+    async def receive_frame(self) -> str:
+        """收一个原始帧（文本或二进制），超过大小上限（UTF-8 字节数）直接断开"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        raw = message.get("text")
+        data = raw.encode("utf-8") if raw is not None else (message.get("bytes") or b"")
+        if len(data) > self.max_frame_bytes:
+            INBOUND_REJECTED.inc(reason="too_large")
+            await self.drop("too_large", CLOSE_TOO_BIG)
+        return raw if raw is not None else data.decode("utf-8", errors="replace")
+
+    async def receive(self) -> dict:
+        """下一条合法消息（跳过被拒绝的）"""
+        while True:
+            raw = await self.receive_frame()
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                await self.reject("bad_json")
+                continue
+            reason, cost = validate(data)
+            if reason is not None:
+                await self.reject(reason)
+                continue
+            if not self.bucket.take(cost):
+                await self.reject("rate_limited")
+                continue
+            return data
+
+    async def reject(self, reason: str):
+        """丢弃一条消息并记一次违规；额度耗尽时断开"""
+        self.rejected += 1
+        INBOUND_REJECTED.inc(reason=reason)
+        if not self.strikes.take():
+            await self.drop("too_many_violations", CLOSE_POLICY_VIOLATION)
+
+    async def drop(self, reason: str, code: int):
+        OFFENDERS_DROPPED.inc(reason=reason)
+        print(f"[Warning] Dropping WebSocket connection ({reason}, {self.rejected} rejected messages)")
+        try:
+            await self.websocket.close(code=code)
+        except RuntimeError:
+            pass  # 已经关闭
+        raise WebSocketDisconnect(code)
@@ -0,0 +1,320 @@
+# Crisis Survival - Judgment Fairness Analytics
+# 检查 judge_batch_survival 是否真的"随机"：按物品等级、玩家位置、是否强制死亡统计生还率（含置信区间），
+# 发现偏向（例如偏爱 legendary、总让最后一个玩家死）或与基线相比的漂移（换模型 / 改 prompt 之后）。
+#
+# 判定结果按列存成 NumPy 数组，分组统计全部是 bincount，几百万行在秒级以内。
+#
+#   python headless.py --games 20000 --llm cassette --cassette run.jsonl.gz --outcomes run.npz
+#   python judgment_analytics.py --npz run.npz --save-baseline baselines/judgment.json
+#   python judgment_analytics.py --event-log event_logs --since 1700000000 --baseline baselines/judgment.json
+#
+# 有偏向或漂移时退出码为 1，可以放进换模型 / 改 prompt 之后的检查流程。
+
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from event_log import list_segments, read_segment_lines
+
+TIERS = ("legendary", "normal", "trash")
+TIER_CODES = {t: i for i, t in enumerate(TIERS)}
+MAX_POSITIONS = 3  # 房间最多 3 人
+
+# 偏向判定：差异超过 TOLERANCE（绝对生还率）且显著性 p < ALPHA 才报警（样本很大时任何微小差异都会"显著"）
+DEFAULT_TOLERANCE = 0.05
+DEFAULT_ALPHA = 0.001
+Z_95 = 1.959964
+
+
+class Outcomes:
+    """
+    判定结果的列式存储，每行是一名玩家一轮的判定：
+    tier / position（在判定 prompt 里的顺序，0 起）/ n_players / round / force_death / survived /
+    round_id（同一局同一轮相同，用于按轮聚合）/ t（事件时间，headless 为 0）
+    """
+
+    COLUMNS = ("tier", "position", "n_players", "round", "force_death", "survived", "round_id", "t")
+    DTYPES = (np.int8, np.int8, np.int8, np.int8, np.bool_, np.bool_, np.int64, np.float64)
+
+    def __init__(self, **columns):
+        for name, dtype in zip(self.COLUMNS, self.DTYPES):
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+
+    def __len__(self) -> int:
+        return len(self.survived)
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple]) -> "Outcomes":
+        """rows: [(tier 名, position, n_players, round, force_death, survived, round_id, t)]"""
+        if not rows:
+            return cls(**{name: [] for name in cls.COLUMNS})
+        tier, *rest = zip(*rows)
+        codes = [TIER_CODES.get(t, TIER_CODES["trash"]) for t in tier]
+        return cls(**dict(zip(cls.COLUMNS, [codes, *rest])))
+
+    def select(self, mask: np.ndarray) -> "Outcomes":
+        return Outcomes(**{name: getattr(self, name)[mask] for name in self.COLUMNS})
+
+    def save(self, path):
+        np.savez_compressed(path, **{name: getattr(self, name) for name in self.COLUMNS})
+
+    @classmethod
+    def load(cls, path) -> "Outcomes":
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.COLUMNS})
+
+
+# ============================================================
+# 加载
+# ============================================================
+
+# 只有这几类消息和判定统计有关，其余行不做 JSON 解析
+_RELEVANT = ("round_start", "judging", "judgment_result", "round_end", "game_starting")
+_TYPE_MARK = '"e":{"type":"'
+
+
+def load_event_log(directory, since: Optional[float] = None) -> Outcomes:
+    """
+    从事件日志（见 event_log.py）还原判定结果。
+
+    玩家位置取 round_end 里的玩家顺序（即 room.players，也是判定 prompt 里的顺序）；
+    没等到 round_end 的轮（房间被弃）退回用开局时的顺序。
+    """
+    rows: list[tuple] = []
+    rooms: dict[str, dict] = {}  # room_id -> 当前这局的解析状态
+    next_round_id = 0
+
+    def settle(state: dict, order: list[str]):
+        for name, tier, survived, t in state["pending"]:
+            if name in order:
+                rows.append((tier, order.index(name), len(order), state["round"], state["force"],
+                             survived, state["round_id"], t))
+        state["pending"] = []
+
+    for segment in list_segments(directory):
+        for line in read_segment_lines(segment):
+            start = line.find(_TYPE_MARK)
+            if start < 0:
+                continue
+            start += len(_TYPE_MARK)
+            kind = line[start:line.find('"', start)]
+            new_game = line.endswith(',"seq":1}}\n')
+            if kind not in _RELEVANT and not new_game:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and record["t"] < since:
+                continue
+            room_id, message = record["r"], record["e"]
+
+            state = rooms.get(room_id)
+            if new_game or state is None:
+                if state is not None:
+                    settle(state, state["order"])
+                state = rooms[room_id] = {"round": 0, "force": False, "pending": [], "order": [], "round_id": -1}
+
+            if kind == "game_starting":
+                if not state["order"]:
+                    state["order"] = [p["name"] for p in message.get("players", [])]
+            elif kind == "round_start":
+                settle(state, state["order"])
+                state["round"] = message.get("round", 0)
+                state["round_id"] = next_round_id
+                next_round_id += 1
+            elif kind == "judging":
+                state["force"] = bool(message.get("force_death", False))
+            elif kind == "judgment_result":
+                state["pending"].append((message.get("player"), message.get("tier", "trash"),
+                                         bool(message.get("survived", True)), record["t"]))
+            elif kind == "round_end":
+                order = [s["name"] for s in message.get("scores", [])]
+                state["order"] = order
+                settle(state, order)
+
+    for state in rooms.values():
+        settle(state, state["order"])
+    return Outcomes.from_rows(rows)
+
+
+# ============================================================
+# 统计
+# ============================================================
+
+def wilson_interval(survived: np.ndarray, n: np.ndarray, z: float = Z_95) -> tuple[np.ndarray, np.ndarray]:
+    """二项比例的 Wilson 置信区间（n=0 的组为 [0, 1]）"""
+    n = n.astype(np.float64)
+    safe_n = np.maximum(n, 1)
+    p = survived / safe_n
+    denom = 1 + z * z / safe_n
+    center = (p + z * z / (2 * safe_n)) / denom
+    half = z * np.sqrt(p * (1 - p) / safe_n + z * z / (4 * safe_n * safe_n)) / denom
+    lo = np.where(n > 0, center - half, 0.0)
+    hi = np.where(n > 0, center + half, 1.0)
+    return lo, hi
+
+
+def chi2_sf(x: float, dof: int) -> float:
+    """卡方分布的生存函数（整数自由度的闭式解，不依赖 scipy）"""
+    if dof <= 0 or x <= 0:
+        return 1.0
+    half = x / 2
+    if dof % 2 == 0:
+        term, total = 1.0, 1.0
+        for i in range(1, dof // 2):
+            term *= half / i
+            total += term
+        return min(1.0, math.exp(-half) * total)
+    total = math.erfc(math.sqrt(half))
+    term = math.sqrt(2 * x / math.pi) * math.exp(-half)
+    for i in range(1, (dof + 1) // 2):
+        total += term
+        term *= x / (2 * i + 1)
+    return min(1.0, total)
+
+
+def group_rates(keys: np.ndarray, survived: np.ndarray, labels) -> dict:
+    """按 keys 分组的生还率、置信区间，以及组间是否有差异（卡方齐性检验）"""
+    k = len(labels)
+    n = np.bincount(keys, minlength=k)[:k]
+    s = np.bincount(keys, weights=survived, minlength=k)[:k]
+    lo, hi = wilson_interval(s, n)
+    used = n > 0
+    groups = {
+        str(label): {"n": int(n[i]), "survived": int(s[i]),
+                     "rate": round(float(s[i] / n[i]), 4) if n[i] else None,
+                     "ci95": [round(float(lo[i]), 4), round(float(hi[i]), 4)]}
+        for i, label in enumerate(labels)
+    }
+    # 卡方齐性检验：生还 / 死亡 x 各组
+    stat, dof = 0.0, int(used.sum()) - 1
+    total_n, total_s = n[used].sum(), s[used].sum()
+    if dof > 0 and 0 < total_s < total_n:
+        expected_s = n[used] * total_s / total_n
+        expected_d = n[used] - expected_s
+        stat = float((((s[used] - expected_s) ** 2) / expected_s).sum()
+                     + (((n[used] - s[used] - expected_d) ** 2) / expected_d).sum())
+    rates = s[used] / n[used] if used.any() else np.array([0.0])
+    return {
+        "groups": groups,
+        "chi2": round(stat, 3),
+        "dof": max(dof, 0),
+        "p_value": chi2_sf(stat, dof),
+        "spread": round(float(rates.max() - rates.min()), 4),
+    }
+
+
+def two_proportion_p(s1: int, n1: int, s2: int, n2: int) -> float:
+    """两个比例是否相同的双侧 z 检验 p 值"""
+    if not n1 or not n2:
+        return 1.0
+    pooled = (s1 + s2) / (n1 + n2)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / n1 + 1 / n2))
+    if se == 0:
+        return 1.0
+    z = (s1 / n1 - s2 / n2) / se
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def analyze(outcomes: Outcomes, baseline: Optional[dict] = None, tolerance: float = DEFAULT_TOLERANCE,
+            alpha: float = DEFAULT_ALPHA) -> dict:
+    """完整报告：各维度生还率 + 偏向 / 漂移告警"""
+    survived = outcomes.survived.astype(np.float64)
+    normal = ~outcomes.force_death
+    report = {
+        "rows": len(outcomes),
+        "overall": group_rates(np.zeros(len(outcomes), dtype=np.int64), survived, ["all"]),
+        # 偏向只看非强制死亡轮：强制死亡轮本来就应该更容易死
+        "by_tier": group_rates(outcomes.tier[normal].astype(np.int64), survived[normal], TIERS),
+        "by_position": group_rates(outcomes.position[normal].astype(np.int64), survived[normal],
+                                   [f"p{i + 1}" for i in range(MAX_POSITIONS)]),
+        "by_force_death": group_rates(outcomes.force_death.astype(np.int64), survived, ["false", "true"]),
+    }
+
+    # 强制死亡轮至少要死一个人
+    forced_ids = outcomes.round_id[outcomes.force_death]
+    if len(forced_ids):
+        _, inverse = np.unique(forced_ids, return_inverse=True)
+        deaths = np.bincount(inverse, weights=~outcomes.survived[outcomes.force_death])
+        report["forced_rounds"] = len(deaths)
+        report["forced_rounds_without_death"] = round(float((deaths == 0).mean()), 4)
+    else:
+        report["forced_rounds"] = 0
+        report["forced_rounds_without_death"] = 0.0
+
+    flags = []
+    for dimension in ("by_tier", "by_position"):
+        result = report[dimension]
+        if result["p_value"] < alpha and result["spread"] > tolerance:
+            flags.append(f"{dimension}: survival differs across groups by {result['spread']:.1%} "
+                         f"(chi2={result['chi2']}, p={result['p_value']:.2g})")
+    if report["forced_rounds"] and report["forced_rounds_without_death"] > tolerance:
+        flags.append(f"force_death: {report['forced_rounds_without_death']:.1%} of forced rounds had no death")
+
+    if baseline:
+        for dimension in ("overall", "by_tier", "by_position", "by_force_death"):
+            for label, group in report[dimension]["groups"].items():
+                base = baseline.get(dimension, {}).get("groups", {}).get(label)
+                if not base or not base["n"] or not group["n"]:
+                    continue
+                diff = group["rate"] - base["survived"] / base["n"]
+                p = two_proportion_p(group["survived"], group["n"], base["survived"], base["n"])
+                if abs(diff) > tolerance and p < alpha:
+                    flags.append(f"drift {dimension}[{label}]: {base['survived'] / base['n']:.1%} -> "
+                                 f"{group['rate']:.1%} (p={p:.2g})")
+    report["flags"] = flags
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"判定数: {report['rows']}    整体生还率: {report['overall']['groups']['all']['rate']}"]
+    titles = {"by_tier": "按物品等级（非强制死亡轮）", "by_position": "按判定顺序位置（非强制死亡轮）",
+              "by_force_death": "按是否强制死亡轮"}
+    for dimension, title in titles.items():
+        result = report[dimension]
+        lines.append(f"\n{title}:  chi2={result['chi2']} dof={result['dof']} p={result['p_value']:.3g}")
+        for label, g in result["groups"].items():
+            if g["n"]:
+                lines.append(f"  {label:<10} {g['rate']:6.1%}  95% CI [{g['ci95'][0]:.1%}, {g['ci95'][1]:.1%}]"
+                             f"  (n={g['n']})")
+    lines.append(f"\n强制死亡轮: {report['forced_rounds']}    其中无人死亡: {report['forced_rounds_without_death']:.1%}")
+    if report["flags"]:
+        lines.append("\n[Warning] 发现偏向 / 漂移:")
+        lines.extend(f"  - {flag}" for flag in report["flags"])
+    else:
+        lines.append("\n未发现偏向或漂移")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fairness / drift analytics over judgment outcomes")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--event-log", help="event log directory (see event_log.py)")
+    source.add_argument("--npz", help="outcomes saved by headless.py --outcomes")
+    parser.add_argument("--since", type=float, help="only events after this unix timestamp (event log)")
+    parser.add_argument("--baseline", help="compare against a saved baseline report (JSON)")
+    parser.add_argument("--save-baseline", help="write this run's report as a baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    outcomes = load_event_log(args.event_log, args.since) if args.event_log else Outcomes.load(args.npz)
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    report = analyze(outcomes, baseline, args.tolerance, args.alpha)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    sys.exit(1 if report["flags"] else 0)
+
+
+if __name__ == "__main__":
+    main()
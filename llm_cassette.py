@@ -0,0 +1,152 @@
+# Crisis Survival - LLM Cassette
+# call_llm 的录制 / 回放：把 prompt -> 响应（含耗时）录成紧凑的 JSONL 文件，之后离线确定性回放
+#
+# 用法（server.py / simulation.py 都通过环境变量开启）：
+#   LLM_CASSETTE=cassettes/run1.jsonl.gz LLM_CASSETTE_MODE=record python server.py
+#   LLM_CASSETTE=cassettes/run1.jsonl.gz LLM_CASSETTE_MODE=replay LLM_REPLAY_LATENCY=real python simulation.py
+#
+# 文件每行一条记录：{"k": prompt 哈希, "f": prompt 类型, "p": prompt, "r": 响应, "t": 耗时秒}
+# 路径以 .gz 结尾时用 gzip 压缩
+
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from mock_llm import PLAYER_LINE, prompt_family
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _open(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def load_cassette(path) -> list[dict]:
+    """读取 cassette 的全部记录"""
+    with _open(Path(path), "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class CassetteRecorder:
+    """
+    包住真实的 LLM 调用，把每次成功的响应追加写入 cassette。
+
+    空响应（没配 key、调用失败）不录，回放时这些调用会走 fallback。
+    """
+
+    def __init__(self, path, inner: Callable[[str], Awaitable[str]]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.inner = inner
+        self.recorded = 0
+        self._file = _open(self.path, "a")
+        atexit.register(self.close)
+
+    async def __call__(self, prompt: str) -> str:
+        start = time.perf_counter()
+        text = await self.inner(prompt)
+        elapsed = time.perf_counter() - start
+        if text and self._file is not None:
+            record = {"k": prompt_key(prompt), "f": prompt_family(prompt), "p": prompt,
+                      "r": text, "t": round(elapsed, 3)}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.recorded += 1
+        return text
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CassettePlayer:
+    """
+    按 prompt 回放录好的响应。
+
+    先按 prompt 完全匹配；同一 prompt 录了多次时按录制顺序轮流返回。
+    对不上时（Bot 名字、关键词随机导致 prompt 不同）按 prompt 类型轮流取同类响应，
+    判定类响应里的玩家名按位置换成当前 prompt 的玩家；strict=True 时则返回空串让调用方走 fallback。
+
+    latency: "zero" 立即返回；"real" 按录制时的耗时等待
+    """
+
+    def __init__(self, path, latency: str = "zero", strict: bool = False):
+        if latency not in ("zero", "real"):
+            raise ValueError(f"Unknown replay latency mode: {latency}")
+        self.path = Path(path)
+        self.latency = latency
+        self.strict = strict
+        self.by_key: dict[str, deque] = defaultdict(deque)
+        self.by_family: dict[str, deque] = defaultdict(deque)
+        for record in load_cassette(self.path):
+            self.by_key[record["k"]].append(record)
+            self.by_family[record["f"]].append(record)
+        self.stats: Counter = Counter()
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.by_key.values())
+
+    @staticmethod
+    def _take(queue: deque) -> dict:
+        record = queue[0]
+        queue.rotate(-1)
+        return record
+
+    def lookup(self, prompt: str) -> Optional[dict]:
+        queue = self.by_key.get(prompt_key(prompt))
+        if queue:
+            self.stats["exact"] += 1
+            return self._take(queue)
+        if not self.strict:
+            queue = self.by_family.get(prompt_family(prompt))
+            if queue:
+                self.stats["family"] += 1
+                return self._take(queue)
+        self.stats["miss"] += 1
+        return None
+
+    @staticmethod
+    def adapt(record: dict, prompt: str) -> str:
+        """把录制时的玩家名按顺序替换成本次 prompt 里的玩家名"""
+        text = record["r"]
+        if record["f"] != "judgment" or record["k"] == prompt_key(prompt):
+            return text
+        recorded = [name for name, _, _ in PLAYER_LINE.findall(record["p"])]
+        current = [name for name, _, _ in PLAYER_LINE.findall(prompt)]
+        if len(recorded) != len(current):
+            return text
+        # 先换成占位符，避免新旧名字互相覆盖
+        for i, name in enumerate(recorded):
+            text = text.replace(name, f"\x00{i}\x00")
+        for i, name in enumerate(current):
+            text = text.replace(f"\x00{i}\x00", name)
+        return text
+
+    async def __call__(self, prompt: str) -> str:
+        record = self.lookup(prompt)
+        if record is None:
+            return ""
+        if self.latency == "real":
+            await asyncio.sleep(record.get("t", 0))
+        return self.adapt(record, prompt)
+
+
+def open_cassette(path, mode: str, inner: Callable[[str], Awaitable[str]],
+                  latency: str = "zero", strict: bool = False):
+    """按 mode（record / replay）创建 call_llm 的替换函数"""
+    if mode == "record":
+        return CassetteRecorder(path, inner)
+    if mode == "replay":
+        return CassettePlayer(path, latency=latency, strict=strict)
+    raise ValueError(f"Unknown cassette mode: {mode}")
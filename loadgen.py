@@ -0,0 +1,217 @@
+# Crisis Survival - WebSocket Load Generator
+# 打开 N 个并发的 /ws/{player_name} 连接，按真实客户端协议玩完整局，统计各阶段延迟
+#
+# 用法：
+#   python loadgen.py --clients 500 --mode solo --ramp 10
+#   python loadgen.py --clients 300 --mode match --url ws://127.0.0.1:8000 --exit-rate 0.1
+#
+# 连接数较多时先调大文件句柄上限：ulimit -n 65535
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+from urllib.parse import quote
+
+import websockets
+
+METRICS = [
+    ("connect", "建立连接"),
+    ("match_wait", "开始匹配 -> game_starting"),
+    ("keyword_options", "phase_change -> keyword_options"),
+    ("crisis_reveal", "提交关键词 -> crisis_revealed"),
+    ("grab_ack", "grab_item -> 自己的 item_grabbed / grab_failed"),
+    ("judgment_delivery", "judging -> 第一条 judgment_result"),
+    ("round", "round_start -> round_end"),
+    ("game", "game_starting -> game_over"),
+]
+
+
+class LoadStats:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.outcomes: Counter = Counter()
+
+    def record(self, metric: str, seconds: float):
+        self.samples[metric].append(seconds)
+
+    def report(self, wall: float, clients: int):
+        print(f"\n=== 压测结果: {clients} 个客户端, 用时 {wall:.1f}s ===")
+        print(f"{'指标':<20}{'n':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}   (ms)")
+        for metric, desc in METRICS:
+            values = sorted(self.samples.get(metric, []))
+            if not values:
+                continue
+            pct = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+            print(f"{metric:<20}{len(values):>7}{pct(0.5):>9.0f}{pct(0.9):>9.0f}{pct(0.99):>9.0f}"
+                  f"{values[-1] * 1000:>9.0f}   {desc}")
+        print("\n结果:", dict(self.outcomes))
+        if self.errors:
+            print("错误:", dict(self.errors))
+
+
+class SimulatedClient:
+    """按 static/app.js 的协议行事的模拟玩家"""
+
+    def __init__(self, index: int, args: argparse.Namespace, stats: LoadStats):
+        self.name = f"load{index:05d}"
+        self.args = args
+        self.stats = stats
+        self.ws = None
+        self.marks: dict[str, float] = {}
+        self.items: dict[int, bool] = {}  # index -> 是否已被抢
+        self.has_item = False
+        self.rounds_played = 0
+
+    def mark(self, key: str):
+        self.marks[key] = time.perf_counter()
+
+    def since(self, key: str, metric: str):
+        start = self.marks.pop(key, None)
+        if start is not None:
+            self.stats.record(metric, time.perf_counter() - start)
+
+    async def send(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    async def run(self):
+        url = f"{self.args.url}/ws/{quote(self.name)}"
+        self.mark("connect")
+        try:
+            async with websockets.connect(url, open_timeout=self.args.timeout, max_size=None) as ws:
+                self.ws = ws
+                self.since("connect", "connect")
+                outcome = await self.play()
+                self.stats.outcomes[outcome] += 1
+        except asyncio.TimeoutError:
+            self.stats.errors["timeout"] += 1
+        except websockets.ConnectionClosed as e:
+            self.stats.errors[f"closed:{e.code}"] += 1
+        except OSError as e:
+            self.stats.errors[f"connect:{type(e).__name__}"] += 1
+
+    async def play(self) -> str:
+        while True:
+            raw = await asyncio.wait_for(self.ws.recv(), timeout=self.args.timeout)
+            message = json.loads(raw)
+            result = await self.on_message(message)
+            if result:
+                return result
+
+    async def on_message(self, data: dict) -> Optional[str]:
+        kind = data.get("type")
+
+        if kind == "ping":
+            await self.send({"type": "pong", "t": data.get("t")})
+
+        elif kind == "connected":
+            self.mark("match_wait")
+            await self.send({"type": "start_solo" if self.pick_solo() else "start_matching"})
+
+        elif kind == "server_busy":
+            return "server_busy"
+
+        elif kind == "game_starting":
+            self.since("match_wait", "match_wait")
+            self.mark("game")
+
+        elif kind == "round_start":
+            self.mark("round")
+            self.items = {}
+            self.has_item = False
+
+        elif kind == "phase_change":
+            if data.get("phase") == "crisis_setup":
+                self.mark("keyword_options")
+            elif data.get("phase") == "scavenge":
+                self.items = {item["index"]: False for item in data.get("items", [])}
+                await self.think()
+                await self.grab()
+
+        elif kind == "keyword_options":
+            self.since("keyword_options", "keyword_options")
+            await self.think()
+            await self.send({"type": "keyword_choice", "choice": random.choice(data["options"])})
+            self.mark("crisis_reveal")
+
+        elif kind == "crisis_revealed":
+            self.since("crisis_reveal", "crisis_reveal")
+
+        elif kind == "item_grabbed":
+            self.items[data["item_index"]] = True
+            if data["player"] == self.name:
+                self.has_item = True
+                self.since("grab_ack", "grab_ack")
+
+        elif kind == "grab_failed":
+            self.since("grab_ack", "grab_ack")
+            await self.grab()
+
+        elif kind == "judging":
+            self.mark("judgment_delivery")
+
+        elif kind == "judgment_result":
+            self.since("judgment_delivery", "judgment_delivery")
+
+        elif kind == "round_end":
+            self.since("round", "round")
+            self.rounds_played += 1
+            if random.random() < self.args.exit_rate:
+                await self.send({"type": "exit_game"})
+                return "exited"
+
+        elif kind == "game_over":
+            self.since("game", "game")
+            return "completed"
+
+        return None
+
+    def pick_solo(self) -> bool:
+        if self.args.mode == "solo":
+            return True
+        if self.args.mode == "match":
+            return False
+        return random.random() < 0.5
+
+    async def think(self):
+        if self.args.think_max > 0:
+            await asyncio.sleep(random.uniform(self.args.think_min, self.args.think_max))
+
+    async def grab(self):
+        if self.has_item:
+            return
+        free = [i for i, taken in self.items.items() if not taken]
+        if free:
+            self.mark("grab_ack")
+            await self.send({"type": "grab_item", "index": random.choice(free)})
+
+
+async def main(args: argparse.Namespace):
+    stats = LoadStats()
+    clients = [SimulatedClient(i, args, stats) for i in range(args.clients)]
+    delay = args.ramp / max(args.clients, 1)
+
+    async def start(i: int, client: SimulatedClient):
+        await asyncio.sleep(i * delay)
+        await client.run()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start(i, c) for i, c in enumerate(clients)))
+    stats.report(time.perf_counter() - started, args.clients)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive N concurrent simulated players against server.py")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--mode", choices=["solo", "match", "mixed"], default="solo")
+    parser.add_argument("--ramp", type=float, default=5.0, help="在多少秒内陆续建立全部连接")
+    parser.add_argument("--think-min", type=float, default=0.2)
+    parser.add_argument("--think-max", type=float, default=1.5)
+    parser.add_argument("--exit-rate", type=float, default=0.0, help="每轮结束后退出游戏的概率")
+    parser.add_argument("--timeout", type=float, default=90.0, help="单条消息的最长等待秒数")
+    asyncio.run(main(parser.parse_args()))
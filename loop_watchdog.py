@@ -0,0 +1,122 @@
+# Crisis Survival - Event Loop Watchdog
+# 持续测量事件循环调度延迟；某个回调阻塞超过阈值时，从旁路线程抓取事件循环线程的调用栈
+#
+# 任何同步阻塞（time.sleep、大 JSON 编码、回溯严重的正则）都会同时卡住所有房间，
+# 这里的 lag 分位数 / 卡顿次数可供告警和准入控制使用。
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+import metrics
+from config import LOOP_LAG_INTERVAL, SLOW_CALLBACK_THRESHOLD
+
+LOOP_LAG = metrics.histogram(
+    "crisis_event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = metrics.counter(
+    "crisis_event_loop_stalls_total", "Callbacks that blocked the event loop past the threshold")
+
+
+class LoopWatchdog:
+    """
+    interval: 测量间隔（秒），每隔 interval 睡一次，实际醒来时间与预期之差即调度延迟
+    threshold: 超过该延迟视为一次卡顿，记录时长和阻塞时的调用栈
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = SLOW_CALLBACK_THRESHOLD,
+                 window: int = 6000, keep_stalls: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: deque[float] = deque(maxlen=window)
+        self.stalls: deque[dict] = deque(maxlen=keep_stalls)
+        self.stall_count = 0
+        self._beat = time.monotonic()
+        self._pending_stack: Optional[list[str]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 事件循环侧 ----------
+
+    async def run(self):
+        """在事件循环里持续测量 lag，并启动抓栈线程"""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._beat = now
+                self._record(max(0.0, now - expected))
+        finally:
+            self._stop.set()
+
+    def _record(self, lag: float):
+        self.lags.append(lag)
+        LOOP_LAG.observe(lag)
+        if lag < self.threshold:
+            self._pending_stack = None
+            return
+        stack, self._pending_stack = self._pending_stack, None
+        self.stall_count += 1
+        LOOP_STALLS.inc()
+        self.stalls.append({"at": time.time(), "lag_ms": round(lag * 1000, 1), "stack": stack})
+        where = stack[-1].strip().splitlines()[0] if stack else "unknown (finished before sampling)"
+        print(f"[Warning] Event loop blocked for {lag * 1000:.0f}ms at {where}")
+
+    # ---------- 抓栈线程 ----------
+
+    def _watch(self):
+        period = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(period):
+            if self._pending_stack is not None:
+                continue  # 本次卡顿已抓过栈
+            if time.monotonic() - self._beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._pending_stack = traceback.format_stack(frame)
+
+    # ---------- 查询 ----------
+
+    def percentiles(self) -> dict:
+        values = sorted(self.lags)
+        if not values:
+            return {"p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+        def pct(q: float) -> float:
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+        return {"p50_ms": pct(0.5), "p90_ms": pct(0.9), "p99_ms": pct(0.99),
+                "max_ms": round(values[-1] * 1000, 2)}
+
+    def is_lagging(self, p99_threshold: Optional[float] = None) -> bool:
+        """最近窗口的 p99 lag 是否超过阈值（默认 threshold），供准入控制判断"""
+        limit = (p99_threshold if p99_threshold is not None else self.threshold) * 1000
+        return self.percentiles()["p99_ms"] > limit
+
+    def get_stats(self) -> dict:
+        return {
+            **self.percentiles(),
+            "samples": len(self.lags),
+            "stalls": self.stall_count,
+            "threshold_ms": self.threshold * 1000,
+        }
+
+
+# 全局单例
+watchdog = LoopWatchdog()
+
+# 导出分位数 gauge（按最近窗口计算）
+LOOP_LAG_QUANTILES = metrics.gauge(
+    "crisis_event_loop_lag_recent_seconds", "Event loop lag percentiles over the recent window", ["quantile"],
+    collect=lambda: {(q,): watchdog.percentiles()[f"p{int(float(q) * 100)}_ms"] / 1000
+                     for q in ("0.5", "0.9", "0.99")})
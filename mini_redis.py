@@ -0,0 +1,228 @@
+# Crisis Survival - Mini Redis
+# 本地 Redis 协议替身：只实现 state_backend.RedisBackend 用到的命令，
+# 用于在没有 Redis 的机器上测试多 worker 部署。
+#
+# 用法：
+#   python mini_redis.py --port 6379
+#   STATE_BACKEND=redis python -m uvicorn server:app --workers 4 --port 8000
+
+import argparse
+import asyncio
+import fnmatch
+import time
+from collections import defaultdict
+from typing import Optional
+
+from state_backend import RedisBackend, RespError, read_reply
+
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode("utf-8")
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode("utf-8")
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(v) for v in value)
+    raise TypeError(type(value))
+
+
+class MiniRedis:
+    """内存数据 + 发布订阅"""
+
+    def __init__(self):
+        self.strings: dict[bytes, bytes] = {}
+        self.expires: dict[bytes, float] = {}
+        self.lists: dict[bytes, list[bytes]] = defaultdict(list)
+        self.hashes: dict[bytes, dict[bytes, bytes]] = defaultdict(dict)
+        self.channels: dict[bytes, set[asyncio.StreamWriter]] = defaultdict(set)
+
+    def _expire(self, key: bytes):
+        deadline = self.expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self.strings.pop(key, None)
+            del self.expires[key]
+
+    def _range(self, items: list, start: int, stop: int) -> list:
+        n = len(items)
+        start = max(start + n, 0) if start < 0 else start
+        stop = stop + n if stop < 0 else stop
+        return items[start:stop + 1]
+
+    def execute(self, args: list[bytes]):
+        cmd = args[0].upper().decode()
+        handler = getattr(self, f"cmd_{cmd.lower()}", None)
+        if handler is None:
+            return RespError(f"ERR unknown command '{cmd}'")
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError, IndexError) as e:
+            return RespError(f"ERR {cmd}: {e}")
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_get(self, key):
+        self._expire(key)
+        return self.strings.get(key)
+
+    def cmd_set(self, key, value, *opts):
+        self._expire(key)
+        opts = [o.upper() for o in opts]
+        ttl: Optional[float] = None
+        nx = False
+        i = 0
+        while i < len(opts):
+            if opts[i] == b"NX":
+                nx = True
+            elif opts[i] == b"PX":
+                ttl = int(opts[i + 1]) / 1000
+                i += 1
+            elif opts[i] == b"EX":
+                ttl = int(opts[i + 1])
+                i += 1
+            i += 1
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        if ttl is not None:
+            self.expires[key] = time.monotonic() + ttl
+        else:
+            self.expires.pop(key, None)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            self._expire(key)
+            for store in (self.strings, self.lists, self.hashes):
+                if key in store:
+                    del store[key]
+                    removed += 1
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_eval(self, script, numkeys, *args):
+        """没有 Lua：只认识 RedisBackend 用到的脚本，用等价的 Python 实现（单线程执行，本身就是原子的）"""
+        numkeys = int(numkeys)
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script.decode() == RedisBackend.RELEASE_LOCK_SCRIPT:
+            if self.cmd_get(keys[0]) == argv[0]:
+                return self.cmd_del(keys[0])
+            return 0
+        return RespError("ERR mini_redis only supports the scripts used by RedisBackend")
+
+    def cmd_keys(self, pattern):
+        pattern = pattern.decode()
+        keys = set(self.strings) | set(self.lists) | set(self.hashes)
+        return [k for k in keys if fnmatch.fnmatchcase(k.decode(), pattern)]
+
+    def cmd_hsetnx(self, key, field, value):
+        h = self.hashes[key]
+        if field in h:
+            return 0
+        h[field] = value
+        return 1
+
+    def cmd_hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def cmd_hdel(self, key, *fields):
+        h = self.hashes.get(key, {})
+        removed = sum(1 for f in fields if h.pop(f, None) is not None)
+        if key in self.hashes and not h:
+            del self.hashes[key]
+        return removed
+
+    def cmd_rpush(self, key, *values):
+        self.lists[key].extend(values)
+        return len(self.lists[key])
+
+    def cmd_llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def cmd_lrange(self, key, start, stop):
+        return self._range(self.lists.get(key, []), int(start), int(stop))
+
+    def cmd_ltrim(self, key, start, stop):
+        if key in self.lists:
+            self.lists[key] = self._range(self.lists[key], int(start), int(stop))
+        return "OK"
+
+    def cmd_lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        count = int(count)
+        kept, removed = [], 0
+        for item in items:
+            if item == value and (count == 0 or removed < abs(count)):
+                removed += 1
+            else:
+                kept.append(item)
+        if key in self.lists:
+            self.lists[key] = kept
+        return removed
+
+    def cmd_publish(self, channel, message):
+        subscribers = self.channels.get(channel, set())
+        payload = encode_reply([b"message", channel, message])
+        for writer in list(subscribers):
+            writer.write(payload)
+        return len(subscribers)
+
+
+async def serve_client(db: MiniRedis, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    subscribed: set[bytes] = set()
+    try:
+        while True:
+            args = await read_reply(reader)
+            if not isinstance(args, list) or not args:
+                continue
+            cmd = args[0].upper()
+            if cmd == b"SUBSCRIBE":
+                for channel in args[1:]:
+                    db.channels[channel].add(writer)
+                    subscribed.add(channel)
+                    writer.write(encode_reply([b"subscribe", channel, len(subscribed)]))
+            elif cmd == b"UNSUBSCRIBE":
+                for channel in args[1:] or list(subscribed):
+                    db.channels[channel].discard(writer)
+                    subscribed.discard(channel)
+                    writer.write(encode_reply([b"unsubscribe", channel, len(subscribed)]))
+            else:
+                writer.write(encode_reply(db.execute(args)))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for channel in subscribed:
+            db.channels[channel].discard(writer)
+        writer.close()
+
+
+async def main(host: str, port: int):
+    db = MiniRedis()
+    server = await asyncio.start_server(lambda r, w: serve_client(db, r, w), host, port)
+    print(f"mini_redis listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis-protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
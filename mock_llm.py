@@ -0,0 +1,119 @@
+# Crisis Survival - Mock LLM
+# 离线的 LLM 替身：按 prompt 类型返回符合 ai_module 解析格式的 JSON
+#
+# 用法：
+#   from ai_module import set_llm_override
+#   set_llm_override(MockLLM(seed=42))
+
+import json
+import random
+import re
+from typing import Optional
+
+NOUNS = ["假牙", "泡面", "马桶刷", "橡皮擦", "插座", "饺子", "老干妈", "鲶鱼", "鹦鹉", "仙丹",
+         "眉毛", "膝盖", "脚气", "拖鞋", "电饭煲", "鸽子", "路由器", "算盘", "榴莲", "秋裤"]
+ADJECTIVES = ["会飞的", "量子纠缠的", "通货膨胀的", "焦虑的", "存在主义的", "有灵魂的",
+              "考公的", "炒股的", "会唱歌的", "预言未来的", "蓝牙", "5G"]
+DISASTERS = ["风暴", "入侵", "大爆炸", "时空裂缝", "末日", "瘟疫", "海啸", "暴动"]
+TIERS = ["legendary", "normal", "normal", "trash", "trash"]
+COMMENTS = ["你以为这能救你？", "垃圾配垃圾，绝配。", "手气不错，可惜没用。", "就这？", "祝你好运，真的。"]
+
+# judge_batch_survival 的玩家行：Player 1 (名字): 物品='xxx' (品质: tier)
+PLAYER_LINE = re.compile(r"Player \d+ \((.+?)\): 物品='(.*?)' \(品质: (\w+)\)")
+
+
+def prompt_family(prompt: str) -> str:
+    """识别 prompt 属于哪个 ai_module 函数"""
+    if '"results"' in prompt:
+        return "judgment"
+    if '"items"' in prompt:
+        return "items"
+    if '"scenario"' in prompt:
+        return "crisis"
+    if '"crises"' in prompt:
+        return "crisis_options"
+    if '"keywords"' in prompt:
+        return "keywords"
+    if '"summary"' in prompt:
+        return "summary"
+    if '"story"' in prompt:
+        return "story"
+    return "unknown"
+
+
+class MockLLM:
+    """
+    确定性（可设 seed）的 LLM 替身。
+
+    death_rate: 非强制轮次里有人死亡的概率（每轮最多死 1 人）
+    tier_weights: 选死者时各品质的相对权重，默认不偏向任何品质
+    """
+
+    def __init__(self, seed: Optional[int] = None, death_rate: float = 0.35,
+                 tier_weights: Optional[dict[str, float]] = None):
+        self.rng = random.Random(seed)
+        self.death_rate = death_rate
+        self.tier_weights = tier_weights or {}
+
+    async def __call__(self, prompt: str) -> str:
+        return self.respond(prompt)
+
+    def _phrase(self) -> str:
+        return self.rng.choice(ADJECTIVES) + self.rng.choice(NOUNS)
+
+    def _count(self, prompt: str, default: int) -> int:
+        match = re.search(r"生成 (\d+) 个", prompt) or re.search(r"提供 (\d+) 个", prompt)
+        return int(match.group(1)) if match else default
+
+    def respond(self, prompt: str) -> str:
+        family = prompt_family(prompt)
+        return json.dumps(getattr(self, f"_{family}")(prompt), ensure_ascii=False)
+
+    def _keywords(self, prompt: str) -> dict:
+        return {"keywords": [self._phrase() for _ in range(self._count(prompt, 3))]}
+
+    def _crisis_options(self, prompt: str) -> dict:
+        return {"crises": [self._phrase() + self.rng.choice(DISASTERS) for _ in range(self._count(prompt, 3))]}
+
+    def _crisis(self, prompt: str) -> dict:
+        name = self._phrase() + self.rng.choice(DISASTERS)
+        return {
+            "name": name,
+            "scenario": f"{name}正在席卷全城，{self._phrase()}已经失控，所有人都得想办法活下去！",
+            "image_prompt": "surreal disaster, dramatic lighting, cinematic"
+        }
+
+    def _items(self, prompt: str) -> dict:
+        count = self._count(prompt, 5)
+        tiers = (TIERS * (count // len(TIERS) + 1))[:count]
+        return {"items": [
+            {"name": self._phrase(), "tier": tier, "pickup_comment": self.rng.choice(COMMENTS)}
+            for tier in tiers
+        ]}
+
+    def _judgment(self, prompt: str) -> dict:
+        players = PLAYER_LINE.findall(prompt)
+        forced = "强制危机模式" in prompt
+        victim = None
+        if players and (forced or self.rng.random() < self.death_rate):
+            weights = [self.tier_weights.get(tier, 1.0) for _, _, tier in players]
+            victim = self.rng.choices(range(len(players)), weights=weights)[0]
+        return {"results": [
+            {
+                "name": name,
+                "survived": i != victim,
+                "story": f"{name} 靠着{item}" + ("勉强活了下来。" if i != victim else "成功把自己作死了。"),
+                "image_prompt": "survivor scene" if i != victim else "tragic end"
+            }
+            for i, (name, item, _) in enumerate(players)
+        ]}
+
+    def _story(self, prompt: str) -> dict:
+        return {"story": f"{self._phrase()}突然出现，{self._phrase()}开始了新的冒险。",
+                "image_prompt": "surreal scene, digital art"}
+
+    def _summary(self, prompt: str) -> dict:
+        return {"summary": f"{self._phrase()}和{self._phrase()}卷入了一连串荒诞事件，{self._phrase()}仍下落不明。"}
+
+    def _unknown(self, prompt: str) -> dict:
+        return {}
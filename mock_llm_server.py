@@ -0,0 +1,186 @@
+# Crisis Survival - Mock LLM Server
+# 本地 OpenAI 兼容的 chat-completions 服务，用于压测和容错测试 ai_module
+#
+# 用法：
+#   python mock_llm_server.py --port 8300 --latency lognormal:-0.5,0.6 --rate-429 0.05 --malformed-rate 0.05
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:8300 DEEPSEEK_API_KEY=mock python server.py
+#
+# 延迟分布：fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA | exp:MEAN（单位秒）
+# 可按 prompt 类型单独指定：--latency judgment=lognormal:0.5,0.4 --latency keywords=fixed:0.2
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from mock_llm import MockLLM, prompt_family
+
+
+@dataclass
+class LatencyDistribution:
+    kind: str = "fixed"
+    params: tuple = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, raw = spec.partition(":")
+        params = tuple(float(x) for x in raw.split(",")) if raw else (0.0,)
+        dist = cls(kind, params)
+        dist.sample(random.Random(0))  # 尽早暴露写错的参数
+        return dist
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(p[0], p[1])
+        elif self.kind == "exp":
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+        return max(0.0, value)
+
+
+@dataclass
+class MockSettings:
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    family_latency: dict[str, LatencyDistribution] = field(default_factory=dict)
+    rate_429: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 600.0
+    malformed_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    rng = random.Random(settings.seed)
+    llm = MockLLM(seed=settings.seed)
+    stats: Counter = Counter()
+
+    def completion_text(prompt: str, family: str) -> str:
+        text = llm.respond(prompt)
+        if rng.random() < settings.malformed_rate:
+            stats["malformed"] += 1
+            # 常见的坏输出：截断的 JSON 或带解释的纯文本
+            return rng.choice([text[: len(text) // 2], "好的，下面是你要的内容：" + text.replace("{", "", 1)])
+        return text
+
+    def usage(prompt: str, text: str) -> dict:
+        prompt_tokens, completion_tokens = len(prompt) // 2 + 1, len(text) // 2 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        family = prompt_family(prompt)
+        model = body.get("model", "mock")
+        stats[f"requests:{family}"] += 1
+
+        if rng.random() < settings.rate_429:
+            stats["429"] += 1
+            return JSONResponse(status_code=429, headers={"retry-after": "1"}, content={
+                "error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit"}
+            })
+        if rng.random() < settings.timeout_rate:
+            stats["timeout"] += 1
+            await asyncio.sleep(settings.timeout_seconds)
+
+        delay = settings.family_latency.get(family, settings.latency).sample(rng)
+        text = completion_text(prompt, family)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage(prompt, text),
+            }
+
+        async def stream():
+            pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+            # 30% 的延迟算首字时间，其余平均分给后续分片
+            await asyncio.sleep(delay * 0.3)
+            step = delay * 0.7 / len(pieces)
+            for i, piece in enumerate(pieces):
+                delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(step)
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage(prompt, text)}
+            yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    # DeepSeek 的 base_url 不带 /v1，OpenAI 风格的带 /v1，两种都支持
+    app.post("/chat/completions")(chat_completions)
+    app.post("/v1/chat/completions")(chat_completions)
+
+    @app.get("/v1/models")
+    @app.get("/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "deepseek-chat", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def parse_args(argv=None) -> tuple[argparse.Namespace, MockSettings]:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--latency", action="append", default=[],
+                        help="延迟分布，如 lognormal:-0.5,0.6；加前缀 family= 只作用于某类 prompt")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="挂起不返回的概率")
+    parser.add_argument("--timeout-seconds", type=float, default=600.0, help="挂起的秒数")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回坏 JSON 的概率")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        rate_429=args.rate_429,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    for spec in args.latency:
+        family, sep, dist = spec.partition("=")
+        if sep:
+            settings.family_latency[family] = LatencyDistribution.parse(dist)
+        else:
+            settings.latency = LatencyDistribution.parse(spec)
+    return args, settings
+
+
+if __name__ == "__main__":
+    import uvicorn
+    args, settings = parse_args()
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
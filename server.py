@@ -1,62 +1,348 @@
 # Crisis Survival Web - FastAPI Server
 # 后端服务器 with WebSocket
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.websockets import WebSocketState
+from contextlib import asynccontextmanager
 import asyncio
-import json
+import secrets
+import time
 import uuid
 import random
 from pathlib import Path
 from typing import Optional
 
 from game_manager import (
-    game_manager, GameRoom, Player, BotPlayer, GamePhase
+    game_manager, GameRoom, Player, BotPlayer, GamePhase, Item
 )
 from ai_module import (
     generate_keyword_options,
     generate_collaborative_crisis,
     generate_scavenge_items,
-    judge_batch_survival
+    judge_batch_survival,
+    average_tokens_per_call
 )
+from event_log import event_log, read_events
+from loop_watchdog import watchdog
+from task_supervisor import TaskSupervisor, supervised_task_count
+from game_runtime import Transport
+from image_pipeline import MEDIA_TYPES, image_pipeline
+from inbound_guard import InboundGuard
+from spectators import encode_frame, spectator_hub
+from static_assets import IMMUTABLE, StaticAssets
+from stats_store import stats_store
+from state_backend import create_backend
+import admin
+import metrics
+import tracing
+from config import (
+    HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, RESUME_GRACE_PERIOD, ROOM_REAP_INTERVAL, STATE_BACKEND, REDIS_URL,
+    WS_MAX_FRAME_BYTES
+)
+
+# 不属于任何房间的后台任务（回收器、匹配超时）
+background_tasks = TaskSupervisor(owner="server")
+
+# 共享状态后端（匹配队列、房间码、跨 worker 消息）
+backend = create_backend(STATE_BACKEND, game_manager, REDIS_URL)
+game_manager.backend = backend
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await backend.start(handle_envelope)
+    background_tasks.spawn(game_manager.reaper.run(ROOM_REAP_INTERVAL), name="room_reaper")
+    background_tasks.spawn(watchdog.run(), name="loop_watchdog")
+    background_tasks.spawn(heartbeat_loop(HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT), name="heartbeat")
+    background_tasks.spawn(event_log.run(), name="event_log_writer")
+    background_tasks.spawn(stats_store.run(), name="stats_writer")
+    background_tasks.spawn(image_pipeline.run(), name="image_pipeline")
+    try:
+        yield
+    finally:
+        for room in list(game_manager.rooms.values()):
+            await room.tasks.close()
+        await background_tasks.close()
+        await backend.stop()
+
 
-app = FastAPI(title="危机求生 - Crisis Survival")
+app = FastAPI(title="危机求生 - Crisis Survival", lifespan=lifespan)
+app.include_router(admin.router)
 
 # 存储 WebSocket 连接
 connections: dict[str, WebSocket] = {}  # player_id -> websocket
 
+# 本地连接的玩家及其最后一次收到消息的时间（心跳超时判定）
+local_players: dict[str, Player] = {}  # player_id -> Player
+last_seen: dict[str, float] = {}  # player_id -> time.monotonic()
+
+# 可恢复的会话：重连 token -> player_id；断线后处于宽限期的玩家 -> 到期清理任务
+sessions: dict[str, str] = {}
+session_tokens: dict[str, str] = {}  # player_id -> token
+detached: dict[str, asyncio.Task] = {}
+
+# 正在等待匹配超时的玩家 -> 超时任务（每人最多一个）
+matching_timeouts: dict[str, asyncio.Task] = {}
+
+# 本地连接、但房间在其他 worker 上的玩家
+room_affinity: dict[str, str] = {}  # player_id -> owner worker_id
+
+
+def on_room_evicted(room: GameRoom, reason: str):
+    """房间被回收时，清理其中已经断开的真人连接，通知远端 worker 解除路由，并断开观众"""
+    asyncio.get_running_loop().call_soon(spectator_hub.close_room, room.room_id)  # 排在已推迟的观众分发之后
+    for p in room.players:
+        if p.is_bot:
+            continue
+        if p.worker_id is not None:
+            background_tasks.spawn(
+                backend.send_to_worker(p.worker_id, {"kind": "unbind", "player_id": p.id}),
+                name=f"unbind:{p.id}"
+            )
+            continue
+        ws = connections.get(p.id)
+        if ws is not None and ws.client_state != WebSocketState.CONNECTED:
+            del connections[p.id]
+
+
+game_manager.reaper.on_evict_callback = on_room_evicted
+
+# 因无人在线而提前终止的房间统计
+abandon_stats = {"rooms_abandoned": 0, "llm_calls_saved": 0, "llm_tokens_saved": 0}
+
+
+# ============================================================
+# 指标（GET /metrics）
+# ============================================================
+
+def rooms_by_phase() -> dict:
+    counts = {(phase.value,): 0 for phase in GamePhase}
+    for room in game_manager.rooms.values():
+        counts[(room.phase.value,)] += 1
+    return counts
+
+
+ROOMS = metrics.gauge("crisis_rooms", "Live rooms by phase", ["phase"], collect=rooms_by_phase)
+QUEUE_DEPTH = metrics.gauge("crisis_matchmaking_queue_depth", "Players waiting in the matchmaking queue")
+WS_CONNECTIONS = metrics.gauge("crisis_websocket_connections", "Open WebSocket connections on this worker",
+                               collect=lambda: len(connections))
+MESSAGES_SENT = metrics.counter("crisis_ws_messages_sent_total", "WebSocket messages sent by type", ["type"])
+BYTES_SENT = metrics.counter("crisis_ws_bytes_sent_total", "WebSocket payload bytes sent by message type", ["type"])
+RESUMES = metrics.counter("crisis_ws_resumes_total", "Reconnect attempts by outcome (resumed / expired)", ["outcome"])
+EVICTIONS = metrics.counter("crisis_ws_evictions_total", "Dead connections evicted by reason", ["reason"])
+PHASE_DURATION = metrics.histogram("crisis_phase_duration_seconds", "Game phase duration (room clock)", ["phase"])
+
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
+# 启动时读入内存、算好指纹并预压缩，之后的页面请求不再读盘
+static_assets = StaticAssets(STATIC_DIR)
 
 
 # ============================================================
 # WebSocket 消息广播
 # ============================================================
 
+class WebSocketTransport(Transport):
+    """默认传输：本地 WebSocket，连接在其他 worker 上时经后端转发"""
+    
+    def __init__(self):
+        # 最近一次广播的 (消息, 编码后的文本)：同一条广播发给各个玩家时复用
+        self._frame: tuple[Optional[dict], str] = (None, "")
+    
+    async def send(self, player: Player, message: dict):
+        if player.worker_id is not None:
+            await backend.send_to_worker(player.worker_id, {
+                "kind": "deliver",
+                "player_id": player.id,
+                "message": message
+            })
+        else:
+            cached, frame = self._frame
+            await send_to_player(player.id, message, frame if cached is message else None)
+    
+    def on_broadcast(self, room: GameRoom, message: dict):
+        # 每条广播只编码一次，玩家和观众共用；观众的分发排在本轮玩家发送之后
+        frame = encode_frame(message)
+        self._frame = (message, frame)
+        event_log.append(room.room_id, frame)
+        if spectator_hub.count(room.room_id):
+            final = message.get("type") == "game_over"
+            asyncio.get_running_loop().call_soon(spectator_hub.publish, room.room_id, frame, final)
+    
+    def has_audience(self, room: GameRoom) -> bool:
+        # 远端玩家断线时 owner 会收到 disconnect 并把他移出房间；宽限期内的玩家还可能重连回来
+        return any(
+            not p.is_bot and (p.worker_id is not None or p.id in connections or p.id in detached)
+            for p in room.players
+        )
+
+
+ws_transport = WebSocketTransport()
+
+
+def transport_of(room: GameRoom) -> Transport:
+    return room.transport or ws_transport
+
+
 async def broadcast_to_room(room: GameRoom, message: dict, exclude: Optional[str] = None):
-    """向房间内所有真人玩家广播消息"""
-    for player in room.players:
-        if player.is_bot:
-            continue
-        if exclude and player.id == exclude:
-            continue
-        ws = connections.get(player.id)
-        if ws:
-            try:
-                await ws.send_json(message)
-            except:
-                pass
+    """向房间内所有真人玩家广播消息（带序号，记入重放缓冲）"""
+    transport = transport_of(room)
+    message = room.record_outbound(message)
+    with tracing.span(f"broadcast:{message.get('type')}", "ws", trace=room.trace) as span:
+        transport.on_broadcast(room, message)
+        recipients = 0
+        for player in room.players:
+            if player.is_bot:
+                continue
+            if exclude and player.id == exclude:
+                continue
+            await transport.send(player, message)
+            recipients += 1
+        span["recipients"] = recipients
+
+
+async def send_in_room(room: GameRoom, player: Player, message: dict):
+    """房间内只发给一个玩家的消息（带序号，记入重放缓冲和事件日志）"""
+    message = room.record_outbound(message, player.id)
+    if room.transport is None and event_log.running:
+        event_log.append(room.room_id, encode_frame(message), target=player.id)
+    await transport_of(room).send(player, message)
+
 
+async def deliver(player: Player, message: dict):
+    """向还没进房间的玩家发送消息（匹配阶段）"""
+    await ws_transport.send(player, message)
 
-async def send_to_player(player_id: str, message: dict):
-    """向单个玩家发送消息"""
+
+async def send_to_player(player_id: str, message: dict, text: Optional[str] = None):
+    """向本 worker 上连接的单个玩家发送消息；text 为已编码好的消息（广播时共用）"""
     ws = connections.get(player_id)
     if ws:
         try:
-            await ws.send_json(message)
-        except:
-            pass
+            if text is None:
+                text = encode_frame(message)
+            await ws.send_text(text)
+            kind = message.get("type", "unknown")
+            MESSAGES_SENT.inc(type=kind)
+            BYTES_SENT.inc(len(text.encode("utf-8")), type=kind)
+        except Exception:
+            # 对端已经不在了：尽快交给 AI 接管，而不是继续往死连接上发
+            background_tasks.spawn(evict_connection(player_id, ws, "send_failed"), name=f"evict:{player_id}")
+
+
+# ============================================================
+# 心跳 / 死连接清理
+# ============================================================
+
+async def heartbeat_loop(interval: float, timeout: float):
+    """每 interval 秒给所有本地连接发 ping；超过 timeout 秒没收到任何消息的连接视为已死"""
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        for player_id, ws in list(connections.items()):
+            if now - last_seen.get(player_id, now) > timeout:
+                await evict_connection(player_id, ws, "heartbeat_timeout")
+            else:
+                await send_to_player(player_id, {"type": "ping", "t": round(time.time() * 1000)})
+
+
+async def evict_connection(player_id: str, websocket: WebSocket, reason: str):
+    """
+    移除死连接：退出匹配，房间里的角色交给 AI 接管，然后关闭 socket。
+    发送失败多半只是短暂断线：能保留座位时和正常断线一样进入宽限期，等客户端带 token 重连。
+    """
+    if connections.get(player_id) is not websocket:
+        return  # 已经清理过，或者已被新连接替换
+    del connections[player_id]
+    EVICTIONS.inc(reason=reason)
+    player = local_players.get(player_id)
+    await backend.leave_queue(player_id)
+    if player is not None and reason == "send_failed" and resumable_room(player_id) is not None:
+        detached[player_id] = background_tasks.spawn(
+            expire_session(player, RESUME_GRACE_PERIOD), name=f"resume_grace:{player_id}")
+    elif player is not None and (game_manager.get_player_room(player_id) or player_id in room_affinity):
+        await route_message(player, {"type": "exit_game"})
+    try:
+        await asyncio.wait_for(websocket.close(code=1001), timeout=1)
+    except Exception:
+        pass
+
+
+# ============================================================
+# 跨 worker 消息
+# ============================================================
+
+async def handle_envelope(envelope: dict):
+    """处理其他 worker 发来的信封"""
+    kind = envelope.get("kind")
+    player_id = envelope.get("player_id", "")
+    
+    if kind == "deliver":
+        await send_to_player(player_id, envelope.get("message", {}))
+    
+    elif kind == "inbound":
+        # 本 worker 是房间 owner，处理远端玩家的操作
+        player = Player(id=player_id, name=envelope.get("player_name", ""), worker_id=envelope.get("worker"))
+        await handle_message(player, envelope.get("data", {}))
+    
+    elif kind == "bind":
+        room_affinity[player_id] = envelope["owner"]
+    
+    elif kind == "unbind":
+        room_affinity.pop(player_id, None)
+    
+    elif kind == "disconnect":
+        room = game_manager.get_player_room(player_id)
+        game_manager.leave_room(player_id)
+        cancel_if_abandoned(room)
+
+
+async def route_message(player: Player, data: dict):
+    """房间在其他 worker 上时把操作转发给 owner，否则本地处理"""
+    owner = room_affinity.get(player.id)
+    if owner is not None:
+        await backend.send_to_worker(owner, {
+            "kind": "inbound",
+            "player_id": player.id,
+            "player_name": player.name,
+            "worker": backend.worker_id,
+            "data": data
+        })
+    else:
+        await handle_message(player, data)
+
+
+# ============================================================
+# 弃局检测
+# ============================================================
+
+class RoomAbandoned(Exception):
+    """房间里已经没有在线的真人玩家"""
+
+
+def room_has_humans(room: GameRoom) -> bool:
+    return transport_of(room).has_audience(room)
+
+
+def ensure_room_active(room: GameRoom):
+    """阶段边界检查：没人在线就终止游戏循环"""
+    if not room_has_humans(room):
+        raise RoomAbandoned(room.room_id)
+
+
+def cancel_if_abandoned(room: Optional[GameRoom]):
+    """真人全部离开时立即取消游戏循环（连同正在进行的 LLM 请求）"""
+    if room is None or room_has_humans(room):
+        return
+    room.tasks.cancel_all()
+
+
+def record_abandoned_room(room: GameRoom, expected_calls: int):
+    calls_saved = max(0, expected_calls - room.llm_calls_issued)
+    abandon_stats["rooms_abandoned"] += 1
+    abandon_stats["llm_calls_saved"] += calls_saved
+    abandon_stats["llm_tokens_saved"] += int(calls_saved * average_tokens_per_call())
 
 
 # ============================================================
@@ -64,44 +350,69 @@ async def send_to_player(player_id: str, message: dict):
 # ============================================================
 
 async def run_game_loop(room: GameRoom):
-    """主游戏循环"""
+    """主游戏循环；房间被弃时提前终止并记录省下的 LLM 调用"""
+    # 开局时算好，离开的玩家会被移出 room.players
+    expected_calls = room.expected_llm_calls()
+    if room.trace is None:
+        room.trace = tracing.start_trace(room.room_id)
+    # 本任务及其派生的 Bot 任务里的 span 都记到这局的 trace
+    tracing.current_trace.set(room.trace)
+    try:
+        with tracing.span("game", "room", players=len(room.players)):
+            await play_game(room)
+    except RoomAbandoned:
+        record_abandoned_room(room, expected_calls)
+    except asyncio.CancelledError:
+        if not room_has_humans(room):
+            record_abandoned_room(room, expected_calls)
+        raise
+    finally:
+        tracing.finish_trace(room.trace)
+        # on_broadcast 用 call_soon 推迟了观众分发：关房间也排进同一队列（FIFO），保证 game_over 先发给观众
+        asyncio.get_running_loop().call_soon(spectator_hub.close_room, room.room_id)
+
+
+async def play_game(room: GameRoom):
+    """完整的多轮游戏流程"""
     
     for round_num in range(1, room.max_rounds + 1):
-        room.current_round = round_num
-        room.reset_round()
-        
-        await broadcast_to_room(room, {
-            "type": "round_start",
-            "round": round_num,
-            "max_rounds": room.max_rounds
-        })
-        await asyncio.sleep(1)
-        
-        # ========== Phase 1: 危机设定 ==========
-        room.phase = GamePhase.CRISIS_SETUP
-        await run_crisis_phase(room)
-        
-        # ========== Phase 2: 抢夺物资 ==========
-        room.phase = GamePhase.SCAVENGE
-        await run_scavenge_phase(room)
-        
-        # ========== Phase 3: 判定生还 ==========
-        room.phase = GamePhase.JUDGMENT
-        await run_judgment_phase(room)
-        
-        # 回合结束
-        room.phase = GamePhase.ROUND_END
-        await broadcast_to_room(room, {
-            "type": "round_end",
-            "round": round_num,
-            "scores": [{"name": p.name, "score": p.score} for p in room.players]
-        })
-        
-        if round_num < room.max_rounds:
-            await asyncio.sleep(3)
+        with tracing.span(f"round {round_num}", "round"):
+            ensure_room_active(room)
+            room.current_round = round_num
+            room.reset_round()
+            room.touch()
+            
+            await broadcast_to_room(room, {
+                "type": "round_start",
+                "round": round_num,
+                "max_rounds": room.max_rounds
+            })
+            await room.clock.sleep(1)
+            
+            # ========== Phase 1: 危机设定 ==========
+            await run_phase(room, GamePhase.CRISIS_SETUP, run_crisis_phase)
+            
+            # ========== Phase 2: 抢夺物资 ==========
+            await run_phase(room, GamePhase.SCAVENGE, run_scavenge_phase)
+            
+            # ========== Phase 3: 判定生还 ==========
+            await run_phase(room, GamePhase.JUDGMENT, run_judgment_phase)
+            
+            # 回合结束
+            ensure_room_active(room)
+            room.phase = GamePhase.ROUND_END
+            room.touch()
+            await broadcast_to_room(room, {
+                "type": "round_end",
+                "round": round_num,
+                "scores": [{"name": p.name, "score": p.score} for p in room.players]
+            })
+            
+            if round_num < room.max_rounds:
+                await room.clock.sleep(3)
     
     # 游戏结束
-    room.phase = GamePhase.GAME_OVER
+    room.mark_finished()
     sorted_players = sorted(room.players, key=lambda p: p.score, reverse=True)
     
     # 检查是否有平分情况，需要用离谱理由决胜负
@@ -144,6 +455,21 @@ async def run_game_loop(room: GameRoom):
         "rankings": [{"name": p.name, "score": p.score, "is_bot": p.is_bot} for p in sorted_players],
         "tiebreaker_reason": tiebreaker_reason
     })
+    stats_store.record_game(
+        [(p.name, p.score) for p in sorted_players if not p.is_bot],
+        winner=sorted_players[0].name if sorted_players and not sorted_players[0].is_bot else None
+    )
+
+
+async def run_phase(room: GameRoom, phase: GamePhase, runner):
+    """进入 phase 并执行，按房间时钟记录阶段耗时"""
+    ensure_room_active(room)
+    room.phase = phase
+    room.touch()
+    start = room.clock.now()
+    with tracing.span(phase.value, "phase"):
+        await runner(room)
+    PHASE_DURATION.observe(room.clock.now() - start, phase=phase.value)
 
 
 async def run_crisis_phase(room: GameRoom):
@@ -152,23 +478,25 @@ async def run_crisis_phase(room: GameRoom):
     
     # 为每个玩家生成关键词选项
     for player in room.players:
+        room.llm_calls_issued += 1
         options = await generate_keyword_options(3)
         room.keyword_options[player.id] = options
         
         if player.is_bot:
             # Bot 自动选择
-            asyncio.create_task(bot_choose_keyword(room, player, options))
+            room.tasks.spawn(bot_choose_keyword(room, player, options), name=f"bot_keyword:{player.id}")
         else:
-            await send_to_player(player.id, {
+            await send_in_room(room, player, {
                 "type": "keyword_options",
                 "options": options
             })
     
     # 等待所有玩家提交 (最多 30 秒)
-    for _ in range(30):
-        if room.all_keywords_submitted():
-            break
-        await asyncio.sleep(1)
+    with tracing.span("wait_keywords", "wait"):
+        for _ in range(30):
+            if room.all_keywords_submitted():
+                break
+            await room.clock.sleep(1)
     
     # 超时的玩家随机选一个
     for player in room.players:
@@ -179,8 +507,14 @@ async def run_crisis_phase(room: GameRoom):
     
     # 生成危机
     await broadcast_to_room(room, {"type": "generating_crisis"})
+    room.llm_calls_issued += 1
     crisis_data = await generate_collaborative_crisis(room.collected_keywords)
     room.crisis_data = crisis_data
+    # 配图在后台生成，文字不等它
+    round_num = room.current_round
+    image_pipeline.request(crisis_data.get("image_prompt"), lambda url: push_image(room, {
+        "type": "image_ready", "target": "crisis", "round": round_num, "url": url
+    }))
     
     await broadcast_to_room(room, {
         "type": "crisis_revealed",
@@ -188,102 +522,99 @@ async def run_crisis_phase(room: GameRoom):
         "scenario": crisis_data.get("scenario", "危机来袭！"),
         "keywords": room.collected_keywords
     })
-    await asyncio.sleep(3)
+    await room.clock.sleep(3)
+
+
+def push_image(room: GameRoom, message: dict):
+    """图片生成完成的回调（在事件循环里同步调用）：异步广播给房间，房间已关闭时忽略"""
+    room.tasks.spawn(broadcast_to_room(room, message), name="image_ready")
 
 
 async def bot_choose_keyword(room: GameRoom, bot: BotPlayer, options: list[str]):
     """Bot 选择关键词"""
-    choice = await bot.choose_keyword(options)
+    tracing.set_track(f"bot:{bot.name}")
+    with tracing.span("choose_keyword", "bot"):
+        choice = await bot.choose_keyword(options, room.clock)
     bot.keyword_choice = choice
     room.collected_keywords.append(choice)
 
 
+def item_grabbed_message(player_name: str, item_index: int, item: Item) -> dict:
+    return {
+        "type": "item_grabbed",
+        "player": player_name,
+        "item_index": item_index,
+        "item_name": item.name,
+        "tier": item.tier,
+        "comment": item.pickup_comment
+    }
+
+
 async def run_scavenge_phase(room: GameRoom):
     """抢夺物资阶段"""
     crisis_name = room.crisis_data.get("name", "危机") if room.crisis_data else "危机"
     
     # 生成物品
+    room.llm_calls_issued += 1
     items = await generate_scavenge_items(crisis_name, 5)
-    room.items = items
+    room.set_items(items)
     
     await broadcast_to_room(room, {
         "type": "phase_change",
         "phase": "scavenge",
-        "items": [{"index": i, "name": item["name"], "tier": item["tier"]} for i, item in enumerate(items)]
+        "items": [{"index": i, "name": item.name, "tier": item.tier} for i, item in enumerate(room.items)]
     })
     
     # 启动 Bot 抢夺任务
     for player in room.players:
         if player.is_bot:
-            asyncio.create_task(bot_grab_item(room, player))
+            room.tasks.spawn(bot_grab_item(room, player), name=f"bot_grab:{player.id}")
     
     # 等待所有玩家抢夺完成 (最多 15 秒)
-    for _ in range(15):
-        if room.all_items_grabbed():
-            break
-        await asyncio.sleep(1)
+    with tracing.span("wait_grabs", "wait"):
+        for _ in range(15):
+            if room.all_items_grabbed():
+                break
+            await room.clock.sleep(1)
     
     # 超时的玩家随机分配剩余物品
     available = room.get_available_items()
     for player in room.players:
         if player.item is None and available:
-            idx, item = available.pop(0)
-            player.item = item
-            await broadcast_to_room(room, {
-                "type": "item_grabbed",
-                "player": player.name,
-                "item_index": idx,
-                "item_name": item["name"],
-                "tier": item["tier"],
-                "comment": item.get("pickup_comment", "...")
-            })
+            idx, _ = available.pop(0)
+            item = room.claim_item(player, idx)
+            await broadcast_to_room(room, item_grabbed_message(player.name, idx, item))
     
-    await asyncio.sleep(2)
+    await room.clock.sleep(2)
 
 
 async def bot_grab_item(room: GameRoom, bot: BotPlayer):
     """Bot 抢夺物品"""
+    tracing.set_track(f"bot:{bot.name}")
     available = room.get_available_items()
     if not available:
         return
     
     available_indices = [idx for idx, _ in available]
-    chosen_idx = await bot.grab_item(available_indices)
+    with tracing.span("think", "bot"):
+        chosen_idx = await bot.grab_item(available_indices, room.clock)
     
-    # 再次检查是否还可用
-    available = room.get_available_items()
-    available_indices = [idx for idx, _ in available]
+    # 再次检查是否还可用，选的被抢了就换一个
+    if not room.is_item_available(chosen_idx):
+        available = room.get_available_items()
+        if not available:
+            return
+        chosen_idx = available[0][0]
     
-    if chosen_idx in available_indices:
-        item = room.items[chosen_idx]
-        bot.item = item
-        await broadcast_to_room(room, {
-            "type": "item_grabbed",
-            "player": bot.name,
-            "item_index": chosen_idx,
-            "item_name": item["name"],
-            "tier": item["tier"],
-            "comment": item.get("pickup_comment", "...")
-        })
-    elif available_indices:
-        # 选的被抢了，换一个
-        chosen_idx = available_indices[0]
-        item = room.items[chosen_idx]
-        bot.item = item
-        await broadcast_to_room(room, {
-            "type": "item_grabbed",
-            "player": bot.name,
-            "item_index": chosen_idx,
-            "item_name": item["name"],
-            "tier": item["tier"],
-            "comment": item.get("pickup_comment", "...")
-        })
+    item = room.claim_item(bot, chosen_idx)
+    if item:
+        await broadcast_to_room(room, item_grabbed_message(bot.name, chosen_idx, item))
 
 
 async def run_judgment_phase(room: GameRoom):
     """判定生还阶段"""
     await broadcast_to_room(room, {"type": "phase_change", "phase": "judgment"})
-    await asyncio.sleep(1)
+    await room.clock.sleep(1)
     
     crisis_name = room.crisis_data.get("name", "危机") if room.crisis_data else "危机"
     
@@ -292,16 +623,34 @@ async def run_judgment_phase(room: GameRoom):
     for p in room.players:
         players_data.append({
             "name": p.name,
-            "item": p.item or {"name": "空手", "tier": "trash"}
+            "item": p.item.to_dict() if p.item else {"name": "空手", "tier": "trash"}
         })
     
     # 判断是否强制死亡
     force_death = room.consecutive_safe_rounds >= 2
     
-    await broadcast_to_room(room, {"type": "judging"})
+    await broadcast_to_room(room, {"type": "judging", "force_death": force_death})
+    room.llm_calls_issued += 1
     results = await judge_batch_survival(crisis_name, players_data, force_death=force_death)
     room.judgment_results = results
     
+    # 所有人的配图立即开始生成；某人的结果公布之后才推送他的图（不剧透）
+    round_num = room.current_round
+    revealed: set[str] = set()
+    image_urls: dict[str, str] = {}
+    
+    def judgment_image(name: str, url: str):
+        return {"type": "image_ready", "target": "judgment", "round": round_num, "player": name, "url": url}
+    
+    def on_image(name: str, url: str):
+        image_urls[name] = url
+        if name in revealed:
+            push_image(room, judgment_image(name, url))
+    
+    for result in results:
+        name = result.get("name")
+        image_pipeline.request(result.get("image_prompt"), lambda url, name=name: on_image(name, url))
+    
     any_death = False
     
     # 逐个公布结果
@@ -324,15 +673,22 @@ async def run_judgment_phase(room: GameRoom):
         else:
             target_player.alive = False
             any_death = True
+        if not target_player.is_bot:
+            stats_store.record_round(target_player.name, target_player.item.tier if target_player.item else "trash",
+                                     target_player.alive)
         
         await broadcast_to_room(room, {
             "type": "judgment_result",
             "player": target_player.name,
             "survived": result.get("survived", True),
             "story": result.get("story", "命运已定..."),
-            "item": target_player.item.get("name", "") if target_player.item else ""
+            "item": target_player.item.name if target_player.item else "",
+            "tier": target_player.item.tier if target_player.item else "trash"
         })
-        await asyncio.sleep(7)  # 7秒阅读时间
+        revealed.add(target_player.name)
+        if target_player.name in image_urls:
+            push_image(room, judgment_image(target_player.name, image_urls[target_player.name]))
+        await room.clock.sleep(7)  # 7秒阅读时间
     
     # 更新连续安全轮数
     if any_death:
@@ -341,6 +697,80 @@ async def run_judgment_phase(room: GameRoom):
         room.consecutive_safe_rounds += 1
 
 
+# ============================================================
+# 会话恢复
+# ============================================================
+
+def resumable_room(player_id: str) -> Optional[GameRoom]:
+    """断线时玩家所在的、还在进行中的本地房间（只有这种情况值得保留座位）"""
+    room = game_manager.get_player_room(player_id)
+    if room is None or room.phase == GamePhase.GAME_OVER or player_id in room_affinity:
+        return None
+    return room
+
+
+async def expire_session(player: Player, grace: float):
+    """宽限期内没有重连：按正常断线处理"""
+    await asyncio.sleep(grace)
+    if detached.get(player.id) is asyncio.current_task():
+        del detached[player.id]
+        await release_player(player)
+
+
+async def release_player(player: Player):
+    """连接彻底结束：退出匹配、离开房间、作废重连 token"""
+    player_id = player.id
+    local_players.pop(player_id, None)
+    last_seen.pop(player_id, None)
+    token = session_tokens.pop(player_id, None)
+    if token is not None:
+        sessions.pop(token, None)
+    cancel_matching_timeout(player_id)
+    await backend.leave_queue(player_id)
+    owner = room_affinity.pop(player_id, None)
+    if owner is not None:
+        await backend.send_to_worker(owner, {"kind": "disconnect", "player_id": player_id})
+    room = game_manager.get_player_room(player_id)
+    game_manager.leave_room(player_id)
+    cancel_if_abandoned(room)
+
+
+async def resume_session(websocket: WebSocket, token: str, last_seq: int) -> Optional[Player]:
+    """用重连 token 接回原来的玩家；token 无效或已过期时返回 None"""
+    player_id = sessions.get(token)
+    player = local_players.get(player_id) if player_id else None
+    if player is None:
+        RESUMES.inc(outcome="expired")
+        return None
+    
+    grace_task = detached.pop(player_id, None)
+    if grace_task is not None:
+        grace_task.cancel()
+    old = connections.get(player_id)
+    connections[player_id] = websocket
+    last_seen[player_id] = time.monotonic()
+    if old is not None:
+        # 旧连接还没发现自己断了：关掉它（它的清理逻辑看到连接已被替换会跳过）
+        try:
+            await asyncio.wait_for(old.close(code=4000), timeout=1)
+        except Exception:
+            pass
+    
+    room = game_manager.get_player_room(player_id)
+    missed, complete = room.replay_since(last_seq, player_id) if room else ([], True)
+    RESUMES.inc(outcome="resumed")
+    await send_to_player(player_id, {
+        "type": "resumed",
+        "player_id": player_id,
+        "room_id": room.room_id if room else None,
+        "replayed": len(missed),
+        "complete": complete
+    })
+    for message in missed:
+        await send_to_player(player_id, message)
+    return player
+
+
 # ============================================================
 # WebSocket 端点
 # ============================================================
@@ -349,41 +779,133 @@ async def run_judgment_phase(room: GameRoom):
 async def websocket_endpoint(websocket: WebSocket, player_name: str):
     await websocket.accept()
     
-    player_id = str(uuid.uuid4())
-    player = Player(id=player_id, name=player_name)
-    connections[player_id] = websocket
+    token = websocket.query_params.get("resume")
+    player = None
+    if token:
+        try:
+            last_seq = int(websocket.query_params.get("last_seq", "0"))
+        except ValueError:
+            last_seq = 0
+        player = await resume_session(websocket, token, last_seq)
     
-    await websocket.send_json({
-        "type": "connected",
-        "player_id": player_id,
-        "message": f"欢迎, {player_name}!"
-    })
+    if player is None:
+        player = Player(id=str(uuid.uuid4()), name=player_name)
+        token = secrets.token_urlsafe(24)
+        sessions[token] = player.id
+        session_tokens[player.id] = token
+        connections[player.id] = websocket
+        local_players[player.id] = player
+        last_seen[player.id] = time.monotonic()
+        
+        await send_to_player(player.id, {
+            "type": "connected",
+            "player_id": player.id,
+            "session_token": token,
+            "message": f"欢迎, {player_name}!"
+        })
+    player_id = player.id
+    guard = InboundGuard(websocket)
     
     try:
         while True:
             try:
-                data = await websocket.receive_json()
-                await handle_message(player, data)
+                data = await guard.receive()
+                last_seen[player_id] = time.monotonic()
+                if isinstance(data, dict) and data.get("type") == "pong":
+                    continue
+                await route_message(player, data)
             except RuntimeError:
                 break  # WebSocket 连接异常（例如未握手成功就断开）
     except WebSocketDisconnect:
-        # 清理连接
-        if player_id in connections:
+        pass
+    finally:
+        current = connections.get(player_id)
+        if current is websocket:
             del connections[player_id]
-        game_manager.matchmaking.leave(player_id)
-        game_manager.leave_room(player_id)
+            if resumable_room(player_id) is not None:
+                # 保留座位一段时间，等客户端带 token 重连
+                await backend.leave_queue(player_id)
+                detached[player_id] = background_tasks.spawn(
+                    expire_session(player, RESUME_GRACE_PERIOD), name=f"resume_grace:{player_id}")
+            else:
+                await release_player(player)
+        elif current is None and player_id not in detached:
+            # 被心跳清理掉的连接（AI 已接管）
+            await release_player(player)
+        # 否则已被重连替换，什么都不做
+
+
+# ============================================================
+# 观战
+# ============================================================
+
+def spectator_catchup(room: GameRoom) -> list[str]:
+    """新观众先收到的帧：房间快照 + 本轮到目前为止的公开广播"""
+    snapshot = {
+        "type": "spectating",
+        "room_id": room.room_id,
+        "phase": room.phase.value,
+        "current_round": room.current_round,
+        "max_rounds": room.max_rounds,
+        "players": [{"name": p.name, "score": p.score, "is_bot": p.is_bot, "alive": p.alive} for p in room.players],
+        "spectators": spectator_hub.count(room.room_id) + 1
+    }
+    recent = []
+    for _, target, message in room.outbox:
+        if target is not None:
+            continue  # 只发给某个玩家的消息（关键词选项等）观众看不到
+        if message.get("type") == "round_start":
+            recent = []
+        recent.append(message)
+    return [encode_frame(snapshot)] + [encode_frame(m) for m in recent]
+
+
+@app.websocket("/ws/spectate/{room_id}")
+async def spectate_endpoint(websocket: WebSocket, room_id: str):
+    """按房间码观战：只收房间广播，不占座位，不影响玩家的消息投递"""
+    await websocket.accept()
+    room = game_manager.get_room(room_id.upper())
+    if room is None or room.phase == GamePhase.GAME_OVER:
+        await websocket.send_json({"type": "spectate_error", "message": "房间不存在或游戏已结束"})
+        await websocket.close(code=4404)
+        return
+    
+    spectator = spectator_hub.join(room.room_id, websocket, spectator_catchup(room))
+    if spectator is None:
+        await websocket.send_json({"type": "spectate_error", "message": "该房间观战人数已满"})
+        await websocket.close(code=1013)
+        return
+    
+    pump = background_tasks.spawn(spectator.pump(), name=f"spectate:{room.room_id}")
+    guard = InboundGuard(websocket)
+    try:
+        while True:
+            # 观众不该发任何消息：收到即丢弃并记违规，只用来发现断开
+            await guard.receive_frame()
+            await guard.reject("spectator_message")
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        spectator_hub.leave(spectator)
+        if pump is not None:
+            pump.cancel()
 
 
 async def handle_message(player: Player, data: dict):
     """处理客户端消息"""
     msg_type = data.get("type")
     
+    room = game_manager.get_player_room(player.id)
+    if room:
+        room.touch()
+    
     if msg_type == "start_matching":
         await handle_start_matching(player)
     
     elif msg_type == "cancel_matching":
-        game_manager.matchmaking.leave(player.id)
-        await send_to_player(player.id, {"type": "matching_cancelled"})
+        cancel_matching_timeout(player.id)
+        await backend.leave_queue(player.id)
+        await deliver(player, {"type": "matching_cancelled"})
     
     elif msg_type == "keyword_choice":
         await handle_keyword_choice(player, data.get("choice"))
@@ -425,6 +947,17 @@ async def handle_player_exit(player: Player):
             bot.alive = p.alive
             room.players[i] = bot
             
+            if p.worker_id is not None:
+                await backend.send_to_worker(p.worker_id, {"kind": "unbind", "player_id": p.id})
+            
+            # 阶段进行到一半时接管：补上玩家还没做的操作，不让本阶段等到超时
+            if room.phase == GamePhase.CRISIS_SETUP and bot.keyword_choice is None and p.id in room.keyword_options:
+                options = room.keyword_options[p.id]
+                room.keyword_options[bot.id] = options
+                room.tasks.spawn(bot_choose_keyword(room, bot, options), name=f"bot_keyword:{bot.id}")
+            elif room.phase == GamePhase.SCAVENGE and bot.item is None and room.items:
+                room.tasks.spawn(bot_grab_item(room, bot), name=f"bot_grab:{bot.id}")
+            
             await broadcast_to_room(room, {
                 "type": "player_left",
                 "player": player.name,
@@ -435,49 +968,79 @@ async def handle_player_exit(player: Player):
     # 清理连接
     if player.id in connections:
         del connections[player.id]
+    cancel_if_abandoned(room)
 
 
 async def handle_start_matching(player: Player):
     """处理开始匹配"""
-    game_manager.matchmaking.join(player)
+    await backend.join_queue(player)
     
-    await send_to_player(player.id, {
+    await deliver(player, {
         "type": "matching_started",
-        "queue_size": game_manager.matchmaking.get_queue_size()
+        "queue_size": await backend.queue_size()
     })
     
     # 尝试匹配（线程安全）
-    matched = await game_manager.matchmaking.try_match_safe()
+    matched = await backend.try_match()
     
     if matched:
         # 匹配成功
         await start_game_with_players(matched)
-    else:
-        # 启动超时任务
-        asyncio.create_task(matching_timeout(player))
+    elif player.id not in matching_timeouts:
+        # 启动超时任务（每个玩家最多一个，重复的 start_matching 不再新建）
+        task = background_tasks.spawn(matching_timeout(player), name=f"matching_timeout:{player.id}")
+        if task is not None:
+            matching_timeouts[player.id] = task
+
+
+def cancel_matching_timeout(player_id: str):
+    task = matching_timeouts.pop(player_id, None)
+    if task is not None:
+        task.cancel()
 
 
 async def matching_timeout(player: Player):
     """匹配超时处理"""
-    await asyncio.sleep(30)  # 30 秒超时
+    try:
+        await asyncio.sleep(30)  # 30 秒超时
+    finally:
+        if matching_timeouts.get(player.id) is asyncio.current_task():
+            del matching_timeouts[player.id]
     
     # 使用线程安全方法创建匹配
-    all_players = await game_manager.matchmaking.safe_create_match_with_bots(player)
+    all_players = await backend.match_with_bots(player)
     if all_players:
         await start_game_with_players(all_players)
 
 
 async def start_game_with_players(players: list[Player]):
     """创建房间并开始游戏"""
-    room = game_manager.create_room()
+    room = await game_manager.open_room()
+    if room is None:
+        # 房间数已达上限
+        for p in players:
+            if not p.is_bot:
+                await deliver(p, {
+                    "type": "server_busy",
+                    "message": "服务器房间已满，请稍后再试"
+                })
+        return
     
     for p in players:
+        cancel_matching_timeout(p.id)
         game_manager.join_room(room, p)
+        if p.worker_id is not None:
+            # 之后该玩家的操作由他所在的 worker 转发到这里
+            await backend.send_to_worker(p.worker_id, {
+                "kind": "bind",
+                "player_id": p.id,
+                "owner": backend.worker_id
+            })
     
     # 通知所有真人玩家
     for p in players:
         if not p.is_bot:
-            await send_to_player(p.id, {
+            await send_in_room(room, p, {
                 "type": "game_starting",
                 "room_id": room.room_id,
                 "players": [{"name": pl.name, "is_bot": pl.is_bot} for pl in players]
@@ -486,7 +1049,7 @@ async def start_game_with_players(players: list[Player]):
     await asyncio.sleep(2)
     
     # 启动游戏循环
-    asyncio.create_task(run_game_loop(room))
+    room.tasks.spawn(run_game_loop(room), name="game_loop")
 
 
 async def handle_keyword_choice(player: Player, choice: str):
@@ -500,10 +1063,11 @@ async def handle_keyword_choice(player: Player, choice: str):
         room_player.keyword_choice = choice
         room.collected_keywords.append(choice)
         
-        await broadcast_to_room(room, {
-            "type": "keyword_submitted",
-            "player": player.name
-        })
+        with tracing.span("keyword_choice", "player", trace=room.trace, track=f"player:{player.name}"):
+            await broadcast_to_room(room, {
+                "type": "keyword_submitted",
+                "player": player.name
+            })
 
 
 async def handle_grab_item(player: Player, item_index: int):
@@ -516,37 +1080,141 @@ async def handle_grab_item(player: Player, item_index: int):
     if not room_player:
         return
     
-    # 使用线程安全的抢夺方法
-    item = await room.try_grab_item(room_player, item_index)
-    
-    if item:
-        await broadcast_to_room(room, {
-            "type": "item_grabbed",
-            "player": player.name,
-            "item_index": item_index,
-            "item_name": item["name"],
-            "tier": item["tier"],
-            "comment": item.get("pickup_comment", "...")
-        })
-    else:
-        await send_to_player(player.id, {
-            "type": "grab_failed",
-            "message": "手慢了！这个物品已被抢走"
-        })
+    with tracing.span("grab_item", "player", trace=room.trace, track=f"player:{player.name}") as span:
+        # 使用线程安全的抢夺方法
+        item = await room.try_grab_item(room_player, item_index)
+        span["success"] = item is not None
+        
+        if item:
+            await broadcast_to_room(room, item_grabbed_message(player.name, item_index, item))
+        else:
+            await send_in_room(room, room_player, {
+                "type": "grab_failed",
+                "message": "手慢了！这个物品已被抢走"
+            })
 
 
 # ============================================================
 # 静态文件服务
 # ============================================================
 
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+@app.api_route("/static/{name}", methods=["GET", "HEAD"])
+async def static_file(name: str, request: Request):
+    """带指纹的文件名永久缓存；原文件名（旧页面的引用）每次用 ETag 验证"""
+    found = static_assets.lookup(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    asset, immutable = found
+    return static_assets.respond(request, asset, immutable)
+
+
+@app.get("/api/stats")
+async def stats():
+    """房间生命周期 + 弃局统计"""
+    return {
+        **game_manager.reaper.get_stats(),
+        "abandoned": dict(abandon_stats),
+        "event_loop": watchdog.get_stats(),
+        "spectators": spectator_hub.get_stats(),
+        "event_log": event_log.get_stats(),
+        "player_stats": stats_store.get_stats(),
+        "static_assets": static_assets.get_stats(),
+        "images": image_pipeline.get_stats(),
+        "tasks": {
+            "background": background_tasks.get_stats(),
+            "supervised_total": supervised_task_count(),
+        },
+    }
+
+
+@app.get("/api/traces")
+async def list_traces():
+    """进行中和最近结束的、被抽样记录的对局"""
+    live = [room.trace for room in game_manager.rooms.values() if room.trace is not None]
+    traces = {t.trace_id: t for t in list(tracing.recent_traces.values()) + live}
+    return [
+        {"room_id": t.trace_id, "started_at": t.started_at, "events": len(t.events),
+         "live": t.trace_id in game_manager.rooms}
+        for t in sorted(traces.values(), key=lambda t: t.started_at, reverse=True)
+    ]
+
+
+@app.get("/api/traces/{room_id}")
+async def get_trace(room_id: str):
+    """单局时间线（Chrome trace JSON，可直接导入 Perfetto）"""
+    room = game_manager.rooms.get(room_id)
+    trace = room.trace if room and room.trace else tracing.recent_traces.get(room_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this room")
+    return JSONResponse(trace.to_chrome(), headers={
+        "Content-Disposition": f'attachment; filename="trace-{room_id}.json"'
+    })
+
+
+@app.get("/api/events/{room_id}")
+async def get_room_events(room_id: str, since: Optional[float] = None):
+    """某个房间码的事件日志（NDJSON，按写入顺序；房间码复用时包含多局，seq 从 1 开始为新的一局）"""
+    if event_log.directory is None:
+        raise HTTPException(status_code=404, detail="Event log is disabled")
+    
+    def lines():
+        for record in read_events(event_log.directory, room_id.upper(), since):
+            yield encode_frame(record) + "\n"
+    
+    # 同步生成器由 Starlette 放到线程池里迭代，读盘 / 解压不占用事件循环
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/images/{name}")
+async def get_image(name: str):
+    """配图缓存里的文件（文件名是 prompt 的哈希，内容不会变）"""
+    path = image_pipeline.path_of(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, media_type=MEDIA_TYPES[path.suffix.lstrip(".")],
+                        headers={"Cache-Control": IMMUTABLE})
+
+
+@app.get("/api/leaderboard")
+async def leaderboard(by: str = "wins", limit: int = 20):
+    """排行榜（by=wins / survival），来自定期刷新的缓存；tiers 为各物品等级的整体生还率"""
+    if by not in ("wins", "survival"):
+        raise HTTPException(status_code=400, detail="by must be 'wins' or 'survival'")
+    board = stats_store.leaderboard
+    return {
+        "by": by,
+        "updated_at": board["updated_at"],
+        "players": board["players"],
+        "top": board[by][:max(1, min(limit, stats_store.top_n))],
+        "tiers": board["tiers"],
+    }
+
+
+@app.get("/api/players/{name}/stats")
+async def player_stats(name: str):
+    """单个玩家的战绩（按昵称累计，最近几秒内结束的对局可能还没写入）"""
+    stats = await stats_store.player_stats(name)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No stats for this player")
+    return stats
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标"""
+    QUEUE_DEPTH.set(await backend.queue_size())
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 
-@app.get("/")
-async def root():
-    return HTMLResponse(content=(STATIC_DIR / "index.html").read_text(encoding="utf-8"))
+@app.api_route("/", methods=["GET", "HEAD"])
+async def root(request: Request):
+    # 首页本身不能长期缓存（它决定了引用哪个指纹），但未变化时只回 304
+    if static_assets.index is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return static_assets.respond(request, static_assets.index, immutable=False)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # 协议层的硬上限（不整帧读进内存）；略大于 WS_MAX_FRAME_BYTES，稍微超限的帧由 inbound_guard 计数后断开
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_max_size=WS_MAX_FRAME_BYTES * 2)
@@ -13,7 +13,6 @@ from ai_module import (
     generate_keyword_options
 )
 import asyncio
-import time
 import random
 import sys
 
@@ -90,11 +89,26 @@ def print_scores(players):
     print()
 
 
-async def get_player_keyword_choice(player_name):
+async def ainput(prompt=""):
+    """
+    不阻塞事件循环的 input()：在线程里等键盘输入，期间后台的 AI 预取照常进行。
+    输入流结束（管道 / Ctrl-D）时返回空字符串，按默认选项继续。
+    """
+    try:
+        return await asyncio.to_thread(input, prompt)
+    except EOFError:
+        return ""
+
+
+def prefetch_keyword_options(num_players):
+    """后台并发为每位玩家生成关键词选项，返回一个 Task（结果为每人一组选项）"""
+    return asyncio.ensure_future(asyncio.gather(
+        *(generate_keyword_options(NUM_CRISIS_OPTIONS) for _ in range(num_players))
+    ))
+
+
+async def get_player_keyword_choice(player_name, options):
     """让玩家从 AI 提供的选项中选择一个关键词。"""
-    print(f"\n{Colors.YELLOW}[⏳ AI 正在为 {player_name} 生成灵感...]{Colors.ENDC}")
-    options = await generate_keyword_options(NUM_CRISIS_OPTIONS)
-    
     print(f"{Colors.CYAN}{player_name}，请选择一个贡献给危机的元素（越离谱越好）：{Colors.ENDC}")
     for i, opt in enumerate(options, 1):
         print(f"  {Colors.BOLD}{i}. {Colors.RED}{opt}{Colors.ENDC}")
@@ -102,13 +116,13 @@ async def get_player_keyword_choice(player_name):
     
     while True:
         try:
-            choice = input("> ").strip()
+            choice = (await ainput("> ")).strip()
             if not choice:
                 return options[0]
             
             idx = int(choice)
             if idx == 0:
-                custom = input(f"{Colors.CYAN}请输入自定义关键词: {Colors.ENDC}").strip()
+                custom = (await ainput(f"{Colors.CYAN}请输入自定义关键词: {Colors.ENDC}")).strip()
                 return custom if custom else options[0]
             elif 1 <= idx <= len(options):
                 return options[idx - 1]
@@ -118,7 +132,7 @@ async def get_player_keyword_choice(player_name):
             print(f"{Colors.RED}请输入数字{Colors.ENDC}")
 
 
-def scavenge_phase(players, items):
+async def scavenge_phase(players, items):
     """
     抢夺阶段 - CLI 模拟版本
     随机决定抢夺顺序，每人依次快速选择
@@ -150,7 +164,7 @@ def scavenge_phase(players, items):
         
         while True:
             try:
-                choice = input("> ").strip()
+                choice = (await ainput("> ")).strip()
                 if not choice:
                     # 默认选第一个可用的
                     if available:
@@ -177,7 +191,7 @@ def scavenge_phase(players, items):
         comment = player["item"].get("pickup_comment", "有趣的发现。")
         print(f"{Colors.YELLOW}   💬 AI吐槽: \"{comment}\"{Colors.ENDC}\n")
         
-        time.sleep(SCAVENGE_DELAY)
+        await asyncio.sleep(SCAVENGE_DELAY)
     
     return players
 
@@ -220,7 +234,7 @@ async def judgment_phase(players, crisis, safe_rounds_count):
             any_death = True
         
         print_result(result["survived"], player["name"])
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
         
     return any_death
 
@@ -254,8 +268,12 @@ async def main():
     print("  3. AI 判定每位玩家能否用物品逃过危机")
     print(f"  4. 生还得 {POINTS_SURVIVE} 分，死亡得 {POINTS_DEATH} 分")
     print("  5. 每轮最多死 1 人，若连续 2 轮无人死亡，第三轮将强制提升难度")
+    
+    # 玩家阅读规则时就开始为第一轮生成关键词选项
+    keyword_options = prefetch_keyword_options(NUM_PLAYERS)
+    
     print(f"\n{Colors.BOLD}准备好了吗？按 Enter 开始游戏...{Colors.ENDC}")
-    input()
+    await ainput()
     
     # 初始化玩家
     players = [
@@ -278,9 +296,15 @@ async def main():
         print_header("⚠️ 危机设定阶段")
         print(f"{Colors.YELLOW}每位玩家请从 AI 提供的选项中选择一个关键元素，共同组合成本轮危机！{Colors.ENDC}\n")
         
+        if not keyword_options.done():
+            print(f"{Colors.YELLOW}[⏳ AI 正在为大家生成灵感...]{Colors.ENDC}")
+        all_options = await keyword_options
+        # 本轮选项已到手：下一轮的选项在本轮游戏进行时后台生成
+        keyword_options = prefetch_keyword_options(NUM_PLAYERS) if round_num < NUM_ROUNDS - 1 else None
+        
         round_keywords = []
-        for p in players:
-            kw = await get_player_keyword_choice(p["name"])
+        for p, options in zip(players, all_options):
+            kw = await get_player_keyword_choice(p["name"], options)
             round_keywords.append(kw)
         
         print(f"\n{Colors.CYAN}收集到的关键词: {', '.join(round_keywords)}{Colors.ENDC}\n")
@@ -291,19 +315,23 @@ async def main():
         crisis_data = await generate_collaborative_crisis(round_keywords)
         crisis_word = crisis_data["name"]
         
+        # 物品只依赖危机名：玩家读危机描述的同时就开始生成
+        items_task = asyncio.ensure_future(generate_scavenge_items(crisis_word, NUM_SCAVENGE_ITEMS))
+        
         print(f"\n{Colors.RED}{Colors.BOLD}☠️ 本轮危机: 【{crisis_word}】{Colors.ENDC}")
         print_crisis(crisis_data["scenario"])
         
-        time.sleep(1)
+        await asyncio.sleep(1)
         
         # ========== Phase 2: 抢夺物资 ==========
-        print(f"{Colors.YELLOW}[⏳ AI 正在生成物品...]{Colors.ENDC}")
-        items = await generate_scavenge_items(crisis_word, NUM_SCAVENGE_ITEMS)
+        if not items_task.done():
+            print(f"{Colors.YELLOW}[⏳ AI 正在生成物品...]{Colors.ENDC}")
+        items = await items_task
         
         # 打乱物品顺序，增加随机性
         random.shuffle(items)
         
-        scavenge_phase(players, items)
+        await scavenge_phase(players, items)
         
         # ========== Phase 3: 判定生还 ==========
         any_death = await judgment_phase(players, crisis_word, consecutive_safe_rounds)
@@ -320,7 +348,7 @@ async def main():
         
         if round_num < NUM_ROUNDS - 1:
             print(f"{Colors.CYAN}按 Enter 进入下一轮...{Colors.ENDC}")
-            input()
+            await ainput()
     
     # --- 游戏结束 ---
     show_final_scores(players)
@@ -0,0 +1,137 @@
+# Crisis Survival - Spectators
+# 按房间码观战：每条房间广播只编码一次，同一份文本帧分发给房间里的所有观众
+#
+# 玩家投递路径上的开销只有一次 put_nowait / 观众，从不 await 观众的 socket；
+# 每个观众有自己的有界队列和发送协程，跟不上的观众直接断开，不会拖慢玩家或其他观众。
+
+import asyncio
+import json
+from typing import Optional
+
+import metrics
+from config import MAX_SPECTATORS_PER_ROOM, SPECTATOR_QUEUE_SIZE
+
+
+def encode_frame(message: dict) -> str:
+    """下行消息的 JSON 文本（玩家和观众共用同一种编码）"""
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+class Spectator:
+    """一个观战连接：有界帧队列 + 单独的发送协程"""
+
+    __slots__ = ("websocket", "room_id", "queue", "lagging")
+
+    def __init__(self, websocket, room_id: str, queue_size: int):
+        self.websocket = websocket
+        self.room_id = room_id
+        # None 是结束标记
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=queue_size)
+        self.lagging = False
+
+    def offer(self, frame: Optional[str], force: bool = False) -> bool:
+        """
+        不等待地放入一帧；队列已满说明观众跟不上，返回 False。
+        force：必须送到的帧（最终结果、结束标记），队列满时挤掉最旧的一帧腾位置。
+        """
+        if force and self.queue.full():
+            self.queue.get_nowait()
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.lagging = True
+            return False
+
+    def close(self):
+        """房间结束：发完已排队的帧后关闭连接"""
+        self.offer(None, force=True)
+
+    async def pump(self):
+        """把队列里的帧依次写到 socket；收到结束标记、掉队或发送失败时关闭连接"""
+        try:
+            while True:
+                frame = await self.queue.get()
+                if frame is None or self.lagging:
+                    break
+                await self.websocket.send_text(frame)
+        except Exception:
+            return  # 对端已经断开
+        try:
+            await asyncio.wait_for(self.websocket.close(code=1013 if self.lagging else 1000), timeout=1)
+        except Exception:
+            pass
+
+
+class SpectatorHub:
+    """room_id -> 观众集合"""
+
+    def __init__(self, max_per_room: int = MAX_SPECTATORS_PER_ROOM, queue_size: int = SPECTATOR_QUEUE_SIZE):
+        self.max_per_room = max_per_room
+        self.queue_size = queue_size
+        self.rooms: dict[str, set[Spectator]] = {}
+        self.dropped = 0
+
+    def count(self, room_id: str) -> int:
+        return len(self.rooms.get(room_id, ()))
+
+    def total(self) -> int:
+        return sum(len(s) for s in self.rooms.values())
+
+    def join(self, room_id: str, websocket, initial_frames: list[str]) -> Optional[Spectator]:
+        """加入观战；initial_frames（快照 + 本轮已发生的事件）先于之后的广播入队。房间满时返回 None"""
+        watchers = self.rooms.setdefault(room_id, set())
+        if len(watchers) >= self.max_per_room:
+            return None
+        spectator = Spectator(websocket, room_id, max(self.queue_size, len(initial_frames) + 1))
+        for frame in initial_frames:
+            spectator.offer(frame)
+        watchers.add(spectator)
+        return spectator
+
+    def leave(self, spectator: Spectator):
+        watchers = self.rooms.get(spectator.room_id)
+        if watchers is None:
+            return
+        watchers.discard(spectator)
+        if not watchers:
+            del self.rooms[spectator.room_id]
+
+    def publish(self, room_id: str, frame: str, final: bool = False) -> int:
+        """
+        把一帧分发给房间里的观众（同步、不等待），返回入队的观众数。
+        final：房间的最后一帧（game_over），队列满的观众也要收到，不会因此被断开。
+        """
+        watchers = self.rooms.get(room_id)
+        if not watchers:
+            return 0
+        slow = [s for s in watchers if not s.offer(frame, force=final)]
+        for s in slow:
+            watchers.discard(s)
+        if slow:
+            self.dropped += len(slow)
+            SPECTATORS_DROPPED.inc(len(slow))
+        queued = len(watchers)
+        SPECTATOR_FRAMES.inc(queued)
+        return queued
+
+    def close_room(self, room_id: str):
+        """房间结束或被回收：让该房间所有观众发完剩余帧后断开"""
+        for spectator in self.rooms.pop(room_id, ()):
+            spectator.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "spectators": self.total(),
+            "rooms_watched": len(self.rooms),
+            "dropped_slow": self.dropped,
+        }
+
+
+# 全局单例
+spectator_hub = SpectatorHub()
+
+SPECTATORS = metrics.gauge("crisis_spectators", "Connected spectators on this worker", collect=spectator_hub.total)
+SPECTATOR_FRAMES = metrics.counter("crisis_spectator_frames_total", "Frames queued to spectators")
+SPECTATORS_DROPPED = metrics.counter(
+    "crisis_spectators_dropped_total", "Spectators disconnected because their queue overflowed")
@@ -0,0 +1,450 @@
+# Crisis Survival Web - Shared State Backend
+# 多 worker 共享状态：匹配队列 + 房间码占用 + 跨 worker 消息
+#
+# 房间只在创建它的 worker（owner）上运行游戏循环（房间亲和）。
+# 玩家的 WebSocket 可能连在任意 worker 上：
+#   - owner 发给玩家的消息 -> 发布到玩家所在 worker 的频道（deliver）
+#   - 玩家的操作 -> 由连接所在 worker 转发到 owner 的频道（inbound）
+#
+# 每个 worker 只订阅自己的频道 worker:{worker_id}，消息体为 JSON 信封：
+#   {"kind": "deliver" | "inbound" | "bind" | "unbind" | "disconnect", ...}
+
+import asyncio
+import json
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+from game_manager import GameManager, Player, BotPlayer
+from task_supervisor import TaskSupervisor
+
+EnvelopeHandler = Callable[[dict], Awaitable[None]]
+
+
+class StateBackend(ABC):
+    """共享状态后端接口"""
+
+    worker_id: str = "local"
+
+    async def start(self, handler: EnvelopeHandler):
+        """开始接收发往本 worker 的信封"""
+
+    async def stop(self):
+        """停止后台任务、关闭连接"""
+
+    # ---------- 匹配队列 ----------
+
+    @abstractmethod
+    async def join_queue(self, player: Player) -> bool:
+        ...
+
+    @abstractmethod
+    async def leave_queue(self, player_id: str):
+        ...
+
+    @abstractmethod
+    async def queue_size(self) -> int:
+        ...
+
+    @abstractmethod
+    async def try_match(self) -> Optional[list[Player]]:
+        """队列人数足够时取出一组玩家"""
+
+    @abstractmethod
+    async def match_with_bots(self, player: Player) -> Optional[list[Player]]:
+        """匹配超时：带上队列里的其他真人，用 Bot 补位；玩家已被匹配走时返回 None"""
+
+    # ---------- 房间 ----------
+
+    @abstractmethod
+    async def claim_room_id(self, room_id: str) -> bool:
+        """在所有 worker 范围内占用房间码"""
+
+    @abstractmethod
+    def release_room_id(self, room_id: str):
+        """释放房间码（不等待结果）"""
+
+    # ---------- 跨 worker 消息 ----------
+
+    @abstractmethod
+    async def send_to_worker(self, worker_id: str, envelope: dict):
+        ...
+
+
+class InProcessBackend(StateBackend):
+    """单进程后端：直接使用 GameManager 里的匹配队列，没有跨 worker 消息"""
+
+    def __init__(self, manager: GameManager):
+        self.matchmaking = manager.matchmaking
+
+    async def join_queue(self, player: Player) -> bool:
+        return self.matchmaking.join(player)
+
+    async def leave_queue(self, player_id: str):
+        self.matchmaking.leave(player_id)
+
+    async def queue_size(self) -> int:
+        return self.matchmaking.get_queue_size()
+
+    async def try_match(self) -> Optional[list[Player]]:
+        return await self.matchmaking.try_match_safe()
+
+    async def match_with_bots(self, player: Player) -> Optional[list[Player]]:
+        return await self.matchmaking.safe_create_match_with_bots(player)
+
+    async def claim_room_id(self, room_id: str) -> bool:
+        return True  # GameManager._generate_room_id 已保证本进程内唯一
+
+    def release_room_id(self, room_id: str):
+        pass
+
+    async def send_to_worker(self, worker_id: str, envelope: dict):
+        pass  # 只有一个 worker，不会有远端
+
+
+# ============================================================
+# Redis 协议（RESP2）客户端
+# ============================================================
+
+class RespError(Exception):
+    """服务端返回的 -ERR 回复"""
+
+
+# 断线重连的退避（秒）：从最小值开始每次翻倍，直到最大值
+RECONNECT_MIN_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5.0
+
+
+def encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body.decode("utf-8")
+    if prefix == b"-":
+        return RespError(body.decode("utf-8"))
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        count = int(body)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"bad RESP prefix {prefix!r}")
+
+
+class RespConnection:
+    """
+    单条 RESP 连接，请求按调用顺序立即写出、回复按顺序匹配。
+
+    send() 同步写入，所以同一连接上先调用的命令一定先执行，
+    不等待结果的命令（如 DEL / PUBLISH）也能保证顺序。
+
+    连接出错后整条连接作废：等待中的命令全部以 ConnectionError 失败，之后的 send() 立即抛错，
+    由 RedisBackend 负责重连。
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._pending: deque[asyncio.Future] = deque()
+        self.closed = False
+        self.lost = asyncio.Event()
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, url: str) -> "RespConnection":
+        parsed = urlparse(url)
+        reader, writer = await asyncio.open_connection(parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        conn = cls(reader, writer)
+        if parsed.password:
+            await conn.execute("AUTH", parsed.password)
+        db = (parsed.path or "/0").lstrip("/") or "0"
+        if db != "0":
+            await conn.execute("SELECT", db)
+        return conn
+
+    def send(self, *args) -> asyncio.Future:
+        if self.closed:
+            raise ConnectionError("redis connection is closed")
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append(fut)
+        self.writer.write(encode_command(*args))
+        return fut
+
+    async def execute(self, *args):
+        return await self.send(*args)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                reply = await read_reply(self.reader)
+                fut = self._pending.popleft()
+                if fut.done():
+                    continue
+                if isinstance(reply, RespError):
+                    fut.set_exception(reply)
+                else:
+                    fut.set_result(reply)
+        except Exception as e:  # 断线、协议错乱：回复和请求已经对不上，这条连接不能再用
+            self._fail(e)
+
+    def _fail(self, error: Exception):
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.close()
+        while self._pending:
+            fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(ConnectionError(f"redis connection lost: {error}"))
+        self.lost.set()
+
+    async def close(self):
+        self._reader_task.cancel()
+        self._fail(ConnectionError("closed"))
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class RespSubscriber:
+    """
+    SUBSCRIBE 专用连接，收到消息后交给 handler。
+    断线后按退避重连并重新订阅（断开期间发布的消息会丢失，Redis 的 pub/sub 本身不保留消息）。
+    """
+
+    def __init__(self, url: str, channel: str, handler: Callable[[bytes], Awaitable[None]]):
+        self.url = url
+        self.channel = channel
+        self.handler = handler
+        self.ready = asyncio.Event()
+        self._delay = RECONNECT_MIN_DELAY
+
+    async def run(self):
+        while True:
+            try:
+                await self._subscribe()
+            except Exception as e:
+                print(f"[Warning] Redis subscriber on {self.channel} lost ({type(e).__name__}: {e}); "
+                      f"resubscribing in {self._delay:.1f}s")
+            self.ready.clear()
+            await asyncio.sleep(self._delay)
+            self._delay = min(self._delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _subscribe(self):
+        """连接并订阅，一直读到连接出错为止"""
+        parsed = urlparse(self.url)
+        reader, writer = await asyncio.open_connection(parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        try:
+            if parsed.password:
+                writer.write(encode_command("AUTH", parsed.password))
+                await read_reply(reader)
+            writer.write(encode_command("SUBSCRIBE", self.channel))
+            while True:
+                reply = await read_reply(reader)
+                if not isinstance(reply, list) or len(reply) < 3:
+                    continue
+                kind = reply[0]
+                if kind == b"subscribe":
+                    self.ready.set()
+                    self._delay = RECONNECT_MIN_DELAY
+                elif kind == b"message":
+                    await self.handler(reply[2])
+        finally:
+            writer.close()
+
+
+class RedisBackend(StateBackend):
+    """
+    Redis 协议后端：匹配队列、房间码放在 Redis 里，跨 worker 消息走 PUBLISH/SUBSCRIBE。
+
+    键：
+      mm:queue    匹配队列（list，元素为 JSON {"id", "name", "worker"}）
+      mm:entries  player_id -> 队列元素（hash，用于去重和按 id 移除）
+      mm:lock     匹配锁（SET NX PX）
+      room:{id}   房间码占用（值为 owner worker）
+    """
+
+    QUEUE_KEY = "mm:queue"
+    ENTRIES_KEY = "mm:entries"
+    LOCK_KEY = "mm:lock"
+    LOCK_TTL_MS = 5000
+    # 只删除自己持有的锁：GET + DEL 分两步时，锁可能恰好在中间过期并被别的 worker 拿到
+    RELEASE_LOCK_SCRIPT = "if redis.call('get',KEYS[1])==ARGV[1] then return redis.call('del',KEYS[1]) end return 0"
+
+    def __init__(self, url: str, worker_id: Optional[str] = None, required_players: int = 3):
+        self.url = url
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.required_players = required_players
+        self.conn: Optional[RespConnection] = None
+        self._tasks = TaskSupervisor(owner=f"backend:{self.worker_id}")
+
+    @property
+    def channel(self) -> str:
+        return f"worker:{self.worker_id}"
+
+    async def start(self, handler: EnvelopeHandler):
+        self.conn = await RespConnection.open(self.url)
+
+        async def on_message(data: bytes):
+            try:
+                envelope = json.loads(data)
+            except ValueError:
+                return
+            self._tasks.spawn(handler(envelope), name=f"envelope:{envelope.get('kind')}")
+
+        subscriber = RespSubscriber(self.url, self.channel, on_message)
+        self._tasks.spawn(subscriber.run(), name="subscriber")
+        await asyncio.wait_for(subscriber.ready.wait(), timeout=5)
+        self._tasks.spawn(self._keep_connected(), name="reconnect")
+
+    async def _keep_connected(self):
+        """命令连接断开后按退避重连；断开期间的命令立即抛 ConnectionError，不会一直挂起"""
+        while True:
+            await self.conn.lost.wait()
+            print("[Warning] Redis connection lost; reconnecting")
+            delay = RECONNECT_MIN_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    self.conn = await RespConnection.open(self.url)
+                    break
+                except (OSError, RespError, asyncio.IncompleteReadError) as e:
+                    print(f"[Warning] Redis reconnect failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s")
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def stop(self):
+        await self._tasks.close()
+        if self.conn:
+            await self.conn.close()
+
+    # ---------- 匹配队列 ----------
+
+    def _entry(self, player: Player) -> str:
+        # 从其他 worker 转发来的匹配请求（room_affinity 还没解除）：记下玩家真正连接的 worker
+        worker = player.worker_id or self.worker_id
+        return json.dumps({"id": player.id, "name": player.name, "worker": worker}, ensure_ascii=False)
+
+    def _player_from_entry(self, raw) -> Player:
+        data = json.loads(raw)
+        worker = data.get("worker")
+        return Player(
+            id=data["id"],
+            name=data["name"],
+            worker_id=None if worker == self.worker_id else worker
+        )
+
+    async def _acquire_lock(self) -> str:
+        token = uuid.uuid4().hex
+        while not await self.conn.execute("SET", self.LOCK_KEY, token, "NX", "PX", self.LOCK_TTL_MS):
+            await asyncio.sleep(0.01)
+        return token
+
+    async def _release_lock(self, token: str):
+        await self.conn.execute("EVAL", self.RELEASE_LOCK_SCRIPT, 1, self.LOCK_KEY, token)
+
+    async def join_queue(self, player: Player) -> bool:
+        entry = self._entry(player)
+        if not await self.conn.execute("HSETNX", self.ENTRIES_KEY, player.id, entry):
+            return False
+        await self.conn.execute("RPUSH", self.QUEUE_KEY, entry)
+        return True
+
+    async def leave_queue(self, player_id: str):
+        # 持锁：不能插在 try_match 的 LRANGE 和 LTRIM 之间，否则 LTRIM 会裁掉另一个没被匹配的玩家
+        token = await self._acquire_lock()
+        try:
+            entry = await self.conn.execute("HGET", self.ENTRIES_KEY, player_id)
+            if entry is not None:
+                self.conn.send("LREM", self.QUEUE_KEY, 0, entry)
+                await self.conn.execute("HDEL", self.ENTRIES_KEY, player_id)
+        finally:
+            await self._release_lock(token)
+
+    async def queue_size(self) -> int:
+        return await self.conn.execute("LLEN", self.QUEUE_KEY)
+
+    async def try_match(self) -> Optional[list[Player]]:
+        token = await self._acquire_lock()
+        try:
+            n = self.required_players
+            entries = await self.conn.execute("LRANGE", self.QUEUE_KEY, 0, n - 1)
+            if len(entries) < n:
+                return None
+            self.conn.send("LTRIM", self.QUEUE_KEY, n, -1)
+            players = [self._player_from_entry(e) for e in entries]
+            await self.conn.execute("HDEL", self.ENTRIES_KEY, *[p.id for p in players])
+            return players
+        finally:
+            await self._release_lock(token)
+
+    async def match_with_bots(self, player: Player) -> Optional[list[Player]]:
+        token = await self._acquire_lock()
+        try:
+            own_entry = await self.conn.execute("HGET", self.ENTRIES_KEY, player.id)
+            if own_entry is None:
+                return None  # 已经被其他匹配拿走了
+            entries = await self.conn.execute("LRANGE", self.QUEUE_KEY, 0, -1)
+            queued = [self._player_from_entry(e) for e in entries]
+            entry_of = {q.id: e for e, q in zip(entries, queued)}
+            # 列表里缺了自己的元素（队列曾被并发修改）也照常匹配，并清掉 hash 里的残留记录
+            entry_of.setdefault(player.id, own_entry)
+            others = [p for p in queued if p.id != player.id][:self.required_players - 1]
+            real_players = [player] + others
+
+            for p in real_players:
+                self.conn.send("LREM", self.QUEUE_KEY, 0, entry_of[p.id])
+            await self.conn.execute("HDEL", self.ENTRIES_KEY, *[p.id for p in real_players])
+
+            bots = [BotPlayer() for _ in range(self.required_players - len(real_players))]
+            return real_players + bots
+        finally:
+            await self._release_lock(token)
+
+    # ---------- 房间 ----------
+
+    async def claim_room_id(self, room_id: str) -> bool:
+        return bool(await self.conn.execute("SET", f"room:{room_id}", self.worker_id, "NX"))
+
+    def release_room_id(self, room_id: str):
+        try:
+            self.conn.send("DEL", f"room:{room_id}")
+        except ConnectionError:
+            print(f"[Warning] Redis unavailable; room code {room_id} stays claimed")
+
+    # ---------- 跨 worker 消息 ----------
+
+    async def send_to_worker(self, worker_id: str, envelope: dict):
+        payload = json.dumps(envelope, ensure_ascii=False)
+        await self.conn.execute("PUBLISH", f"worker:{worker_id}", payload)
+
+
+def create_backend(kind: str, manager: GameManager, url: str = "") -> StateBackend:
+    """按配置创建后端：memory（默认，单进程）或 redis"""
+    if kind == "memory":
+        return InProcessBackend(manager)
+    if kind == "redis":
+        return RedisBackend(url, required_players=manager.matchmaking.required_players)
+    raise ValueError(f"Unknown STATE_BACKEND: {kind}")
@@ -11,6 +11,16 @@ class CrisisSurvivalGame {
         this.connectTimeout = null;
         this.intentionalClose = false;
 
+        // 断线重连：服务端下发的 token + 已收到的最大消息序号
+        this.sessionToken = null;
+        this.lastSeq = 0;
+        this.resuming = false;
+        this.reconnectAttempts = 0;
+        this.reconnectTimer = null;
+
+        // 观战中的房间码（为 null 时是普通玩家）
+        this.spectateRoom = null;
+
         this.initElements();
         this.bindEvents();
     }
@@ -27,6 +37,8 @@ class CrisisSurvivalGame {
         this.playerNameInput = document.getElementById('player-name');
         this.soloBtn = document.getElementById('solo-btn');
         this.multiBtn = document.getElementById('multi-btn');
+        this.roomCodeInput = document.getElementById('room-code');
+        this.spectateBtn = document.getElementById('spectate-btn');
 
         // Matching
         this.queueSize = document.getElementById('queue-size');
@@ -53,6 +65,7 @@ class CrisisSurvivalGame {
         this.keywordOptions = document.getElementById('keyword-options');
         this.crisisName = document.getElementById('crisis-name');
         this.crisisScenario = document.getElementById('crisis-scenario');
+        this.crisisImage = document.getElementById('crisis-image');
         this.itemsGrid = document.getElementById('items-grid');
         this.judgmentResults = document.getElementById('judgment-results');
         this.roundScores = document.getElementById('round-scores');
@@ -112,9 +125,19 @@ class CrisisSurvivalGame {
         this.playerNameInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter') this.startSoloGame();
         });
+        this.spectateBtn.addEventListener('click', () => this.startSpectating());
+        this.roomCodeInput.addEventListener('keypress', (e) => {
+            if (e.key === 'Enter') this.startSpectating();
+        });
     }
 
     exitGame() {
+        if (this.spectateRoom) {
+            this.intentionalClose = true;
+            if (this.ws) this.ws.close();
+            this.showScreen('home');
+            return;
+        }
         if (confirm('确定要退出吗？AI 将接管你的角色继续游戏。')) {
             this.send({ type: 'exit_game' });
             if (this.ws) {
@@ -151,7 +174,7 @@ class CrisisSurvivalGame {
     // WebSocket Connection
     // ========================================
 
-    connect() {
+    connect(resume = false) {
         // If user opens static/index.html directly (file://), host will be empty and WS can't work.
         if (!window.location.host) {
             const msg = '请先启动后端，并通过 http://127.0.0.1:8000/ 打开页面（不要直接双击 static/index.html）。';
@@ -169,7 +192,18 @@ class CrisisSurvivalGame {
         }
 
         const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${wsProtocol}//${window.location.host}/ws/${encodeURIComponent(this.playerName)}`;
+        let wsUrl = `${wsProtocol}//${window.location.host}/ws/${encodeURIComponent(this.playerName)}`;
+        if (this.spectateRoom) {
+            wsUrl = `${wsProtocol}//${window.location.host}/ws/spectate/${encodeURIComponent(this.spectateRoom)}`;
+        }
+        this.resuming = resume && !!this.sessionToken;
+        if (this.resuming) {
+            wsUrl += `?resume=${encodeURIComponent(this.sessionToken)}&last_seq=${this.lastSeq}`;
+        } else {
+            this.sessionToken = null;
+            this.lastSeq = 0;
+            this.reconnectAttempts = 0;
+        }
 
         this.ws = new WebSocket(wsUrl);
 
@@ -180,6 +214,9 @@ class CrisisSurvivalGame {
 
         this.ws.onmessage = (event) => {
             const data = JSON.parse(event.data);
+            if (typeof data.seq === 'number') {
+                this.lastSeq = Math.max(this.lastSeq, data.seq);
+            }
             this.handleMessage(data);
         };
 
@@ -190,8 +227,11 @@ class CrisisSurvivalGame {
                 this.intentionalClose = false;
                 return;
             }
+            if (this.scheduleReconnect()) return;
 
-            const msg = '连接断开：请确认后端已启动（python server.py），并刷新页面重试。';
+            const msg = this.spectateRoom
+                ? '观战已结束：房间已关闭或网络中断。'
+                : '连接断开：请确认后端已启动（python server.py），并刷新页面重试。';
             this.setHomeHint(msg);
             alert(msg);
             this.showScreen('home');
@@ -204,6 +244,7 @@ class CrisisSurvivalGame {
                 this.intentionalClose = false;
                 return;
             }
+            if (this.canResume()) return;  // 交给 onclose 重连
 
             const msg = '连接错误：请确认后端已启动（python server.py），并刷新页面重试。';
             this.setHomeHint(msg);
@@ -215,6 +256,10 @@ class CrisisSurvivalGame {
         clearTimeout(this.connectTimeout);
         this.connectTimeout = setTimeout(() => {
             if (!this.ws || this.ws.readyState === WebSocket.OPEN) return;
+            if (this.resuming) {
+                try { this.ws.close(); } catch (_) { }  // onclose 会继续重试
+                return;
+            }
 
             const msg = '连接超时：请确认后端正在运行（python server.py）且端口为 8000。';
             this.setHomeHint(msg);
@@ -225,6 +270,21 @@ class CrisisSurvivalGame {
         }, 5000);
     }
 
+    canResume() {
+        return !!this.sessionToken && this.screens.game.classList.contains('active')
+            && this.reconnectAttempts < 5;
+    }
+
+    scheduleReconnect() {
+        if (!this.canResume()) return false;
+        const delay = Math.min(500 * 2 ** this.reconnectAttempts, 8000);
+        this.reconnectAttempts += 1;
+        this.log(`连接中断，${(delay / 1000).toFixed(1)} 秒后尝试重连...`);
+        clearTimeout(this.reconnectTimer);
+        this.reconnectTimer = setTimeout(() => this.connect(true), delay);
+        return true;
+    }
+
     send(data) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify(data));
@@ -235,8 +295,25 @@ class CrisisSurvivalGame {
         console.log('Received:', data);
 
         switch (data.type) {
+            case 'ping':
+                this.send({ type: 'pong', t: data.t });
+                break;
+
             case 'connected':
+                if (this.resuming) {
+                    // token 已过期，服务端给了一个新身份：原来的对局已经由 AI 接管
+                    this.resuming = false;
+                    this.sessionToken = null;
+                    this.intentionalClose = true;
+                    this.ws.close();
+                    const msg = '重连超时，原对局已由 AI 接管。';
+                    this.setHomeHint(msg);
+                    alert(msg);
+                    this.showScreen('home');
+                    break;
+                }
                 this.playerId = data.player_id;
+                this.sessionToken = data.session_token || null;
                 if (this.isSoloMode) {
                     this.send({ type: 'start_solo' });
                 } else {
@@ -244,6 +321,22 @@ class CrisisSurvivalGame {
                 }
                 break;
 
+            case 'resumed':
+                this.resuming = false;
+                this.reconnectAttempts = 0;
+                this.log(data.complete ? '已重新连接' : '已重新连接（部分消息已丢失）');
+                break;
+
+            case 'spectating':
+                this.onSpectateStart(data);
+                break;
+
+            case 'spectate_error':
+                this.intentionalClose = true;
+                this.setHomeHint(data.message);
+                this.showScreen('home');
+                break;
+
             case 'matching_started':
                 this.queueSize.textContent = data.queue_size;
                 break;
@@ -253,6 +346,12 @@ class CrisisSurvivalGame {
                 clearInterval(this.matchTimer);
                 break;
 
+            case 'server_busy':
+                clearInterval(this.matchTimer);
+                this.setHomeHint(data.message);
+                this.showScreen('home');
+                break;
+
             case 'game_starting':
                 this.onGameStart(data);
                 break;
@@ -300,11 +399,17 @@ class CrisisSurvivalGame {
                 this.showJudgmentResult(data);
                 break;
 
+            case 'image_ready':
+                this.showImage(data);
+                break;
+
             case 'round_end':
                 this.showRoundEnd(data);
                 break;
 
             case 'game_over':
+                this.sessionToken = null;  // 对局已结束，不再重连
+                if (this.spectateRoom) this.intentionalClose = true;  // 观战连接随后由服务端关闭
                 this.showGameOver(data);
                 break;
         }
@@ -316,6 +421,7 @@ class CrisisSurvivalGame {
 
     startSoloGame() {
         this.playerName = this.playerNameInput.value.trim() || '匿名玩家';
+        this.spectateRoom = null;
         this.isSoloMode = true;
         this.resetHomeHint();
         this.showScreen('matching');
@@ -326,6 +432,7 @@ class CrisisSurvivalGame {
 
     startMatching() {
         this.playerName = this.playerNameInput.value.trim() || '匿名玩家';
+        this.spectateRoom = null;
         this.isSoloMode = false;
         this.showScreen('matching');
         this.prepareMatchingScreen();
@@ -374,12 +481,43 @@ class CrisisSurvivalGame {
         });
 
         this.log('游戏开始！');
+        if (data.room_id) {
+            this.log(`房间码 ${data.room_id}，可以分享给朋友观战`);
+        }
+    }
+
+    startSpectating() {
+        const code = this.roomCodeInput.value.trim().toUpperCase();
+        if (!/^[A-Z]{4}$/.test(code)) {
+            this.setHomeHint('请输入 4 位字母的房间码');
+            return;
+        }
+        this.playerName = '';
+        this.spectateRoom = code;
+        this.isSoloMode = false;
+        this.resetHomeHint();
+        this.connect();
+    }
+
+    onSpectateStart(data) {
+        this.onGameStart({ players: data.players });
+        data.players.forEach(p => {
+            const chip = this.playersBar.querySelector(`[data-name="${CSS.escape(p.name)}"] .score`);
+            if (chip) chip.textContent = `${p.score}分`;
+        });
+        this.currentRoundEl.textContent = data.current_round;
+        this.maxRoundsEl.textContent = data.max_rounds;
+        this.setNarrator('👀 观战模式：只能看，不能操作');
+        this.log(`正在观战房间 ${data.room_id}（${data.spectators} 人观战中）`);
     }
 
     onRoundStart(data) {
         this.currentRoundEl.textContent = data.round;
         this.maxRoundsEl.textContent = data.max_rounds;
         this.phaseNameEl.textContent = `第 ${data.round} 轮`;
+        this.round = data.round;
+        this.crisisImage.hidden = true;
+        this.crisisImage.removeAttribute('src');
         this.judgmentResults.innerHTML = '';
         this.keywordOptions.innerHTML = '';  // 清除上一轮的选项
         this.itemsGrid.innerHTML = '';  // 清除上一轮的物品
@@ -507,6 +645,7 @@ class CrisisSurvivalGame {
     showJudgmentResult(data) {
         const card = document.createElement('div');
         card.className = `judgment-card ${data.survived ? 'survived' : 'died'}`;
+        card.dataset.player = data.player;
         card.innerHTML = `
             <div class="player-name">
                 <span class="result-icon">${data.survived ? '✅' : '💀'}</span>
@@ -520,6 +659,25 @@ class CrisisSurvivalGame {
         this.log(`${data.player}: ${data.survived ? '生还！' : '死亡...'}`);
     }
 
+    // 配图在文字之后到达：危机图放到危机展示里，判定图挂到对应玩家的结果卡片上
+    showImage(data) {
+        if (data.round !== this.round) return;  // 上一轮迟到的图
+
+        if (data.target === 'crisis') {
+            this.crisisImage.src = data.url;
+            this.crisisImage.hidden = false;
+            return;
+        }
+
+        const card = this.judgmentResults.querySelector(`[data-player="${CSS.escape(data.player)}"]`);
+        if (!card || card.querySelector('.scene-image')) return;
+        const img = document.createElement('img');
+        img.className = 'scene-image';
+        img.alt = '';
+        img.src = data.url;
+        card.appendChild(img);
+    }
+
     // ========================================
     // Round End & Game Over
     // ========================================
@@ -572,6 +730,7 @@ class CrisisSurvivalGame {
     }
 
     playAgain() {
+        clearTimeout(this.reconnectTimer);
         if (this.ws) {
             this.intentionalClose = true;
             this.ws.close();
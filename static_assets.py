@@ -0,0 +1,171 @@
+# Crisis Survival - Static Assets
+# 前端静态文件在启动时一次性读入内存：按内容算指纹、预先压缩好 gzip / brotli 版本，请求时直接返回内存里的字节
+#
+#   /static/app.3f2a9c1e0b7d.js   带指纹的 URL：内容变了 URL 就变，可以永久缓存（immutable）
+#   /static/app.js                兼容旧地址：每次都要用 ETag 验证（no-cache），未变化时返回 304
+#   /                             index.html，里面引用的静态文件已改写成带指纹的 URL
+#
+# 改了 static/ 下的文件需要重启服务器（或调用 reload()）才会生效。
+
+import gzip
+import hashlib
+import mimetypes
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import metrics
+
+try:
+    import brotli  # 可选：没装时只提供 gzip
+except ImportError:
+    brotli = None
+
+STATIC_REQUESTS = metrics.counter(
+    "crisis_static_requests_total", "Static asset responses by encoding and status", ["encoding", "status"])
+STATIC_BYTES = metrics.counter("crisis_static_bytes_sent_total", "Static asset body bytes sent by encoding", ["encoding"])
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+MIN_COMPRESS_SIZE = 256  # 太小的文件压缩不划算
+TEXT_TYPES = {".html", ".js", ".css", ".json", ".svg", ".txt", ".map"}
+
+
+class Asset:
+    """一个静态文件的全部表示：原始字节 + 各压缩版本，ETag 按表示区分（强 ETag 要求字节完全相同）"""
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, dot, ext = name.rpartition(".")
+        self.hashed_name = f"{stem}.{self.digest}.{ext}" if dot else f"{name}.{self.digest}"
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if Path(name).suffix in TEXT_TYPES:
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        # encoding -> (字节, ETag)；identity 总是有
+        self.variants: dict[str, tuple[bytes, str]] = {"identity": (body, f'"{self.digest}"')}
+        if len(body) >= MIN_COMPRESS_SIZE and Path(name).suffix in TEXT_TYPES:
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = (data, f'"{self.digest}-{encoding}"')
+
+
+@lru_cache(maxsize=256)
+def _parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Accept-Encoding -> {编码: q}（浏览器的取值就那几种，缓存解析结果）"""
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """按 Accept-Encoding 选表示：优先 br，其次 gzip；q=0 表示明确拒绝"""
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 用弱比较（RFC 9110）：忽略 W/ 前缀"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class StaticAssets:
+    """
+    directory: 静态文件目录（不递归，前端只有几个文件）
+    index: 作为首页返回的 HTML，其中 /static/<name> 的引用会改写成带指纹的 URL
+    """
+
+    def __init__(self, directory, index: str = "index.html", url_prefix: str = "/static/"):
+        self.directory = Path(directory)
+        self.index_name = index
+        self.url_prefix = url_prefix
+        self.assets: dict[str, tuple[Asset, bool]] = {}  # URL 里的文件名 -> (asset, 是否带指纹)
+        self.index: Optional[Asset] = None
+        self.reload()
+
+    def reload(self):
+        """重新读取目录、计算指纹并压缩（启动时调用一次）"""
+        assets: dict[str, tuple[Asset, bool]] = {}
+        files = sorted(p for p in self.directory.iterdir() if p.is_file()) if self.directory.is_dir() else []
+        for path in files:
+            if path.name == self.index_name:
+                continue
+            asset = Asset(path.name, path.read_bytes())
+            assets[path.name] = (asset, False)
+            assets[asset.hashed_name] = (asset, True)
+
+        index_path = self.directory / self.index_name
+        index = None
+        if index_path.is_file():
+            html = index_path.read_text(encoding="utf-8")
+            for name, (asset, hashed) in assets.items():
+                if not hashed:
+                    html = html.replace(f'"{self.url_prefix}{name}"', f'"{self.url_prefix}{asset.hashed_name}"')
+            index = Asset(self.index_name, html.encode("utf-8"))
+        self.assets, self.index = assets, index
+
+    def url_for(self, name: str) -> str:
+        asset, _ = self.assets[name]
+        return self.url_prefix + asset.hashed_name
+
+    def lookup(self, name: str) -> Optional[tuple[Asset, bool]]:
+        return self.assets.get(name)
+
+    def respond(self, request: Request, asset: Asset, immutable: bool) -> Response:
+        """
+        选择压缩版本并返回；If-None-Match 命中时返回 304（不带 body）。
+        带指纹的 URL 内容永不改变，可以被浏览器 / CDN 永久缓存；其余 URL 每次都要验证。
+        """
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+        body, etag = asset.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            STATIC_REQUESTS.inc(encoding=encoding, status="304")
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        STATIC_REQUESTS.inc(encoding=encoding, status="200")
+        STATIC_BYTES.inc(len(body), encoding=encoding)
+        return Response(content=body, headers=headers, media_type=asset.content_type)
+
+    def get_stats(self) -> dict:
+        files = {a.name: a for a, hashed in self.assets.values() if hashed}
+        if self.index is not None:
+            files[self.index.name] = self.index
+        return {
+            "brotli": brotli is not None,
+            "files": {
+                name: {encoding: len(body) for encoding, (body, _) in asset.variants.items()}
+                for name, asset in files.items()
+            },
+        }
@@ -0,0 +1,268 @@
+# Crisis Survival - Player Stats & Leaderboard
+# 持久化的玩家战绩（对局数、胜场、得分、按物品等级的生还率），SQLite WAL 模式
+#
+# 写：游戏循环只在内存里累加增量（同一玩家多局合并成一行），后台任务定期在线程里批量 upsert。
+# 读：排行榜是定期从库里刷新的 top-N 缓存，请求直接返回缓存，不碰数据库。
+# 没有账号体系，战绩按昵称累计（重名的玩家会合并）。
+
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+import metrics
+from config import (
+    STATS_DB, STATS_FLUSH_INTERVAL, LEADERBOARD_REFRESH_INTERVAL, LEADERBOARD_SIZE, LEADERBOARD_MIN_ROUNDS
+)
+
+STATS_ROWS_WRITTEN = metrics.counter("crisis_stats_rows_written_total", "Player / tier rows upserted into the stats DB")
+STATS_FLUSH = metrics.histogram(
+    "crisis_stats_flush_seconds", "Time to write one batch of stats (in the writer thread)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    games INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    total_score INTEGER NOT NULL DEFAULT 0,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    survived INTEGER NOT NULL DEFAULT 0,
+    last_played REAL
+);
+CREATE TABLE IF NOT EXISTS player_tiers (
+    name TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    survived INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, tier)
+);
+CREATE INDEX IF NOT EXISTS players_by_wins ON players (wins DESC, games);
+"""
+
+UPSERT_PLAYER = """
+INSERT INTO players (name, games, wins, total_score, rounds, survived, last_played)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    games = games + excluded.games,
+    wins = wins + excluded.wins,
+    total_score = total_score + excluded.total_score,
+    rounds = rounds + excluded.rounds,
+    survived = survived + excluded.survived,
+    last_played = COALESCE(excluded.last_played, last_played)
+"""
+
+UPSERT_TIER = """
+INSERT INTO player_tiers (name, tier, rounds, survived) VALUES (?, ?, ?, ?)
+ON CONFLICT (name, tier) DO UPDATE SET
+    rounds = rounds + excluded.rounds,
+    survived = survived + excluded.survived
+"""
+
+
+def _player_row(row) -> dict:
+    name, games, wins, total_score, rounds, survived, last_played = row
+    return {
+        "name": name,
+        "games": games,
+        "wins": wins,
+        "win_rate": round(wins / games, 3) if games else 0.0,
+        "avg_score": round(total_score / games, 2) if games else 0.0,
+        "rounds": rounds,
+        "survival_rate": round(survived / rounds, 3) if rounds else 0.0,
+        "last_played": last_played,
+    }
+
+
+class StatsStore:
+    """
+    path: SQLite 文件；为空时所有 record_* 什么也不做
+    flush_interval: 增量写库的间隔（秒）
+    refresh_interval: 排行榜缓存的刷新间隔（秒）
+    """
+
+    def __init__(self, path=STATS_DB, flush_interval: float = STATS_FLUSH_INTERVAL,
+                 refresh_interval: float = LEADERBOARD_REFRESH_INTERVAL, top_n: int = LEADERBOARD_SIZE,
+                 min_rounds: int = LEADERBOARD_MIN_ROUNDS):
+        self.path = Path(path) if path else None
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.top_n = top_n
+        self.min_rounds = min_rounds
+        self.running = False
+        # 尚未写库的增量：name -> [games, wins, total_score, rounds, survived]，(name, tier) -> [rounds, survived]
+        self._players: dict[str, list[int]] = {}
+        self._tiers: dict[tuple[str, str], list[int]] = {}
+        self._last_played: dict[str, float] = {}
+        self.games_recorded = 0
+        self.flushes = 0
+        self.leaderboard: dict = {"updated_at": None, "players": 0, "wins": [], "survival": [], "tiers": []}
+        self._lock: Optional[asyncio.Lock] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ---------- 游戏循环侧（只改内存） ----------
+
+    def _delta(self, name: str) -> list[int]:
+        delta = self._players.get(name)
+        if delta is None:
+            delta = self._players[name] = [0, 0, 0, 0, 0]
+        return delta
+
+    def record_round(self, name: str, tier: str, survived: bool):
+        """一名真人玩家一轮的判定结果"""
+        if not self.running:
+            return
+        delta = self._delta(name)
+        delta[3] += 1
+        delta[4] += survived
+        tier_delta = self._tiers.get((name, tier))
+        if tier_delta is None:
+            tier_delta = self._tiers[(name, tier)] = [0, 0]
+        tier_delta[0] += 1
+        tier_delta[1] += survived
+
+    def record_game(self, results: list[tuple[str, int]], winner: Optional[str]):
+        """一局结束：真人玩家的 (昵称, 得分)，winner 为冠军昵称（冠军是 Bot 时为 None）"""
+        if not self.running:
+            return
+        now = time.time()
+        for name, score in results:
+            delta = self._delta(name)
+            delta[0] += 1
+            delta[1] += name == winner
+            delta[2] += score
+            self._last_played[name] = now
+        self.games_recorded += 1
+
+    # ---------- 后台任务 ----------
+
+    async def run(self):
+        """打开数据库，定期写入增量并刷新排行榜缓存；取消时写完剩余增量"""
+        if self.path is None:
+            return
+        self._lock = asyncio.Lock()
+        await self._in_thread(self._open)
+        self.running = True
+        next_refresh = 0.0
+        try:
+            while True:
+                if time.monotonic() >= next_refresh:
+                    await self.refresh()
+                    next_refresh = time.monotonic() + self.refresh_interval
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            self.running = False
+            await self.flush()
+            await self._in_thread(self._close)
+
+    async def _in_thread(self, fn, *args):
+        """在线程里执行数据库操作；同一时间只有一个线程用连接，被取消时也等它执行完"""
+        async with self._lock:
+            work = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            try:
+                return await asyncio.shield(work)
+            except asyncio.CancelledError:
+                await asyncio.wait([work])
+                raise
+
+    async def flush(self):
+        if not self._players and not self._tiers:
+            return
+        players, self._players = self._players, {}
+        tiers, self._tiers = self._tiers, {}
+        last_played, self._last_played = self._last_played, {}
+        start = time.perf_counter()
+        try:
+            rows = await self._in_thread(self._write, players, tiers, last_played)
+        except sqlite3.Error as e:
+            print(f"[Warning] Failed to write player stats: {e}")
+            return
+        STATS_FLUSH.observe(time.perf_counter() - start)
+        STATS_ROWS_WRITTEN.inc(rows)
+        self.flushes += 1
+
+    async def refresh(self):
+        try:
+            self.leaderboard = await self._in_thread(self._query_leaderboard)
+        except sqlite3.Error as e:
+            print(f"[Warning] Failed to refresh leaderboard: {e}")
+
+    async def player_stats(self, name: str) -> Optional[dict]:
+        """单个玩家的战绩（含各物品等级的生还率），直接查库"""
+        if self._conn is None:
+            return None
+        return await self._in_thread(self._query_player, name)
+
+    # ---------- 数据库线程 ----------
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _write(self, players: dict, tiers: dict, last_played: dict) -> int:
+        with self._conn:
+            self._conn.executemany(UPSERT_PLAYER, (
+                (name, *delta, last_played.get(name)) for name, delta in players.items()))
+            self._conn.executemany(UPSERT_TIER, (
+                (name, tier, *delta) for (name, tier), delta in tiers.items()))
+        return len(players) + len(tiers)
+
+    def _query_leaderboard(self) -> dict:
+        conn = self._conn
+        columns = "name, games, wins, total_score, rounds, survived, last_played"
+        wins = conn.execute(
+            f"SELECT {columns} FROM players WHERE games > 0 ORDER BY wins DESC, games ASC LIMIT ?",
+            (self.top_n,)).fetchall()
+        survival = conn.execute(
+            f"SELECT {columns} FROM players WHERE rounds >= ? "
+            f"ORDER BY CAST(survived AS REAL) / rounds DESC, rounds DESC LIMIT ?",
+            (self.min_rounds, self.top_n)).fetchall()
+        tiers = conn.execute(
+            "SELECT tier, SUM(rounds), SUM(survived) FROM player_tiers GROUP BY tier ORDER BY tier").fetchall()
+        total = conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+        return {
+            "updated_at": time.time(),
+            "players": total,
+            "wins": [_player_row(r) for r in wins],
+            "survival": [_player_row(r) for r in survival],
+            "tiers": [{"tier": t, "rounds": n, "survival_rate": round(s / n, 3) if n else 0.0}
+                      for t, n, s in tiers],
+        }
+
+    def _query_player(self, name: str) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT name, games, wins, total_score, rounds, survived, last_played FROM players WHERE name = ?",
+            (name,)).fetchone()
+        if row is None:
+            return None
+        tiers = self._conn.execute(
+            "SELECT tier, rounds, survived FROM player_tiers WHERE name = ? ORDER BY tier", (name,)).fetchall()
+        return {
+            **_player_row(row),
+            "tiers": [{"tier": t, "rounds": n, "survival_rate": round(s / n, 3) if n else 0.0}
+                      for t, n, s in tiers],
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.path is not None,
+            "running": self.running,
+            "games_recorded": self.games_recorded,
+            "pending_players": len(self._players),
+            "flushes": self.flushes,
+            "leaderboard_updated_at": self.leaderboard["updated_at"],
+        }
+
+
+# 全局单例（由 server 的 lifespan 启动后台任务）
+stats_store = StatsStore()
@@ -0,0 +1,89 @@
+# Crisis Survival Web - Task Supervisor
+# 受管的后台任务组：持有引用、捕获异常、统一取消
+
+import asyncio
+import weakref
+from collections import deque
+from typing import Coroutine, Optional
+
+# 所有存活的任务组（用于统计 / 排查泄漏）
+all_supervisors: "weakref.WeakSet[TaskSupervisor]" = weakref.WeakSet()
+
+
+class TaskSupervisor:
+    """
+    一组归属于同一个所有者（房间 / 服务器）的 asyncio 任务。
+
+    - spawn 的任务会被持有引用，不会在执行中途被 GC
+    - 任务异常会被记录下来，而不是静默丢失
+    - cancel_all / close 统一取消，close 之后不再接受新任务
+    """
+
+    def __init__(self, owner: str, max_errors: int = 20):
+        self.owner = owner
+        self.closed = False
+        self.spawned = 0
+        self.failed = 0
+        self.errors: deque[tuple[str, BaseException]] = deque(maxlen=max_errors)
+        self._tasks: set[asyncio.Task] = set()
+        all_supervisors.add(self)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str = "task") -> Optional[asyncio.Task]:
+        """启动一个受管任务；任务组已关闭时丢弃协程并返回 None"""
+        if self.closed:
+            coro.close()
+            return None
+        task = asyncio.create_task(coro, name=f"{self.owner}:{name}")
+        self._tasks.add(task)
+        self.spawned += 1
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            self.failed += 1
+            self.errors.append((task.get_name(), exc))
+            print(f"[Warning] Task {task.get_name()} failed ({type(exc).__name__}): {exc}")
+
+    def tasks(self) -> list[asyncio.Task]:
+        return list(self._tasks)
+
+    def cancel_all(self) -> int:
+        """取消所有未完成的任务，返回取消的数量"""
+        cancelled = 0
+        for task in list(self._tasks):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def shutdown(self) -> int:
+        """关闭任务组：取消全部任务并拒绝新任务"""
+        self.closed = True
+        return self.cancel_all()
+
+    async def close(self):
+        """关闭任务组并等待所有任务真正退出"""
+        self.shutdown()
+        pending = self.tasks()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "active": len(self._tasks),
+            "spawned": self.spawned,
+            "failed": self.failed,
+        }
+
+
+def supervised_task_count() -> int:
+    """所有存活任务组里未完成的任务总数"""
+    return sum(len(s) for s in all_supervisors)
@@ -0,0 +1,155 @@
+# Crisis Survival - Room Tracing
+# 每局游戏的时间线：阶段、LLM 调用（排队 / 请求）、广播、Bot 与玩家操作，导出 Chrome trace JSON
+#
+# 导出的文件可直接拖进 https://ui.perfetto.dev 或 chrome://tracing 查看。
+# 按 TRACE_SAMPLE_RATE 抽样，未抽中的房间 span() 只是一次 ContextVar 读取。
+
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from config import TRACE_SAMPLE_RATE, TRACE_DIR, TRACE_KEEP, TRACE_MAX_EVENTS
+
+
+class Trace:
+    """一局游戏的 span 列表；track 对应时间线上的一行（game / bot:名字 / player:名字）"""
+
+    def __init__(self, trace_id: str, max_events: int = TRACE_MAX_EVENTS):
+        self.trace_id = trace_id
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.events: list[dict] = []
+        self.dropped = 0
+        self._tracks: dict[str, int] = {}
+
+    def _tid(self, track: str) -> int:
+        tid = self._tracks.get(track)
+        if tid is None:
+            tid = self._tracks[track] = len(self._tracks) + 1
+        return tid
+
+    def _us(self, t: float) -> float:
+        return round((t - self.origin) * 1e6, 1)
+
+    def add(self, name: str, cat: str, start: float, end: float, track: str, args: Optional[dict] = None):
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        event = {"name": name, "cat": cat, "ph": "X", "ts": self._us(start),
+                 "dur": round((end - start) * 1e6, 1), "pid": 1, "tid": self._tid(track)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def instant(self, name: str, cat: str, track: str, args: Optional[dict] = None):
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        event = {"name": name, "cat": cat, "ph": "i", "s": "t", "ts": self._us(time.perf_counter()),
+                 "pid": 1, "tid": self._tid(track)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_chrome(self) -> dict:
+        meta = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"room {self.trace_id}"}}]
+        for track, tid in self._tracks.items():
+            meta.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}})
+            meta.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid, "args": {"sort_index": tid}})
+        return {
+            "traceEvents": meta + self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"room_id": self.trace_id, "started_at": self.started_at, "dropped_events": self.dropped},
+        }
+
+
+# 当前协程所属的 trace 和 track；房间任务从 run_game_loop 继承
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_track: ContextVar[str] = ContextVar("current_track", default="game")
+
+# 最近结束的 trace（room_id -> Trace），供 /api/traces 查看
+recent_traces: "OrderedDict[str, Trace]" = OrderedDict()
+
+
+def should_sample(rate: float = TRACE_SAMPLE_RATE) -> bool:
+    return rate > 0 and random.random() < rate
+
+
+def start_trace(trace_id: str, force: bool = False) -> Optional[Trace]:
+    """按抽样率决定是否记录这局；force=True 时总是记录"""
+    if force or should_sample():
+        return Trace(trace_id)
+    return None
+
+
+@contextmanager
+def span(name: str, cat: str = "", trace: Optional[Trace] = None, track: Optional[str] = None, **args):
+    """
+    记录一个 span。没有 trace（未抽样）时什么也不做。
+
+    trace / track 显式给出时，span 内部嵌套的 span 也记到同一处（用于玩家消息处理等不在房间任务里的代码）。
+    yield 出的 dict 可以在 span 结束前补充 args。
+    """
+    if trace is None:
+        trace = current_trace.get()
+    if trace is None:
+        yield args
+        return
+    trace_token = current_trace.set(trace)
+    track_token = current_track.set(track) if track is not None else None
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace.add(name, cat, start, time.perf_counter(), current_track.get(), args)
+        if track_token is not None:
+            current_track.reset(track_token)
+        current_trace.reset(trace_token)
+
+
+def set_track(track: str):
+    """把当前任务之后的 span 都记到 track 这一行（Bot 任务用）"""
+    current_track.set(track)
+
+
+def finish_trace(trace: Optional[Trace]):
+    """一局结束：放进最近列表，配置了 TRACE_DIR 时写文件"""
+    if trace is None:
+        return
+    recent_traces[trace.trace_id] = trace
+    recent_traces.move_to_end(trace.trace_id)
+    while len(recent_traces) > TRACE_KEEP:
+        recent_traces.popitem(last=False)
+    if TRACE_DIR:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _export_quietly(trace, TRACE_DIR)
+        else:
+            loop.run_in_executor(None, _export_quietly, trace, TRACE_DIR)
+
+
+def _export_quietly(trace: Trace, directory):
+    try:
+        export_trace(trace, directory)
+    except OSError as e:
+        print(f"[Warning] Failed to export trace {trace.trace_id}: {e}")
+
+
+def export_trace(trace: Trace, directory) -> Path:
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.started_at))
+    target = path / f"{trace.trace_id}-{stamp}.json"
+    tmp = target.with_suffix(".tmp")
+    tmp.write_text(json.dumps(trace.to_chrome(), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, target)
+    return target